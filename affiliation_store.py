@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+#
+# Which group each radio is affiliated to.
+#
+#	Radio ids are 16 bits, so the store is three fixed arrays indexed by
+#	radio id rather than a dict that grows with every radio ever heard:
+#
+#		group		current group, -1 when not affiliated
+#		count		affiliation changes, as osw_handler has always counted them
+#		last_seen	time of the last affiliation, unaffiliation or grant
+#
+#	Memory is constant (about 1MB) and questions about groups or recent
+#	activity are a single vectorized pass.
+#
+
+import os
+import numpy
+
+
+RADIO_IDS	= 0x10000
+
+
+class affiliation_store:
+
+	def __init__(self):
+		self.group = numpy.empty(RADIO_IDS, numpy.int32)
+		self.group.fill(-1)
+		self.count = numpy.zeros(RADIO_IDS, numpy.uint32)
+		self.last_seen = numpy.zeros(RADIO_IDS, numpy.float64)
+
+
+	def affiliate(self, radio_id, group_id, t):
+		"""
+		Returns True if this is a change of group for radio_id.
+		"""
+		self.last_seen[radio_id] = t
+		g = self.group[radio_id]
+		if g < 0:
+			self.count[radio_id] = 1
+		if g == group_id:
+			return False
+		self.group[radio_id] = group_id
+		self.count[radio_id] += 1
+		return True
+
+
+	def unaffiliate(self, radio_id, t):
+		"""
+		Returns the group radio_id was affiliated to, or None.
+		"""
+		self.last_seen[radio_id] = t
+		g = self.group[radio_id]
+		if g < 0:
+			return None
+		self.group[radio_id] = -1
+		return int(g)
+
+
+	def seen(self, radio_id, t):
+		self.last_seen[radio_id] = t
+
+
+	def group_of(self, radio_id):
+		g = self.group[radio_id]
+		return int(g) if g >= 0 else None
+
+
+	def members(self, group_id):
+		"""
+		Radios currently affiliated to group_id.
+		"""
+		return numpy.flatnonzero(self.group == group_id)
+
+
+	def seen_since(self, t):
+		"""
+		Radios heard from at or after time t.
+		"""
+		return numpy.flatnonzero(self.last_seen >= t)
+
+
+	def affiliated(self):
+		return int(numpy.count_nonzero(self.group >= 0))
+
+
+	def groups(self):
+		"""
+		{group id: number of radios affiliated}
+		"""
+		(g, n) = numpy.unique(self.group[self.group >= 0], return_counts = True)
+		return dict(zip(g.tolist(), n.tolist()))
+
+
+	def snapshot(self, path):
+		"""
+		Save the store; the file is replaced atomically.
+		"""
+		tmp = path + ".tmp"
+		with open(tmp, "wb") as f:
+			numpy.savez(f, group = self.group, count = self.count, last_seen = self.last_seen)
+		os.rename(tmp, path)
+
+
+	def restore(self, path):
+		with open(path, "rb") as f:
+			z = numpy.load(f)
+			self.group[:] = z['group']
+			self.count[:] = z['count']
+			self.last_seen[:] = z['last_seen']
+
+
+# vim:ts=8:nowrap
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+#
+# Talkgroup alpha tags.
+#
+#	The group description csv has one talkgroup per line, the group id (hex)
+#	in column 1 and its alpha tag in column 3.  Only those two columns are
+#	kept, as a dict of group id -> tag.
+#
+#	Tables are shared: every osw_handler in a process that names the same
+#	csv gets the same alias_table.  The parsed table is cached next to the
+#	csv, keyed by the csv's mtime and size, so a restart does not parse it
+#	again.  A thread watches the csv and, when it changes, loads the new
+#	table and swaps it in whole; lookups never wait on a reload.
+#
+
+import os
+import time
+import marshal
+import threading
+
+
+CACHE_VERSION	= 1
+
+_tables = dict()
+_tables_lock = threading.Lock()
+
+
+def shared_alias_table(csv_path):
+	"""
+	The alias_table for csv_path, loading it the first time it is asked for.
+	"""
+	key = os.path.abspath(csv_path)
+	_tables_lock.acquire()
+	try:
+		if key not in _tables:
+			_tables[key] = alias_table(key)
+		return _tables[key]
+	finally:
+		_tables_lock.release()
+
+
+def read_aliases(csv_path):
+	tags = dict()
+	with open(csv_path, "rb") as f:
+		f.readline()			# header
+		for l in f:
+			r = l.rstrip("\r\n").split(',')
+			if len(r) >= 4:
+				tags[int(r[1], 16)] = r[3]
+	return tags
+
+
+def cache_path(csv_path):
+	(d, name) = os.path.split(csv_path)
+	return os.path.join(d, "." + name + ".cache")
+
+
+class alias_table:
+
+	_CHECK_INTERVAL = 5.0
+
+	def __init__(self, csv_path, watch = True):
+		self._csv_path = csv_path
+		self._cache_path = cache_path(csv_path)
+		self.reloads = 0
+
+		(self._stamp, self._tags) = self.load()
+
+		if watch:
+			self._watcher = threading.Thread(target = self.watcher)
+			self._watcher.daemon = True
+			self._watcher.start()
+
+
+	def get(self, gid):
+		return self._tags.get(gid)
+
+
+	def __len__(self):
+		return len(self._tags)
+
+
+	def _csv_stamp(self):
+		s = os.stat(self._csv_path)
+		return (s.st_mtime, s.st_size)
+
+
+	def load(self):
+		"""
+		Return (stamp, tags), from the cache when it matches the csv.
+		"""
+		stamp = self._csv_stamp()
+		try:
+			with open(self._cache_path, "rb") as f:
+				(version, cached_stamp, tags) = marshal.load(f)
+			if version == CACHE_VERSION and tuple(cached_stamp) == stamp:
+				return (stamp, tags)
+		except (IOError, EOFError, ValueError, TypeError):
+			pass
+
+		tags = read_aliases(self._csv_path)
+		tmp = "%s.%d" % (self._cache_path, os.getpid())
+		try:
+			with open(tmp, "wb") as f:
+				marshal.dump((CACHE_VERSION, stamp, tags), f)
+			os.rename(tmp, self._cache_path)
+		except (IOError, OSError):
+			pass			# read-only directory; parse again next time
+		return (stamp, tags)
+
+
+	def watcher(self):
+		while True:
+			time.sleep(self._CHECK_INTERVAL)
+			try:
+				if self._csv_stamp() == self._stamp:
+					continue
+				(stamp, tags) = self.load()
+			except (IOError, OSError, ValueError, IndexError):
+				continue		# being rewritten, or gone for now; keep what we have
+			self._tags = tags
+			self._stamp = stamp
+			self.reloads += 1
+
+
+# vim:ts=8:nowrap
@@ -6,6 +6,11 @@ import os
 from gnuradio import gr, blocks, filter, analog, audio
 from gnuradio.filter import optfir, firdes
 
+from iq_export import iq_export_sink, IQ_EXPORT_EXTENSION
+from segment_recorder import segment_recorder
+from talker_timeline import talker_timeline, TALKER_INDEX_EXTENSION
+from latency import first_sample_probe
+
 
 def create_directory(save_dir, sys_id):
 	try:
@@ -18,15 +23,17 @@ def create_directory(save_dir, sys_id):
 		os.mkdir("%s/%x" % (save_dir, sys_id))
 
 
-def audio_name(group_id, chan):
+def audio_name(group_id, chan, t = None):
 
-	return "%x_%d_%.6f" % (group_id, chan, round(time.time(), 6))
+	if t is None:
+		t = time.time()
+	return "%x_%d_%.6f" % (group_id, chan, round(t, 6))
 
 
 class audio_channel(gr.hier_block2):
 
 
-	def __init__(self, sample_rate, freq_offset, sys_id, chan, group_id, save_dir):
+	def __init__(self, sample_rate, freq_offset, sys_id, chan, group_id, save_dir, is_group = 1, start_time = None, iq_export = None, gated = False, hang_time = 1.0, files = None, first_sample = None):
 
 		gr.hier_block2.__init__(
 			self,
@@ -61,8 +68,8 @@ class audio_channel(gr.hier_block2):
 		channel_taps		= optfir.low_pass(1, sample_rate, self._fm_passband, self._fm_stopband, 0.1, 60)
 		channel_filter		= filter.freq_xlating_fir_filter_ccf(channel_decimation, optfir.low_pass(1, sample_rate, self._fm_passband, self._fm_stopband, 0.1, 60), freq_offset, sample_rate)
 
-		# power squelch
-		squelch			= analog.pwr_squelch_cc(-50, alpha = 1, ramp = 0, gate = True)
+		# power squelch; when the recorder is gated it judges silence itself and needs the gaps
+		squelch			= analog.pwr_squelch_cc(-50, alpha = 1, ramp = 0, gate = not gated)
 
 		# fm demodulation
 		audio_demod = analog.fm_demod_cf(channel_rate, audio_decimation, self._deviation, self._audio_passband, self._audio_stopband, self._audio_gain, 75e-6)
@@ -72,13 +79,103 @@ class audio_channel(gr.hier_block2):
 
 		# audio output
 		
-		# ensure directory exists
-		create_directory(save_dir, sys_id)
+		if start_time is None:
+			start_time = time.time()
+
+		if files is not None:
+			# day/hour directories, already known to exist
+			path = lambda t: files.path(sys_id, audio_name(group_id, chan, t), t)
+		else:
+			# ensure directory exists
+			create_directory(save_dir, sys_id)
+			path = lambda t: "%s/%x/%s" % (save_dir, sys_id, audio_name(group_id, chan, t))
+		name = path(start_time)
+
+		self.sys_id = sys_id
+		self.chan = chan
+		self.group_id = group_id
+		self.is_group = is_group
+
+		self._name = name
+		self._start_time = start_time
+		self._gated = gated
+		self._files = files
+		self._spare = None
+		self.talkers = talker_timeline()
 
 		# asink = audio.sink(audio_rate)
-		wavfile_sink = blocks.wavfile_sink("%s/%x/%s" % (save_dir, sys_id, audio_name(group_id, chan)), 1, int(round(audio_rate)), 8)
-
-		self.connect(self, channel_filter, squelch, audio_demod, sa_filter, wavfile_sink)
+		if gated:
+			# one file per transmission, named like a call
+			self._recorder = segment_recorder(name, path, audio_rate, start_time, hang_time = hang_time)
+		elif files is not None:
+			# opened ahead of time; renamed to name when the call is closed
+			(self._spare, self._recorder) = files.wav_sink(sys_id, int(round(audio_rate)))
+		else:
+			self._recorder = blocks.wavfile_sink(name, 1, int(round(audio_rate)), 8)
+
+		self.connect(self, channel_filter, squelch, audio_demod, sa_filter, self._recorder)
+		self.perf_blocks = [("channel_filter", channel_filter), ("squelch", squelch), ("audio_demod", audio_demod), ("sa_filter", sa_filter)]
+
+		# blocks written in python; a flow graph holding any of them must be
+		# stopped, not just locked, to be reconfigured
+		self.python_blocks = [self._recorder,] if gated else list()
+
+		# first_sample() is called when audio first reaches the recorder (see latency.py)
+		if first_sample is not None:
+			probe = first_sample_probe(first_sample)
+			self.connect(sa_filter, probe)
+			self.python_blocks.append(probe)
+
+		# optionally keep the channelized iq (int16 or int8) so the call can be demodulated again
+		self._iq_sink = None
+		if iq_export is not None:
+			self._iq_sink = iq_export_sink(name + IQ_EXPORT_EXTENSION[iq_export], channel_rate, iq_export, start_time)
+			self.connect(channel_filter, self._iq_sink)
+			self.python_blocks.append(self._iq_sink)
+
+
+	def talker(self, radio_id, t):
+		"""
+		A grant for this call named radio_id as the talker.  A gated
+		recording starts a new segment when the talker changes.
+		"""
+		if self.talkers.add(radio_id, t) and self._gated and len(self.talkers) > 1:
+			self._recorder.split()
+
+
+	def start_time(self):
+		return self._start_time
+
+
+	def recordings(self):
+		"""
+		The audio files written for this call.
+		"""
+		if self._gated:
+			return [s[2] for s in self._recorder.segments]
+		return [self._name,]
+
+
+	def segment_index(self):
+		"""
+		The index of a gated recording's segments, or None.
+		"""
+		if self._gated:
+			return self._recorder.index_name()
+		return None
+
+
+	def close(self):
+		"""
+		Finish the recording.  Call once the block is out of the flow graph.
+		"""
+		if len(self.talkers) > 0:
+			self.talkers.write_index(self._name + TALKER_INDEX_EXTENSION, self._start_time)
+		self._recorder.close()
+		if self._spare is not None:
+			self._files.finish(self._spare, self._name)
+		if self._iq_sink is not None:
+			self._iq_sink.close()
 
 
 # vim:ts=8:nowrap
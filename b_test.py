@@ -1,19 +1,102 @@
 #!/usr/bin/env python
 
+import numpy
+
 import band_plan_800
+from band_plan import CHANNELS, PLANS, band_plan, from_segments
 
 
-def main():
+def reference_freq(c):
+	"""
+	The Standard 800MHz plan as band_plan_800 used to compute it.
+	"""
+	if c < 720:
+		return 851.0125 + c * 0.025
+	if c < 760:
+		return 866.0 + (c - 720) * 0.025
+	if 815 <= c < 832:
+		return 867.0 + (c - 815) * 0.025
+	if c == 958:
+		return 868.975
+	if 961 <= c < 1023:
+		return 867.425 + (c - 961) * 0.025
+	return None
 
-	for c in range(1024):
-		freq = band_plan_800.get_freq(c)
-		chan = 0
+
+def check_plan(p):
+	"""
+	Properties every plan must have.  Returns the number of failures.
+	"""
+	failed = 0
+
+	# channel -> freq -> channel
+	for c in range(CHANNELS):
+		freq = p.get_freq(c)
+		if (freq is not None) != p.is_valid_channel(c):
+			print "%s: %d valid %s but freq %s" % (p.name, c, p.is_valid_channel(c), freq)
+			failed += 1
 		if freq is not None:
-			chan = band_plan_800.get_chan(freq)
-			if chan != c:
-				print "%d -> %f -> %d" % (c, freq, chan)
+			for f in (freq, freq * 1e6, freq + 0.0004, freq - 0.0004):
+				chan = p.get_chan(f)
+				if chan != c:
+					print "%s: %d -> %f -> %s" % (p.name, c, f, chan)
+					failed += 1
+
+	# freq -> channel -> freq, on a 6.25kHz grid over the plan
+	lo = numpy.nanmin(p.freq) - 0.1
+	hi = numpy.nanmax(p.freq) + 0.1
+	grid = numpy.round(lo + numpy.arange(int((hi - lo) / 0.00625)) * 0.00625, 6)
+	for f in grid:
+		chan = p.get_chan(f)
+		if chan is not None and round(p.get_freq(chan) - f, 6) != 0:
+			print "%s: %f -> %d -> %f" % (p.name, f, chan, p.get_freq(chan))
+			failed += 1
+
+	# vectorized == scalar
+	chans = numpy.arange(-2, CHANNELS + 2)
+	freqs = p.freqs(chans)
+	for (c, f) in zip(chans, freqs):
+		s = p.get_freq(c) if 0 <= c < CHANNELS else None
+		if (s is None) != numpy.isnan(f) or (s is not None and s != f):
+			print "%s: freqs(%d) = %f, get_freq = %s" % (p.name, c, f, s)
+			failed += 1
+	v = p.chans(grid)
+	for (f, c) in zip(grid, v):
+		s = p.get_chan(f)
+		if (s if s is not None else -1) != c:
+			print "%s: chans(%f) = %d, get_chan = %s" % (p.name, f, c, s)
+			failed += 1
+
+	return failed
 
 
+def main():
+
+	failed = 0
+
+	for name in sorted(PLANS):
+		failed += check_plan(PLANS[name])
+
+	# custom plans, from data
+	failed += check_plan(from_segments("custom", [(0, 99, 460.0125, 0.0125), (100, 119, 470.0, 0.025)]))
+	try:
+		band_plan("overlap", [(0, 9, 851.0, 0.025), (10, 19, 851.1, 0.025)])
+		print "overlapping plan accepted"
+		failed += 1
+	except ValueError:
+		pass
+
+	# band_plan_800 is the Standard 800MHz plan, as it always was
+	for c in range(CHANNELS):
+		freq = band_plan_800.get_freq(c)
+		ref = reference_freq(c)
+		if (freq is None) != (ref is None) or (freq is not None and round(freq - ref, 6) != 0):
+			print "band_plan_800: %d -> %s, expected %s" % (c, freq, ref)
+			failed += 1
+		if band_plan_800.is_valid_channel(c) != (ref is not None):
+			print "band_plan_800: %d valid %s" % (c, band_plan_800.is_valid_channel(c))
+			failed += 1
+
 	for i in range(1520):
 		f = 851.0 + i * 0.0125
 		chan = band_plan_800.get_chan(f)
@@ -21,9 +104,9 @@ def main():
 			freq = band_plan_800.get_freq(chan)
 			if round(freq - f, 6) != 0:
 				print "%f -> %d -> %f" % (f, chan, freq)
+				failed += 1
 
-
-	return 0
+	return 1 if failed > 0 else 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+#
+# Channel number <-> frequency.
+#
+#	A band plan is a list of segments, each a run of channels at a fixed
+#	spacing:
+#
+#		(first channel, last channel, frequency of the first channel in MHz, spacing in MHz)
+#
+#	From that a band_plan precomputes the frequency of every one of the
+#	1024 channel numbers (NaN where there is no channel) and a sorted
+#	frequency -> channel index, so a lookup is a table access or a binary
+#	search.  Scalar lookups use plain lists; freqs()/chans() do whole arrays
+#	with numpy.
+#
+#	Plans are named after the band codes in osw_handler.BAND_LIST where the
+#	mapping is known (see PLAN_FOR_BAND).  Other plans can be made from
+#	segments, or read from a file with one "first last base spacing" line
+#	per segment (channels may be given in hex as 0x...).
+#
+
+import bisect
+import numpy
+
+
+CHANNELS	= 1024
+
+
+class band_plan:
+
+	def __init__(self, name, segments, tolerance = 0.001):
+		"""
+		tolerance is how far (MHz) a frequency may be from a channel and
+		still be taken as that channel.
+		"""
+
+		self.name = name
+		self.segments = [tuple(s) for s in segments]
+		self.tolerance = tolerance
+
+		self.freq = numpy.empty(CHANNELS, numpy.float64)
+		self.freq.fill(numpy.nan)
+		for (first, last, base, spacing) in self.segments:
+			if not (0 <= first <= last < CHANNELS):
+				raise ValueError("%s: bad channel range %d-%d" % (name, first, last))
+			c = numpy.arange(first, last + 1)
+			self.freq[c] = numpy.round(base + (c - first) * spacing, 6)
+		self.valid = ~numpy.isnan(self.freq)
+
+		# frequency index, in Hz so equal frequencies compare equal
+		chans = numpy.flatnonzero(self.valid)
+		hz = numpy.rint(self.freq[chans] * 1e6).astype(numpy.int64)
+		order = numpy.argsort(hz, kind = 'mergesort')
+		self.index_hz = hz[order]
+		self.index_chan = chans[order]
+		if len(self.index_hz) > 1 and numpy.any(numpy.diff(self.index_hz) == 0):
+			raise ValueError("%s: two channels share a frequency" % (name,))
+
+		# the same, as lists, for scalar lookups
+		self._freq_list = [float(f) if v else None for (f, v) in zip(self.freq, self.valid)]
+		self._hz_list = self.index_hz.tolist()
+		self._chan_list = self.index_chan.tolist()
+		self._tolerance_hz = int(round(tolerance * 1e6))
+
+
+	def __repr__(self):
+		return "band_plan(%r, %r)" % (self.name, self.segments)
+
+
+	def is_valid_channel(self, c):
+		return (0 <= c < CHANNELS) and self._freq_list[c] is not None
+
+
+	def get_freq(self, c):
+		"""
+		Frequency of channel c in MHz, or None.
+		"""
+		if 0 <= c < CHANNELS:
+			return self._freq_list[c]
+		return None
+
+
+	def get_chan(self, freq):
+		"""
+		Channel for freq (MHz, or Hz if above 1e6), or None.
+		"""
+		if freq > 1e6:
+			freq = freq / 1e6
+		hz = int(round(freq * 1e6))
+		i = bisect.bisect_left(self._hz_list, hz)
+		best = None
+		for j in (i - 1, i):
+			if 0 <= j < len(self._hz_list):
+				d = abs(self._hz_list[j] - hz)
+				if d <= self._tolerance_hz and (best is None or d < best[0]):
+					best = (d, self._chan_list[j])
+		if best is None:
+			return None
+		return best[1]
+
+
+	def freqs(self, chans):
+		"""
+		Frequencies (MHz) of an array of channels; NaN for channels not in the plan.
+		"""
+		c = numpy.asarray(chans)
+		ok = (c >= 0) & (c < CHANNELS)
+		r = numpy.empty(c.shape, numpy.float64)
+		r.fill(numpy.nan)
+		r[ok] = self.freq[c[ok]]
+		return r
+
+
+	def chans(self, freqs):
+		"""
+		Channels of an array of frequencies (MHz, or Hz if above 1e6); -1
+		where there is no channel.
+		"""
+		f = numpy.asarray(freqs, numpy.float64)
+		f = numpy.where(f > 1e6, f / 1e6, f)
+		hz = numpy.rint(f * 1e6).astype(numpy.int64)
+		n = len(self.index_hz)
+		if n == 0:
+			return numpy.zeros(hz.shape, numpy.int64) - 1
+		i = numpy.searchsorted(self.index_hz, hz)
+		lo = numpy.clip(i - 1, 0, n - 1)
+		hi = numpy.clip(i, 0, n - 1)
+		d_lo = numpy.abs(self.index_hz[lo] - hz)
+		d_hi = numpy.abs(self.index_hz[hi] - hz)
+		j = numpy.where(d_hi < d_lo, hi, lo)
+		d = numpy.minimum(d_lo, d_hi)
+		return numpy.where(d <= self._tolerance_hz, self.index_chan[j], -1)
+
+
+def from_segments(name, segments, tolerance = 0.001):
+	return band_plan(name, segments, tolerance)
+
+
+def load_plan(path, name = None):
+	"""
+	Read a plan from a file of "first last base spacing" lines; # starts a comment.
+	"""
+	segments = list()
+	with open(path, "r") as f:
+		for l in f:
+			l = l.split('#')[0].strip()
+			if len(l) == 0:
+				continue
+			(first, last, base, spacing) = l.split()
+			segments.append((int(first, 0), int(last, 0), float(base), float(spacing)))
+	return band_plan(name if name is not None else path, segments)
+
+
+STANDARD_800 = band_plan("800", [
+	(0x000, 0x2cf, 851.0125, 0.025),
+	(0x2d0, 0x2f7, 866.0000, 0.025),
+	(0x32f, 0x33f, 867.0000, 0.025),
+	(0x3be, 0x3be, 868.9750, 0.025),
+	(0x3c1, 0x3fe, 867.4250, 0.025),
+])
+
+REBANDED_800 = band_plan("800 rebanded", [
+	(0x000, 0x1b7, 851.0125, 0.025),
+	(0x1b8, 0x22f, 851.0250, 0.025),
+	(0x2d0, 0x2f7, 866.0000, 0.025),
+	(0x32f, 0x33f, 867.0000, 0.025),
+	(0x3be, 0x3be, 868.9750, 0.025),
+	(0x3c1, 0x3fe, 867.4250, 0.025),
+])
+
+SPLINTER_800 = band_plan("800 splinter", [
+	(0x000, 0x257, 851.0000, 0.025),
+	(0x258, 0x2cf, 866.0125, 0.025),
+	(0x2d0, 0x2f7, 866.0000, 0.025),
+	(0x32f, 0x33f, 867.0000, 0.025),
+	(0x3be, 0x3be, 868.9750, 0.025),
+	(0x3c1, 0x3fe, 867.4250, 0.025),
+])
+
+PLAN_900 = band_plan("900", [
+	(0x000, 0x1de, 935.0125, 0.0125),
+])
+
+PLANS = dict((p.name, p) for p in [STANDARD_800, REBANDED_800, SPLINTER_800, PLAN_900])
+
+# osw_handler.BAND_LIST index -> plan
+PLAN_FOR_BAND = {
+	0:	STANDARD_800,
+	4:	PLAN_900,
+}
+
+
+# vim:ts=8:nowrap
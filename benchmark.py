@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+
+#
+# Benchmarks.
+#
+#	Each benchmark runs one stage of the decoder on a synthetic workload
+#	(see synthetic.py) and reports a rate and, where items are timed one
+#	by one, the 99th percentile time per item:
+#
+#		sink		words through control_channel_sink.process_stream
+#		sink_work	words through control_channel_sink.work (sync search included)
+#		framer		words through control_channel_framer into the sink, from soft symbols
+#		soft		frames decoded correctly from noisy symbols, hard decisions alone
+#				and with soft decision (Chase) decoding; wrongly decoded frames;
+#				time per Chase decode; frames of pure noise accepted, both ways
+#		osw		OSWs through osw_handler.process_osw
+#		grant		grants through message_handler.start_call, 64 calls in progress
+#		logger		lines through trunk_logger
+#		cc_dsp		control_channel flow graph, in seconds of signal per second,
+#				its CPU (all threads, per second of signal) and its CRC error
+#				rate, for each demod profile (robust is cc_dsp, others
+#				cc_dsp_<profile>) and each --cc-snr (suffix _<snr>dB when
+#				more than one); on recorded iq with --iq-file
+#		audio_dsp	audio_channel flow graph, in seconds of signal per second
+#
+#	Results are written as JSON.  Given a baseline (an earlier results file)
+#	every result is compared with it and the run fails if any is worse by
+#	more than the threshold.
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import timeit
+import platform
+import tempfile
+import numpy
+from optparse import OptionParser
+
+from gnuradio import gr, blocks
+
+import trunk_logger
+from synthetic import synthetic_system, write_iq, correlated, SYNC_BITS
+from control_channel_sink import control_channel_sink, CONTROL_WORD_LEN
+from control_channel_framer import control_channel_framer
+from osw_handler import osw_handler
+from message_handler import message_handler
+from band_plan import STANDARD_800
+
+
+CC_CHAN		= 0x100
+CENTER		= 857.5
+
+
+def null_logger():
+	return trunk_logger.logger(os.devnull)
+
+
+def workload(seed = 1, **kwargs):
+	return synthetic_system(1e6, CENTER, CC_CHAN, grant_rate = 5.0, affiliation_rate = 2.0, voice = False, seed = seed, **kwargs)
+
+
+def timed(f, items):
+	"""
+	Call f on each item; returns (items per second, p99 seconds per item).
+	"""
+	clock = timeit.default_timer
+	t = numpy.empty(len(items))
+	start = clock()
+	for i in range(len(items)):
+		t0 = clock()
+		f(items[i])
+		t[i] = clock() - t0
+	total = clock() - start
+	return (len(items) / total, numpy.percentile(t, 99))
+
+
+def result(value, unit, better = "higher"):
+	return {'value': float(value), 'unit': unit, 'better': better}
+
+
+def rate_results(name, unit, r):
+	(rate, p99) = r
+	return {
+		name:			result(rate, unit),
+		name + "_p99":		result(p99 * 1e6, "us", "lower"),
+	}
+
+
+#
+#	Benchmarks; each takes the options and returns {name: result}
+#
+
+def bench_sink(options):
+	w = workload(crc_error_rate = 0.02)
+	streams = [w.next_frame()[len(SYNC_BITS):] for i in range(options.count)]
+	sink = control_channel_sink(null_logger(), gr.msg_queue(0))
+	return rate_results("sink", "words/s", timed(sink.process_stream, streams))
+
+
+def bench_sink_work(options):
+	w = workload(crc_error_rate = 0.02)
+	n = options.count
+	bits = correlated(w.bits(n), n)
+	sink = control_channel_sink(null_logger(), gr.msg_queue(0))
+	start = timeit.default_timer()
+	for i in range(0, len(bits), 4096):
+		sink.work([bits[i:i + 4096]], None)
+	return {"sink_work": result(n / (timeit.default_timer() - start), "words/s")}
+
+
+def bench_framer(options):
+	w = workload(crc_error_rate = 0.02)
+	n = options.count
+	rng = numpy.random.RandomState(1)
+	b = w.bits(n)
+	soft = ((b.astype(numpy.float32) * 2.0 - 1.0) * rng.uniform(0.5, 1.5, len(b))).astype(numpy.float32)
+	sink = control_channel_sink(null_logger(), gr.msg_queue(0))
+	framer = control_channel_framer(sink.process_frame)
+	start = timeit.default_timer()
+	for i in range(0, len(soft), 4096):
+		framer.work([soft[i:i + 4096]], None)
+	return {"framer": result(n / (timeit.default_timer() - start), "words/s")}
+
+
+def bench_soft(options):
+	w = workload()
+	rng = numpy.random.RandomState(1)
+	sink = control_channel_sink(null_logger(), gr.msg_queue(0))
+	sink.chase_bits = options.chase_bits
+	n = min(options.count, 5000)
+	hard = soft = wrong = 0
+	t = list()
+	for i in range(n):
+		f = numpy.array(w.next_frame()[len(SYNC_BITS):], numpy.uint8)
+		truth = sink.parity_decode(sink.deinterleave(f.tolist()))
+		x = (f * 2.0 - 1.0) + rng.normal(0.0, options.soft_noise, len(f))
+		b = (x >= 0).astype(numpy.uint8).tolist()
+		d = sink.parity_decode(sink.deinterleave(b))
+		if sink.check_crc(d):
+			if d == truth:
+				hard += 1
+			else:
+				wrong += 1
+			continue
+		t0 = timeit.default_timer()
+		d = sink.soft_decode(b, x)
+		t.append(timeit.default_timer() - t0)
+		if d == truth:
+			soft += 1
+		elif d is not None:
+			wrong += 1
+
+	# frames of nothing but noise, as the framer finds in a dead channel;
+	# whatever passes becomes a bogus grant
+	m = options.count
+	noise_hard = noise_soft = 0
+	for i in range(m):
+		x = rng.normal(0.0, 1.0, CONTROL_WORD_LEN)
+		b = (x >= 0).astype(numpy.uint8).tolist()
+		if sink.check_crc(sink.parity_decode(sink.deinterleave(b))):
+			noise_hard += 1
+		elif sink.soft_decode(b, x) is not None:
+			noise_soft += 1
+
+	return {
+		"soft_hard":		result(100.0 * hard / n, "%"),
+		"soft_chase":		result(100.0 * (hard + soft) / n, "%"),
+		"soft_wrong":		result(100.0 * wrong / n, "%", "lower"),
+		"soft_p99":		result(numpy.percentile(t, 99) * 1e6 if len(t) > 0 else 0.0, "us", "lower"),
+		"soft_noise_hard":	result(100.0 * noise_hard / m, "%", "lower"),
+		"soft_noise_chase":	result(100.0 * (noise_hard + noise_soft) / m, "%", "lower"),
+	}
+
+
+def bench_osw(options):
+	w = workload()
+	sink = control_channel_sink(null_logger(), gr.msg_queue(0))
+	h = osw_handler(null_logger(), gr.msg_queue(0))
+	osws = list()
+	for i in range(options.count):
+		b = w.next_frame()
+		osws.append(h.parse_raw_osw(sink.parity_decode(sink.deinterleave(b[len(SYNC_BITS):]))))
+	return rate_results("osw", "OSWs/s", timed(h.process_osw, osws))
+
+
+def bench_grant(options):
+	mh = message_handler(gr.msg_queue(0))
+	mh.set_sysid(0x1234, CC_CHAN)
+	rng = numpy.random.RandomState(1)
+	chans = [c for c in numpy.flatnonzero(STANDARD_800.valid).tolist()][:64]
+	grants = [((i + 1) << 4, chans[i], 0x100 + 4 * i + rng.randint(4)) for i in rng.randint(64, size = options.count)]
+	return rate_results("grant", "grants/s", timed(lambda g: mh.start_call(*g), grants))
+
+
+def bench_logger(options):
+	d = tempfile.mkdtemp()
+	try:
+		l = trunk_logger.logger(os.path.join(d, "log"))
+		line = "CALL  %4x (%5d)  %4x (G) %-14s  %4.4f MHz" % (0x1234, 17, 0x2a50, "FIRE DISP 1", 857.4125)
+		return rate_results("logger", "lines/s", timed(l.log, [line,] * options.count))
+	finally:
+		shutil.rmtree(d)
+
+
+def run_graph(tb):
+	"""
+	Run tb to the end; returns (wall, cpu) seconds, cpu over every thread.
+	"""
+	t = os.times()
+	start = timeit.default_timer()
+	tb.run()
+	wall = timeit.default_timer() - start
+	u = os.times()
+	return (wall, (u[0] - t[0]) + (u[1] - t[1]))
+
+
+def bench_cc_dsp(options):
+	from control_channel import control_channel, PROFILES
+
+	# CPU cost and CRC error rate of each profile at each SNR, side by side
+	snrs = [None,] if options.iq_file is not None else (options.cc_snr or [options.snr,])
+
+	r = dict()
+	for snr in snrs:
+		if options.iq_file is not None:
+			path = options.iq_file
+			freq_offset = (options.iq_control_channel - options.iq_center) * 1e6
+			seconds = os.path.getsize(path) / (gr.sizeof_gr_complex * options.sample_rate)
+		else:
+			(path, w) = dsp_input(options, snr)
+			freq_offset = STANDARD_800.get_freq(CC_CHAN) * 1e6 - w.center_freq
+			seconds = options.dsp_seconds
+
+		try:
+			for profile in PROFILES:
+				tb = gr.top_block()
+				cc = control_channel(options.sample_rate, freq_offset, queue = gr.msg_queue(0), logger = null_logger(), profile = profile)
+				tb.connect(blocks.file_source(gr.sizeof_gr_complex, path, False), cc)
+				name = "cc_dsp" if profile == "robust" else "cc_dsp_" + profile
+				if len(snrs) > 1:
+					name += "_%gdB" % (snr,)
+				(wall, cpu) = run_graph(tb)
+				r[name] = result(seconds / wall, "x realtime")
+				r[name + "_cpu"] = result(100.0 * cpu / seconds, "% of a core", "lower")
+				s = cc.sink
+				r[name + "_frames"] = result(s.valid, "frames")
+				r[name + "_crc"] = result(100.0 * s.errors / max(s.valid + s.errors, 1), "%", "lower")
+		finally:
+			if options.iq_file is None:
+				os.unlink(path)
+	return r
+
+
+def bench_audio_dsp(options):
+	from audio_channel import audio_channel
+
+	(path, w) = dsp_input(options)
+	d = tempfile.mkdtemp()
+	try:
+		chan = CC_CHAN + 8
+		tb = gr.top_block()
+		ac = audio_channel(options.sample_rate, STANDARD_800.get_freq(chan) * 1e6 - w.center_freq, 0x1234, chan, 0x2a50, d)
+		tb.connect(blocks.file_source(gr.sizeof_gr_complex, path, False), ac)
+		r = {"audio_dsp": result(options.dsp_seconds / run_graph(tb)[0], "x realtime")}
+		ac.close()
+		return r
+	finally:
+		os.unlink(path)
+		shutil.rmtree(d)
+
+
+def dsp_input(options, snr = None):
+	w = synthetic_system(options.sample_rate, CENTER, CC_CHAN, grant_rate = 2.0, snr = options.snr if snr is None else snr, seed = 1)
+	(fd, path) = tempfile.mkstemp(suffix = ".iq")
+	os.close(fd)
+	write_iq(w, path, options.dsp_seconds)
+	return (path, w)
+
+
+BENCHMARKS = [
+	("sink",	bench_sink),
+	("sink_work",	bench_sink_work),
+	("framer",	bench_framer),
+	("soft",	bench_soft),
+	("osw",		bench_osw),
+	("grant",	bench_grant),
+	("logger",	bench_logger),
+	("cc_dsp",	bench_cc_dsp),
+	("audio_dsp",	bench_audio_dsp),
+]
+
+
+def best_of(f, options):
+	"""
+	Run a benchmark options.repeat times and keep the best of each result,
+	which is much steadier from run to run than any single one.
+	"""
+	best = dict()
+	for i in range(options.repeat):
+		for (name, r) in f(options).iteritems():
+			b = best.get(name)
+			if b is None or (r['value'] > b['value'] if r['better'] == "higher" else r['value'] < b['value']):
+				best[name] = r
+	return best
+
+
+def compare(results, baseline, threshold, latency_threshold):
+	"""
+	Print each result against the baseline; returns the names of the
+	regressions.  Rates use threshold, per-item times (which are noisier)
+	latency_threshold.
+	"""
+	regressions = list()
+	for name in sorted(results):
+		r = results[name]
+		b = baseline.get(name)
+		if b is None or b['value'] == 0:
+			print "%-16s %14.2f %-10s" % (name, r['value'], r['unit'])
+			continue
+		change = (r['value'] - b['value']) / b['value']
+		worse = (change < -threshold) if r['better'] == "higher" else (change > latency_threshold)
+		print "%-16s %14.2f %-10s %14.2f  %+6.1f%%%s" % (name, r['value'], r['unit'], b['value'], 100.0 * change, "  REGRESSION" if worse else "")
+		if worse:
+			regressions.append(name)
+	return regressions
+
+
+def main():
+
+	parser = OptionParser(usage = "%prog: [options]")
+	parser.add_option("-o", "--output", type = "string", default = "benchmark.json", help = "Write results here. [default = %default]")
+	parser.add_option("-b", "--baseline", type = "string", default = None, help = "Compare with the results in this file.")
+	parser.add_option("-t", "--threshold", type = "float", default = 0.10, help = "Fail if a result is this much worse than the baseline. [default = %default]")
+	parser.add_option("-T", "--latency-threshold", type = "float", default = 0.50, help = "The same, for p99 times per item. [default = %default]")
+	parser.add_option("-k", "--only", type = "string", action = "append", default = None, help = "Run only this benchmark (may be repeated).")
+	parser.add_option("-n", "--count", type = "int", default = 20000, help = "Items per benchmark. [default = %default]")
+	parser.add_option("-R", "--repeat", type = "int", default = 3, help = "Runs of each benchmark; the best is kept. [default = %default]")
+	parser.add_option("-r", "--sample-rate", type = "float", default = 5e6, help = "Sample rate for the DSP benchmarks. [default = %default]")
+	parser.add_option("-s", "--dsp-seconds", type = "float", default = 4.0, help = "Seconds of signal for the DSP benchmarks. [default = %default]")
+	parser.add_option("", "--soft-noise", type = "float", default = 0.55, help = "Noise (standard deviation, symbols are +-1) for the soft benchmark. [default = %default]")
+	parser.add_option("", "--chase-bits", type = "int", default = control_channel_sink._CHASE_BITS, help = "Bits flipped by the soft benchmark's Chase decoding. [default = %default]")
+	parser.add_option("", "--snr", type = "float", default = 15.0, help = "Carrier to noise ratio (dB in 12.5kHz) of the DSP benchmarks' signal. [default = %default]")
+	parser.add_option("", "--cc-snr", type = "float", action = "append", default = None, help = "Run cc_dsp at this SNR instead of --snr (may be repeated, e.g. 15, 10, 8, 6).")
+	parser.add_option("-i", "--iq-file", type = "string", default = None, help = "Recorded iq (complex64 at --sample-rate) for cc_dsp instead of a synthetic signal.")
+	parser.add_option("", "--iq-center", type = "float", default = None, help = "Center frequency of --iq-file (MHz).")
+	parser.add_option("", "--iq-control-channel", type = "float", default = None, help = "Control channel frequency in --iq-file (MHz).")
+	parser.add_option("", "--no-dsp", action = "store_true", default = False, help = "Skip the DSP benchmarks.")
+	(options, args) = parser.parse_args()
+
+	if options.iq_file is not None and (options.iq_center is None or options.iq_control_channel is None):
+		parser.error("--iq-file needs --iq-center and --iq-control-channel")
+
+	results = dict()
+	for (name, f) in BENCHMARKS:
+		if options.only is not None and name not in options.only:
+			continue
+		if options.no_dsp and name.endswith("_dsp"):
+			continue
+		results.update(best_of(f, options))
+
+	with open(options.output, "w") as f:
+		json.dump({
+			'time':		time.time(),
+			'host':		socket.gethostname(),
+			'python':	platform.python_version(),
+			'gnuradio':	gr.version(),
+			'count':	options.count,
+			'repeat':	options.repeat,
+			'results':	results,
+		}, f, indent = 1, sort_keys = True)
+
+	baseline = dict()
+	if options.baseline is not None:
+		with open(options.baseline, "r") as f:
+			baseline = json.load(f)['results']
+
+	regressions = compare(results, baseline, options.threshold, options.latency_threshold)
+	if len(regressions) > 0:
+		print "%d regression(s): %s" % (len(regressions), ", ".join(regressions))
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
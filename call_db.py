@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+#
+# Call database.
+#
+#	Grants, affiliations and recording paths go into an SQLite database (WAL
+#	mode) so that questions like "every call on group X last week" are an
+#	indexed query rather than a grep through the text log.
+#
+#	A call_db is an osw_handler listener.  Events are queued and a writer
+#	thread inserts them in batches, one transaction per batch, so the decode
+#	thread never waits on the disk.
+#
+#	Group ids of group calls (and their recordings) are stored with the low
+#	four bits (the group type, see osw_handler.GROUP_TYPES) split off into
+#	group_flags.  For a private call group_id is the called radio, stored as
+#	it is.
+#
+
+import sys
+import time
+import Queue
+import sqlite3
+import threading
+from optparse import OptionParser
+
+
+SCHEMA = [
+	"""CREATE TABLE IF NOT EXISTS calls (
+		time		REAL NOT NULL,
+		sys_id		INTEGER,
+		chan		INTEGER,
+		group_id	INTEGER,
+		group_flags	INTEGER,
+		is_group	INTEGER,
+		radio_id	INTEGER
+	)""",
+	"CREATE INDEX IF NOT EXISTS calls_time ON calls (time)",
+	"CREATE INDEX IF NOT EXISTS calls_group ON calls (group_id, time)",
+	"CREATE INDEX IF NOT EXISTS calls_radio ON calls (radio_id, time)",
+	"CREATE INDEX IF NOT EXISTS calls_chan ON calls (chan, time)",
+
+	"""CREATE TABLE IF NOT EXISTS affiliations (
+		time		REAL NOT NULL,
+		sys_id		INTEGER,
+		radio_id	INTEGER,
+		group_id	INTEGER,
+		affiliated	INTEGER
+	)""",
+	"CREATE INDEX IF NOT EXISTS affiliations_time ON affiliations (time)",
+	"CREATE INDEX IF NOT EXISTS affiliations_radio ON affiliations (radio_id, time)",
+	"CREATE INDEX IF NOT EXISTS affiliations_group ON affiliations (group_id, time)",
+
+	"""CREATE TABLE IF NOT EXISTS recordings (
+		time		REAL NOT NULL,
+		sys_id		INTEGER,
+		chan		INTEGER,
+		group_id	INTEGER,
+		group_flags	INTEGER,
+		is_group	INTEGER,
+		path		TEXT
+	)""",
+	"CREATE INDEX IF NOT EXISTS recordings_time ON recordings (time)",
+	"CREATE INDEX IF NOT EXISTS recordings_group ON recordings (group_id, time)",
+]
+
+INSERT = {
+	'calls':	"INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?)",
+	'affiliations':	"INSERT INTO affiliations VALUES (?, ?, ?, ?, ?)",
+	'recordings':	"INSERT INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+def connect(path):
+	c = sqlite3.connect(path, timeout = 30.0, check_same_thread = False)
+	c.execute("PRAGMA journal_mode = WAL")
+	c.execute("PRAGMA synchronous = NORMAL")
+	return c
+
+
+def row_for(kind, f):
+	"""
+	Return (table, row) for an event, or None if it is not stored.
+	"""
+
+	if kind == 'grant':
+		if f['is_group']:
+			return ('calls', (f['time'], f['sys_id'], f['chan'], f['group_id'] & 0xfff0, f['group_id'] & 0xf, f['is_group'], f['radio_id']))
+		return ('calls', (f['time'], f['sys_id'], f['chan'], f['group_id'], 0, f['is_group'], f['radio_id']))
+	if kind == 'affiliation':
+		return ('affiliations', (f['time'], f['sys_id'], f['radio_id'], f['group_id'], 1))
+	if kind == 'unaffiliation':
+		return ('affiliations', (f['time'], f['sys_id'], f['radio_id'], f['group_id'], 0))
+	if kind == 'recording':
+		if f['is_group']:
+			return ('recordings', (f['time'], f['sys_id'], f['chan'], f['group_id'] & 0xfff0, f['group_id'] & 0xf, f['is_group'], f['path']))
+		return ('recordings', (f['time'], f['sys_id'], f['chan'], f['group_id'], 0, f['is_group'], f['path']))
+	return None
+
+
+class call_db:
+
+	_BATCH_SIZE = 500
+	_BATCH_WAIT = 0.25		# longest an event waits for its batch
+
+	def __init__(self, path, max_queue = 100000, logger = None):
+
+		self._path = path
+		self._queue = Queue.Queue(max_queue)
+		self._logger = logger
+		self.dropped = 0
+		self.inserted = 0
+		self.errors = 0		# batches lost to sqlite errors
+
+		c = connect(path)
+		for s in SCHEMA:
+			c.execute(s)
+		c.commit()
+		c.close()
+
+		self._writer = threading.Thread(target = self.writer)
+		self._writer.daemon = True
+		self._writer.start()
+
+
+	def __call__(self, kind, fields):
+		"""
+		osw_handler listener; never blocks.
+		"""
+		r = row_for(kind, fields)
+		if r is None:
+			return
+		try:
+			self._queue.put_nowait(r)
+		except Queue.Full:
+			self.dropped += 1
+
+
+	def depth(self):
+		return self._queue.qsize()
+
+
+	def writer(self):
+		c = connect(self._path)
+		while True:
+			batch = [self._queue.get(),]
+			if batch[0] is None:
+				break
+			deadline = time.time() + self._BATCH_WAIT
+			while len(batch) < self._BATCH_SIZE:
+				try:
+					r = self._queue.get(True, max(deadline - time.time(), 0))
+				except Queue.Empty:
+					break
+				if r is None:
+					self._queue.put(None)
+					break
+				batch.append(r)
+
+			rows = dict()
+			for (table, row) in batch:
+				rows.setdefault(table, list()).append(row)
+			try:
+				with c:
+					for table in rows:
+						c.executemany(INSERT[table], rows[table])
+			except sqlite3.Error, e:
+				# this batch is lost; keep the writer going for the next
+				self.errors += 1
+				self.log_error("call_db %s: %d rows lost: %s" % (self._path, len(batch), e))
+				continue
+			self.inserted += len(batch)
+		c.close()
+
+
+	def log_error(self, s):
+		if self._logger is not None:
+			self._logger.log_error(s)
+		else:
+			print >>sys.stderr, s
+
+
+	def close(self):
+		"""
+		Wait for everything queued so far to be written, and stop the writer.
+		"""
+		self._queue.put(None)
+		self._writer.join()
+
+
+#
+#	Queries
+#
+
+def query_calls(path, start = None, end = None, group_id = None, radio_id = None, chan = None, limit = None):
+	"""
+	Return the calls matching all of the given criteria, oldest first, as
+	(time, sys_id, chan, group_id, group_flags, is_group, radio_id).
+	"""
+
+	where = list()
+	args = list()
+	if start is not None:
+		where.append("time >= ?")
+		args.append(start)
+	if end is not None:
+		where.append("time < ?")
+		args.append(end)
+	if group_id is not None:
+		where.append("((is_group != 0 AND group_id = ?) OR (is_group = 0 AND group_id = ?))")
+		args.extend([group_id & 0xfff0, group_id])
+	if radio_id is not None:
+		where.append("radio_id = ?")
+		args.append(radio_id)
+	if chan is not None:
+		where.append("chan = ?")
+		args.append(chan)
+
+	q = "SELECT * FROM calls"
+	if len(where) > 0:
+		q += " WHERE " + " AND ".join(where)
+	q += " ORDER BY time"
+	if limit is not None:
+		q += " LIMIT %d" % (limit,)
+
+	c = connect(path)
+	r = c.execute(q, args).fetchall()
+	c.close()
+	return r
+
+
+def query_recordings(path, start = None, end = None, group_id = None):
+	"""
+	Return the recordings in the time range, oldest first, as
+	(time, sys_id, chan, group_id, group_flags, is_group, path).
+	"""
+	where = ["time >= ?", "time < ?"]
+	args = [start if start is not None else 0.0, end if end is not None else time.time() + 1]
+	if group_id is not None:
+		where.append("((is_group != 0 AND group_id = ?) OR (is_group = 0 AND group_id = ?))")
+		args.extend([group_id & 0xfff0, group_id])
+	c = connect(path)
+	r = c.execute("SELECT * FROM recordings WHERE " + " AND ".join(where) + " ORDER BY time", args).fetchall()
+	c.close()
+	return r
+
+
+def query_members(path, group_id, start = None, end = None):
+	"""
+	Radios that affiliated to group_id in the time range, with counts.
+	"""
+	c = connect(path)
+	r = c.execute("SELECT radio_id, COUNT(*) FROM affiliations WHERE group_id = ? AND affiliated = 1 AND time >= ? AND time < ? GROUP BY radio_id ORDER BY 2 DESC",
+		(group_id & 0xfff0, start if start is not None else 0.0, end if end is not None else time.time() + 1)).fetchall()
+	c.close()
+	return r
+
+
+def benchmark(path, n):
+	"""
+	Time n grants through the listener and writer.  Returns inserts/s.
+	"""
+	db = call_db(path)
+	start = time.time()
+	for i in range(n):
+		db('grant', {'time': start + i * 0.001, 'sys_id': 0x1234, 'chan': i % 720, 'group_id': (i * 16) & 0xffff, 'is_group': 1, 'radio_id': i & 0xffff})
+	db.close()
+	return n / (time.time() - start)
+
+
+def parse_id(s):
+	return int(s, 16) if s is not None else None
+
+
+def main():
+
+	parser = OptionParser(usage = "%prog: [options] database {calls|recordings|members|bench}")
+	parser.add_option("-g", "--group", type = "string", default = None, help = "Group id (hex).")
+	parser.add_option("-r", "--radio", type = "string", default = None, help = "Radio id (hex).")
+	parser.add_option("-c", "--chan", type = "int", default = None, help = "Channel number.")
+	parser.add_option("-s", "--since", type = "float", default = None, help = "Only the last this many hours.")
+	parser.add_option("-n", "--limit", type = "int", default = None, help = "At most this many rows.")
+	parser.add_option("-N", "--count", type = "int", default = 100000, help = "Grants to insert for bench. [default = %default]")
+	(options, args) = parser.parse_args()
+
+	if len(args) != 2:
+		parser.print_help()
+		return 1
+	(path, cmd) = args
+
+	start = (time.time() - options.since * 3600) if options.since is not None else None
+
+	if cmd == "calls":
+		for r in query_calls(path, start = start, group_id = parse_id(options.group), radio_id = parse_id(options.radio), chan = options.chan, limit = options.limit):
+			print "%s  sys %4x  chan %4d  group %4x (%x)  radio %s" % (time.asctime(time.localtime(r[0])), r[1], r[2], r[3], r[4], "%4x" % (r[6],) if r[6] is not None else "   ?")
+	elif cmd == "recordings":
+		for r in query_recordings(path, start = start, group_id = parse_id(options.group)):
+			print "%s  group %4x (%x)  %s" % (time.asctime(time.localtime(r[0])), r[3], r[4], r[6])
+	elif cmd == "members":
+		if options.group is None:
+			parser.error("members needs --group")
+		for (radio_id, count) in query_members(path, parse_id(options.group), start = start):
+			print "%4x  %d" % (radio_id, count)
+	elif cmd == "bench":
+		print "%.0f inserts/s" % (benchmark(path, options.count),)
+	else:
+		parser.print_help()
+		return 1
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
@@ -1,16 +1,66 @@
 #!/usr/bin/env python
 
 import math
+from fractions import Fraction
 
 from gnuradio import analog, digital, gr, filter
 from gnuradio.filter import firdes
 
 from control_channel_sink import control_channel_sink
+from control_channel_framer import control_channel_framer
+
+
+#
+#	Demodulator profiles
+#
+#	robust	4 samples per symbol (not exactly: the decimation is an even
+#		integer), a long channel filter with a 1kHz transition at the
+#		full sample rate.
+#
+#	lean	the channel filter decimates to a rate with a small rational
+#		relation to 2 samples per symbol, with a transition band as wide
+#		as the channel rate allows (a fraction of the taps); after the
+#		FM demodulator a rational resampler brings the symbols to
+#		exactly 2 samples each.  The complex rate stays above the FM
+#		signal's bandwidth (4kHz deviation at 3600 baud); only the real
+#		symbol stream is at 2 samples per symbol.
+#
+#		lean_rates() gives exactly 2 samples per symbol at 1, 2, 2.4, 2.5,
+#		3.2, 4, 5, 8, 10 and 20 Msps (and their 1.024 multiples), and
+#		2.00013 at 6.25 Msps, well inside clock recovery's 0.5% limit.
+#		Its CPU cost and CRC error rate have not yet been measured on a
+#		flow graph against robust's; run benchmark.py -k cc_dsp with a few
+#		--cc-snr values (or --iq-file) before relying on it.
+#
+
+PROFILES	= ["robust", "lean"]
+
+LEAN_SYMBOL_RATE	= 2 * 3600		# after the resampler
+LEAN_CHANNEL_RATE	= 4 * 3600		# least rate for the channel filter output
+LEAN_CUTOFF		= 6e3			# half the FM signal's bandwidth
+LEAN_MAX_RATIO		= 32			# largest resampler interpolation and decimation
+
+
+def lean_rates(sample_rate):
+	"""
+	(channel decimation, interpolation, decimation) taking sample_rate to
+	exactly LEAN_SYMBOL_RATE, for the largest channel decimation that
+	leaves at least LEAN_CHANNEL_RATE and a resampler ratio of small
+	integers.  Where there is none, the ratio is the nearest one.
+	"""
+	rate = int(round(sample_rate))
+	d = max(int(sample_rate / LEAN_CHANNEL_RATE), 1)
+	for channel_decimation in range(d, 0, -1):
+		r = Fraction(LEAN_SYMBOL_RATE * channel_decimation, rate)
+		if r.numerator <= LEAN_MAX_RATIO and r.denominator <= LEAN_MAX_RATIO:
+			return (channel_decimation, r.numerator, r.denominator)
+	r = Fraction(LEAN_SYMBOL_RATE * d, rate).limit_denominator(LEAN_MAX_RATIO)
+	return (d, r.numerator, r.denominator)
 
 
 class control_channel(gr.hier_block2):
 
-	def __init__(self, sample_rate, freq_offset, queue, logger = None, group_description_csv = None):
+	def __init__(self, sample_rate, freq_offset, queue, logger = None, group_description_csv = None, listeners = None, text_log = True, latency = None, max_neighbors = None, source_decay = None, framer = False, profile = "robust"):
 
 		gr.hier_block2.__init__(
 			self,
@@ -22,10 +72,42 @@ class control_channel(gr.hier_block2):
 		self._CC_DEVIATION	= 4e3		# observed
 
 		self._symbol_rate	= 3600.0	# control channel rate is 3.6kb/s
-		self._oversample	= 4		# XXX reduce
-		
+
+		if profile == "robust":
+			(demod, samples_per_symbol) = self.robust_demod(sample_rate, freq_offset)
+		elif profile == "lean":
+			(demod, samples_per_symbol) = self.lean_demod(sample_rate, freq_offset)
+		else:
+			raise ValueError("unknown demod profile %s (not one of %s)" % (profile, ", ".join(PROFILES)))
+
+		clock = digital.clock_recovery_mm_ff(omega = samples_per_symbol, gain_omega = 0.001, mu = 0, gain_mu = 0.001, omega_relative_limit = 0.005)
+		cc_sink = control_channel_sink(logger, queue, group_description_csv, listeners, text_log, latency, max_neighbors, source_decay)
+		self.sink = cc_sink
+
+		# for the per-block performance counters (see smartzone metrics)
+		self.perf_blocks = demod + [("clock", clock)]
+		demod = [b for (n, b) in demod]
+
+		if framer:
+			# slice, find sync and frame in one block; the sink sees only frames
+			cc_framer = control_channel_framer(cc_sink.process_frame)
+			self.connect(*([self,] + demod + [clock, cc_framer]))
+			self.perf_blocks += [("framer", cc_framer)]
+		else:
+			slicer = digital.binary_slicer_fb()
+			digital_correlate = digital.correlate_access_code_bb("10101100", 0)
+			self.connect(*([self,] + demod + [clock, slicer, digital_correlate, cc_sink]))
+			self.perf_blocks += [("slicer", slicer), ("correlate", digital_correlate), ("sink", cc_sink)]
+
+
+	def robust_demod(self, sample_rate, freq_offset):
+		"""
+		([(name, block), ...], samples per symbol)
+		"""
+		oversample = 4
+
 		# get close to the desired sample rate with decimation
-		channel_decimation = int(sample_rate / (self._oversample * self._symbol_rate)) & ~1
+		channel_decimation = int(sample_rate / (oversample * self._symbol_rate)) & ~1
 		channel_rate = sample_rate / channel_decimation
 		samples_per_symbol = channel_rate / self._symbol_rate
 
@@ -39,12 +121,25 @@ class control_channel(gr.hier_block2):
 		#quad_demod = analog.quadrature_demod_cf(1.0)
 		quad_demod = analog.quadrature_demod_cf(channel_rate / (2 * math.pi * self._CC_DEVIATION))
 
-		clock = digital.clock_recovery_mm_ff(omega = samples_per_symbol, gain_omega = 0.001, mu = 0, gain_mu = 0.001, omega_relative_limit = 0.005)
-		slicer = digital.binary_slicer_fb()
-		digital_correlate = digital.correlate_access_code_bb("10101100", 0)
-		cc_sink = control_channel_sink(logger, queue, group_description_csv)
+		return ([("channel_filter", channel_filter), ("quad_demod", quad_demod)], samples_per_symbol)
+
+
+	def lean_demod(self, sample_rate, freq_offset):
+
+		(channel_decimation, interpolation, decimation) = lean_rates(sample_rate)
+		channel_rate = float(sample_rate) / channel_decimation
+
+		# aliases of the stopband fold no closer than the cutoff
+		transition = max(channel_rate - 2 * LEAN_CUTOFF, 1e3)
+		channel_taps = firdes.low_pass(1, sample_rate, LEAN_CUTOFF, transition, firdes.WIN_HAMMING)
+		channel_filter = filter.freq_xlating_fir_filter_ccf(channel_decimation, channel_taps, freq_offset, sample_rate)
+
+		quad_demod = analog.quadrature_demod_cf(channel_rate / (2 * math.pi * self._CC_DEVIATION))
+		resampler = filter.rational_resampler_fff(interpolation, decimation)
+
+		samples_per_symbol = channel_rate * interpolation / decimation / self._symbol_rate
 
-		self.connect(self, channel_filter, quad_demod, clock, slicer, digital_correlate, cc_sink)
+		return ([("channel_filter", channel_filter), ("quad_demod", quad_demod), ("resampler", resampler)], samples_per_symbol)
 
 
 # vim:ts=8
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+#
+# Slicing, sync search and framing of control channel symbols in one block.
+#
+#	The usual chain after clock recovery is binary_slicer_fb,
+#	correlate_access_code_bb and control_channel_sink, which looks at
+#	every bit in Python.  This block takes the soft symbols from
+#	clock_recovery_mm_ff and does all three with numpy a buffer at a time:
+#	slice at zero, find the "10101100" sync, and cut out the 76 bits after
+#	it.  Only complete frames reach Python code, about 47 a second.
+#
+#	A frame is passed to frame(bits, soft, confidence):
+#
+#		bits		the 76 sliced bits packed into 10 bytes (numpy.packbits)
+#		soft		the 76 symbol values, float32; the sign is the bit and
+#				the magnitude how sure the slicer was
+#		confidence	the weakest symbol relative to the frame's mean
+#				magnitude, 0 (a bit right at the threshold) to 1
+#
+#	A sync is looked for only after the end of the previous frame, as the
+#	sink does, but it may overlap that frame's last bits.
+#
+
+import numpy
+from gnuradio import gr
+
+from control_channel_sink import CONTROL_WORD_LEN
+
+
+SYNC		= 0xac		# 10101100
+SYNC_LEN	= 8
+
+
+class control_channel_framer(gr.sync_block):
+
+	def __init__(self, frame):
+		gr.sync_block.__init__(
+			self,
+			name = "SmartZone Control Channel Framer",
+			in_sig = [numpy.float32],
+			out_sig = None
+		)
+
+		self._frame = frame
+
+		# symbols not yet framed; a frame may start at _cursor or later
+		self._soft = numpy.zeros(0, numpy.float32)
+		self._cursor = 0
+
+		self.frames = 0
+
+
+	def syncs(self, bits):
+		"""
+		Indices just past each sync in bits.
+		"""
+		n = len(bits) - SYNC_LEN + 1
+		if n <= 0:
+			return numpy.zeros(0, numpy.int64)
+		v = numpy.zeros(n, numpy.uint8)
+		for k in range(SYNC_LEN):
+			v = (v << 1) | bits[k:n + k]
+		return numpy.flatnonzero(v == SYNC) + SYNC_LEN
+
+
+	def work(self, input_items, output_items):
+
+		ii = input_items[0]
+		x = numpy.concatenate((self._soft, ii)) if len(self._soft) > 0 else numpy.asarray(ii, numpy.float32)
+		bits = (x >= 0).astype(numpy.uint8)
+		n = len(x)
+
+		cursor = self._cursor
+		pending = None
+		for p in self.syncs(bits):
+			if p < cursor:
+				continue
+			if p + CONTROL_WORD_LEN > n:
+				pending = p
+				break
+			soft = x[p:p + CONTROL_WORD_LEN]
+			a = numpy.abs(soft)
+			m = a.mean()
+			self.frames += 1
+			self._frame(numpy.packbits(bits[p:p + CONTROL_WORD_LEN]), soft, (a.min() / m) if m > 0 else 0.0)
+			cursor = p + CONTROL_WORD_LEN
+
+		# keep what the next sync (at the pending one, or past everything
+		# searched so far) could start in
+		next_sync = pending if pending is not None else max(cursor, n + 1)
+		keep = max(next_sync - SYNC_LEN, 0)
+		self._soft = x[keep:].copy()
+		self._cursor = max(cursor - keep, 0)
+
+		return len(ii)
+
+
+# vim:ts=8:nowrap
@@ -7,6 +7,7 @@
 # We assume that the standard 800MHz band plan is in use.
 #
 
+import time
 import operator
 import numpy
 from gnuradio import gr
@@ -16,10 +17,34 @@ import trunk_logger
 
 CONTROL_WORD_LEN = 76
 
+# deinterleave() as an index array
+DEINTERLEAVE = numpy.array([k + l * (CONTROL_WORD_LEN / 4) for k in range(CONTROL_WORD_LEN / 4) for l in range(4)])
+
+# check_crc() is linear: the CRC of the first 27 bits is 0x0393 xored with
+# the value below for every bit that is set (bits of each, msb first)
+def _crc_terms():
+	o = 0x036e
+	r = list()
+	for i in range(27):
+		o = (o >> 1) ^ 0x0225 if bool(o & 1) else (o >> 1)
+		r.append([(o >> (9 - j)) & 1 for j in range(10)])
+	return numpy.array(r, numpy.uint8)
+
+CRC_TERMS = _crc_terms()
+CRC_INIT = numpy.array([(0x0393 >> (9 - j)) & 1 for j in range(10)], numpy.uint8)
+
 
 class control_channel_sink(gr.sync_block):
 
-	def __init__(self, logger, queue, group_description_csv = None):
+	_RATE_INTERVAL = 60.0		# frame and CRC error rates are over this many seconds
+
+	# soft decision decoding of frames that fail their CRC (see soft_decode)
+	_CHASE_BITS	= 6		# least reliable bits tried both ways, when enabled
+	_CHASE_BLOCK	= 64		# candidates tried at once
+	_CHASE_BUDGET	= 0.002		# seconds per frame
+	_CHASE_MAX_DISTANCE = 2.0	# in mean symbol magnitudes
+
+	def __init__(self, logger, queue, group_description_csv = None, listeners = None, text_log = True, latency = None, max_neighbors = None, source_decay = None):
 
 		gr.sync_block.__init__(
 			self,
@@ -32,16 +57,51 @@ class control_channel_sink(gr.sync_block):
 		self.s_tracking = False
 		self.logger = logger
 
-		self.osw_handler = osw_handler(self.logger, queue, group_description_csv = group_description_csv)
+		self.osw_handler = osw_handler(self.logger, queue, group_description_csv = group_description_csv, listeners = listeners, text_log = text_log, latency = latency, max_neighbors = max_neighbors, source_decay = source_decay)
+
+		# see latency.py
+		self._latency = latency
+		self.frame_time = None		# when the frame being processed was complete
 
 		self.errors = 0.0
 		self.valid = 0.0
 
+		# over the last _RATE_INTERVAL
+		self.frame_rate = 0.0
+		self.crc_error_rate = 0.0
+		self._rate_start = time.time()
+		self._rate_valid = 0.0
+		self._rate_errors = 0.0
+
+		# frames from control_channel_framer carry their symbol values
+		self.soft = None		# of the frame being processed
+		self.confidence = None		# running mean of the frames' confidence
+
+		self.chase_bits = 0			# 0: hard decisions only
+		self.corrected = 0			# frames soft_decode recovered
+		self.chase_rejected = 0			# and refused, ambiguous or too far off
+		self.chase_timeouts = 0			# and gave up on for lack of time
+
 
 	def error_rate(self):
 		return self.errors / (self.valid + self.errors)
 
 
+	def update_rates(self, now):
+		dt = now - self._rate_start
+		if dt < self._RATE_INTERVAL:
+			return
+		v = self.valid - self._rate_valid
+		e = self.errors - self._rate_errors
+		self.frame_rate = (v + e) / dt
+		self.crc_error_rate = (e / (v + e)) if (v + e) > 0 else 0.0
+		if e > 0:
+			self.logger.log("CRC: %%%d (%d of %d frames, %.1f frames/s)" % (int(100 * self.crc_error_rate), e, v + e, self.frame_rate))
+		self._rate_start = now
+		self._rate_valid = self.valid
+		self._rate_errors = self.errors
+
+
 	def list_to_uint(self, l):
 
 		r = 0
@@ -99,25 +159,113 @@ class control_channel_sink(gr.sync_block):
 		return True
 
 
+	def soft_decode(self, s, soft):
+		"""
+		Chase decoding of a frame that failed its CRC.  The chase_bits
+		least reliable of the 76 bits (smallest symbol magnitude) are tried
+		in every combination, each candidate parity decoded and its CRC
+		checked.  Candidates are tried a block at a time with numpy, and no
+		more blocks are started once _CHASE_BUDGET is spent.
+
+		With this many tries a 10 bit CRC passes on noise now and then, so
+		a candidate is only taken when it is the one frame that passes, and
+		when its encoding disagrees with what was received by no more than
+		_CHASE_MAX_DISTANCE, weighting each bit by its magnitude relative to
+		the frame's mean.  A search cut short by the budget takes nothing.
+		Returns the 38 data bits or None.
+		"""
+		start = time.time()
+
+		r = numpy.asarray(s, numpy.uint8)[DEINTERLEAVE]
+		a = numpy.abs(numpy.asarray(soft, numpy.float32))[DEINTERLEAVE]
+		m = a.mean()
+		if m <= 0:
+			return None
+		weak = numpy.argsort(a)[:self.chase_bits]
+		n = 1 << len(weak)
+
+		passed = dict()		# data bits -> distance
+		for i in range(1, n, self._CHASE_BLOCK):
+			if time.time() - start > self._CHASE_BUDGET:
+				self.chase_timeouts += 1
+				return None
+
+			# flip patterns i .. (0 is the hard decision, already tried)
+			p = numpy.arange(i, min(i + self._CHASE_BLOCK, n))
+			c = numpy.repeat(r[None, :], len(p), axis = 0)
+			c[:, weak] ^= ((p[:, None] >> numpy.arange(len(weak))) & 1).astype(numpy.uint8)
+
+			# parity_decode, each row
+			data = c[:, 0::2].copy()
+			prev = numpy.zeros_like(data)
+			prev[:, 1:] = data[:, :-1]
+			syndrome = data ^ prev ^ c[:, 1::2]
+			data[:, :-1] ^= syndrome[:, :-1] & syndrome[:, 1:]
+
+			# check_crc, each row; the CRC is sent inverted
+			crc = (CRC_INIT + data[:, :27].astype(numpy.int32).dot(CRC_TERMS)) & 1
+			ok = numpy.flatnonzero((crc == (data[:, 27:37] ^ 1)).all(axis = 1))
+			if len(ok) == 0:
+				continue
+
+			data = data[ok]
+			e = numpy.empty((len(ok), CONTROL_WORD_LEN), numpy.uint8)
+			e[:, 0::2] = data
+			e[:, 1] = data[:, 0]
+			e[:, 3::2] = data[:, 1:] ^ data[:, :-1]
+			distance = ((e != r) * a).sum(axis = 1) / m
+			for j in range(len(ok)):
+				passed[tuple(data[j].tolist())] = distance[j]
+
+		if len(passed) == 0:
+			return None
+		if len(passed) > 1 or passed.values()[0] > self._CHASE_MAX_DISTANCE:
+			self.chase_rejected += 1
+			return None
+		return list(passed.keys()[0])
+
+
 	def process_stream(self, s):
 
 		if len(s) != CONTROL_WORD_LEN:
 			print "error: process_control_word: incorrect length (%d != %d)" % (len(s), CONTROL_WORD_LEN)
 			return
 
+		self.update_rates(self.frame_time if self.frame_time is not None else time.time())
+
 		# deinterleave; extract data from parity
 		osw = self.parity_decode(self.deinterleave(s))
 
-		# check crc
+		# check crc; the error rate is logged by update_rates().  With the
+		# symbol values of the frame (control_channel_framer) a failed frame
+		# gets a second chance.
 		if not self.check_crc(osw):
-			self.errors += 1
-			self.logger.log("CRC: %%%d" % (int(100 * self.error_rate()),))
-			return
+			osw = None
+			if self.soft is not None and self.chase_bits > 0:
+				osw = self.soft_decode(s, self.soft)
+			if osw is None:
+				self.errors += 1
+				return
+			self.corrected += 1
 
 		self.valid += 1
+		if self._latency is not None:
+			self._latency.record('crc', self.frame_time)
 
 		# process
-		self.osw_handler.handle(osw)
+		self.osw_handler.handle(osw, self.frame_time)
+
+
+	def process_frame(self, bits, soft = None, confidence = None):
+		"""
+		One frame from control_channel_framer: the 76 bits after the sync
+		packed into bytes, their symbol values and the frame's confidence.
+		"""
+		self.frame_time = time.time()
+		self.soft = soft
+		if confidence is not None:
+			self.confidence = confidence if self.confidence is None else (self.confidence + (confidence - self.confidence) / 64.0)
+		self.process_stream(numpy.unpackbits(bits)[:CONTROL_WORD_LEN].tolist())
 
 
 	def work(self, input_items, output_items):
@@ -130,6 +278,7 @@ class control_channel_sink(gr.sync_block):
 				self.s_tracking = True
 			self.s += [b & 1,]
 			if len(self.s) >= CONTROL_WORD_LEN:
+				self.frame_time = time.time()
 				self.process_stream(self.s[:CONTROL_WORD_LEN])
 				self.s = self.s[CONTROL_WORD_LEN:]
 				self.s_tracking = False
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+#
+# Demodulate calls out of an iq archive written by smartzone.py --archive.
+#
+#	Either give a channel and a time range, or a group (and optionally a
+#	time range) to demodulate every logged call on that group.  Each call is
+#	run through the same audio_channel chain used live, in its own process,
+#	as fast as the CPU allows.
+#
+
+import sys
+import time
+import multiprocessing
+
+from gnuradio import gr
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+
+from audio_channel import audio_channel
+from band_plan_800 import get_freq, get_chan
+from iq_archive import archive_index, archive_source
+
+
+class archive_demod(gr.top_block):
+
+	def __init__(self, index, t0, t1, sys_id, chan, group_id, save_dir, start_time = None):
+		gr.top_block.__init__(self, "SmartZone Archive Demod")
+
+		rate = index.sample_rate(t0)
+		src = archive_source(index.pieces(t0, t1))
+		ac = audio_channel(rate, get_freq(chan) * 1e6 - index.center_freq(t0), sys_id, chan, group_id, save_dir, start_time = start_time)
+		self.connect(src, ac)
+
+
+def demod_job(args):
+
+	(archive_dir, t0, t1, sys_id, chan, group_id, save_dir) = args
+	index = archive_index(archive_dir)
+	if len(index.pieces(t0, t1)) == 0:
+		return (chan, group_id, t0, 0.0)
+
+	start = time.time()
+	tb = archive_demod(index, t0, t1, sys_id, chan, group_id, save_dir, start_time = t0)
+	tb.run()
+	return (chan, group_id, t0, (t1 - t0) / (time.time() - start))
+
+
+def merge_calls(calls):
+	"""
+	[(start, end, sys_id, chan, group_id), ...] with calls on the same
+	channel and group that overlap in time (a regrant to a new talker is
+	logged as a grant of its own) merged into one.
+	"""
+	r = list()
+	last = dict()		# (chan, group_id) -> index in r of the latest call
+	for c in sorted(calls):
+		(start, end, sys_id, chan, group_id) = c
+		i = last.get((chan, group_id))
+		if i is not None and start <= r[i][1]:
+			r[i] = (r[i][0], max(r[i][1], end), sys_id, chan, group_id)
+			continue
+		last[(chan, group_id)] = len(r)
+		r.append(c)
+	return r
+
+
+def parse_time(s):
+	"""
+	Seconds since the epoch, or local "YYYY-MM-DD HH:MM:SS".
+	"""
+	try:
+		return float(s)
+	except ValueError:
+		return time.mktime(time.strptime(s, "%Y-%m-%d %H:%M:%S"))
+
+
+def main():
+
+	parser = OptionParser(option_class = eng_option, usage = "%prog: [options] archive_dir")
+	parser.add_option("-s", "--start", type = "string", default = None, help = "Start of the time range (epoch seconds or \"YYYY-MM-DD HH:MM:SS\").")
+	parser.add_option("-e", "--end", type = "string", default = None, help = "End of the time range.")
+	parser.add_option("-C", "--channel", type = "float", default = None, help = "Channel frequency in MHz to demodulate over the whole time range.")
+	parser.add_option("-g", "--group", type = "string", default = None, help = "Demodulate every logged call on this group (hex).")
+	parser.add_option("-p", "--pre", type = "float", default = 0.5, help = "Seconds before each grant to include. [default = %default]")
+	parser.add_option("-m", "--max-call", type = "float", default = 60.0, help = "Longest call to demodulate, in seconds. [default = %default]")
+	parser.add_option("-j", "--jobs", type = "int", default = multiprocessing.cpu_count(), help = "Calls to demodulate in parallel. [default = %default]")
+	parser.add_option("-o", "--output", type = "string", default = "./zonelog", help = "Directory to write audio into. [default = %default]")
+	(options, args) = parser.parse_args()
+
+	if len(args) != 1:
+		parser.print_help()
+		return 1
+	archive_dir = args[0]
+
+	index = archive_index(archive_dir)
+	t0 = parse_time(options.start) if options.start is not None else 0.0
+	t1 = parse_time(options.end) if options.end is not None else time.time()
+
+	jobs = list()
+	if options.channel is not None:
+		chan = get_chan(options.channel)
+		sys_id = 0
+		group_id = 0
+		g = index.grants(t0, t1, chan = chan)
+		if len(g) > 0:
+			sys_id = g[0][1]
+			group_id = g[0][3]
+		jobs.append((archive_dir, t0, t1, sys_id, chan, group_id, options.output))
+	elif options.group is not None:
+		calls = [(g[0] - options.pre, index.call_end(g, options.max_call), g[1], g[2], g[3]) for g in index.grants(t0, t1, group_id = int(options.group, 16))]
+		for (start, end, sys_id, chan, group_id) in merge_calls(calls):
+			jobs.append((archive_dir, start, end, sys_id, chan, group_id, options.output))
+	else:
+		parser.print_help()
+		return 1
+
+	pool = multiprocessing.Pool(options.jobs)
+	for (chan, group_id, start, rtf) in pool.imap_unordered(demod_job, jobs):
+		print "%s: group %x, freq %f: %.1fx real time" % (time.asctime(time.localtime(start)), group_id, get_freq(chan), rtf)
+	pool.close()
+	pool.join()
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+#
+# Structured event log.
+#
+#	Every event osw_handler emits (see osw_handler.emit()) is kept as one
+#	JSON object per line, with its kind in 'kind'.  The fixed-width text log
+#	is just one way of looking at the 'log' records (see log_format).
+#
+#	Records are written a chunk at a time.  For each chunk a line is added
+#	to the index file:
+#
+#		{"offset": <byte offset of the chunk>, "length": <bytes>, "count": <records>,
+#		 "start": <earliest time>, "end": <latest time>,
+#		 "sparse": [[<time>, <byte offset within the chunk>], ...]}
+#
+#	with a sparse entry every _SPARSE_EVERY records, so a reader can go
+#	straight to the chunks, and the place within a chunk, that it needs.
+#
+#		<dir>/events.jsonl	records
+#		<dir>/events.idx	chunk index
+#
+
+import os
+import sys
+import json
+import time
+import Queue
+import threading
+from optparse import OptionParser
+
+from alias_table import read_aliases
+from log_format import render_record
+
+
+DATA_FILE	= "events.jsonl"
+INDEX_FILE	= "events.idx"
+
+
+class event_log:
+
+	_CHUNK_RECORDS	= 256
+	_CHUNK_SECONDS	= 5.0		# longest a record waits to be written
+	_SPARSE_EVERY	= 32
+
+	def __init__(self, log_dir, max_queue = 100000):
+
+		if not os.path.isdir(log_dir):
+			os.makedirs(log_dir)
+		self._data = open(os.path.join(log_dir, DATA_FILE), "ab")
+		self._index = open(os.path.join(log_dir, INDEX_FILE), "a")
+
+		self._queue = Queue.Queue(max_queue)
+		self.dropped = 0
+		self.written = 0
+
+		self._writer = threading.Thread(target = self.writer)
+		self._writer.daemon = True
+		self._writer.start()
+
+
+	def __call__(self, kind, fields):
+		"""
+		osw_handler listener; never blocks.
+		"""
+		try:
+			self._queue.put_nowait((kind, fields))
+		except Queue.Full:
+			self.dropped += 1
+
+
+	def depth(self):
+		return self._queue.qsize()
+
+
+	def write_chunk(self, chunk):
+		offset = self._data.tell()
+		lines = list()
+		sparse = list()
+		pos = 0
+		start = end = None
+		for (kind, fields) in chunk:
+			r = dict((k, v) for (k, v) in fields.iteritems() if v is not None)
+			r['kind'] = kind
+			t = r['time']
+			if len(lines) % self._SPARSE_EVERY == 0:
+				sparse.append([t, pos])
+			start = t if start is None else min(start, t)
+			end = t if end is None else max(end, t)
+			l = json.dumps(r, separators = (',', ':')) + "\n"
+			lines.append(l)
+			pos += len(l)
+
+		self._data.write("".join(lines))
+		self._data.flush()
+		self._index.write(json.dumps({'offset': offset, 'length': pos, 'count': len(lines), 'start': start, 'end': end, 'sparse': sparse}, separators = (',', ':')) + "\n")
+		self._index.flush()
+		self.written += len(lines)
+
+
+	def writer(self):
+		while True:
+			chunk = [self._queue.get(),]
+			if chunk[0] is None:
+				break
+			deadline = time.time() + self._CHUNK_SECONDS
+			while len(chunk) < self._CHUNK_RECORDS:
+				try:
+					r = self._queue.get(True, max(deadline - time.time(), 0))
+				except Queue.Empty:
+					break
+				if r is None:
+					self._queue.put(None)
+					break
+				chunk.append(r)
+			self.write_chunk(chunk)
+
+
+	def close(self):
+		"""
+		Write out everything queued so far and stop the writer.
+		"""
+		self._queue.put(None)
+		self._writer.join()
+		self._data.close()
+		self._index.close()
+
+
+class event_reader:
+
+	def __init__(self, log_dir):
+
+		self._data_path = os.path.join(log_dir, DATA_FILE)
+		self._chunks = list()
+		p = os.path.join(log_dir, INDEX_FILE)
+		if os.path.exists(p):
+			with open(p, "r") as f:
+				for l in f:
+					try:
+						self._chunks.append(json.loads(l))
+					except ValueError:
+						break		# partly written last line
+
+
+	def chunks(self):
+		return list(self._chunks)
+
+
+	def _read(self, f, offset, length, t0, t1, kinds):
+		f.seek(offset)
+		data = f.read(length) if length is not None else f.read()
+		for l in data.splitlines():
+			try:
+				r = json.loads(l)
+			except ValueError:
+				continue
+			if (t0 is not None) and (r['time'] < t0):
+				continue
+			if (t1 is not None) and (r['time'] >= t1):
+				continue
+			if (kinds is not None) and (r['kind'] not in kinds):
+				continue
+			yield r
+
+
+	def records(self, t0 = None, t1 = None, kinds = None):
+		"""
+		Yield the records with t0 <= time < t1, optionally only those whose
+		kind is in kinds.  Only the chunks that overlap the range are read.
+		"""
+
+		with open(self._data_path, "rb") as f:
+			for c in self._chunks:
+				if (t0 is not None) and (c['end'] < t0):
+					continue
+				if (t1 is not None) and (c['start'] >= t1):
+					continue
+
+				# skip to the last sparse point at or before t0
+				skip = 0
+				if t0 is not None:
+					for (t, pos) in c['sparse']:
+						if t > t0:
+							break
+						skip = pos
+				for r in self._read(f, c['offset'] + skip, c['length'] - skip, t0, t1, kinds):
+					yield r
+
+			# records written after the last indexed chunk (a crash, or still being written)
+			tail = (self._chunks[-1]['offset'] + self._chunks[-1]['length']) if len(self._chunks) > 0 else 0
+			for r in self._read(f, tail, None, t0, t1, kinds):
+				yield r
+
+
+def main():
+
+	parser = OptionParser(usage = "%prog: [options] log_dir")
+	parser.add_option("-s", "--start", type = "float", default = None, help = "Start time (epoch seconds).")
+	parser.add_option("-e", "--end", type = "float", default = None, help = "End time (epoch seconds).")
+	parser.add_option("-k", "--kind", type = "string", action = "append", default = None, help = "Only records of this kind (may be repeated).")
+	parser.add_option("-t", "--text", action = "store_true", default = False, help = "Render 'log' records as the text log.")
+	parser.add_option("-g", "--groups", type = "string", default = None, help = "Group description csv for alpha tags in the text view.")
+	(options, args) = parser.parse_args()
+
+	if len(args) != 1:
+		parser.print_help()
+		return 1
+
+	alpha_tag = None
+	if options.groups is not None:
+		alpha_tag = read_aliases(options.groups).get
+
+	kinds = options.kind
+	if options.text:
+		kinds = ['log',]
+
+	for r in event_reader(args[0]).records(options.start, options.end, kinds):
+		if options.text:
+			print "%s:   %s" % (time.asctime(time.localtime(r['time'])), render_record(r, alpha_tag))
+		else:
+			print json.dumps(r, separators = (',', ':'))
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
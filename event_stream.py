@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+#
+# Live event stream for local consumers.
+#
+#	An event_publisher is an osw_handler listener that passes every event on
+#	to whoever is connected to a Unix socket (or a TCP port, for "host:port"
+#	addresses).  Each event is sent as a frame:
+#
+#		<4 byte big-endian length><compact JSON object, with its kind in 'kind'>
+#
+#	The kinds of interest downstream are 'grant', 'affiliation',
+#	'unaffiliation', 'call_end', 'site_status', 'sys_id' and 'neighbor'; see
+#	osw_handler for their fields.
+#
+#	The decoder never waits on a subscriber.  Events are handed to the
+#	publisher thread through a bounded queue, each event is encoded once, and
+#	every subscriber has its own bounded backlog.  When a subscriber falls
+#	too far behind its oldest frames are dropped and, once it catches up, it
+#	is sent a 'dropped' event with the number it missed.
+#
+#	The publisher thread runs an asyncore loop over the listening socket and
+#	the subscribers.
+#
+
+import os
+import sys
+import json
+import time
+import errno
+import Queue
+import socket
+import struct
+import asyncore
+import threading
+from collections import deque
+from optparse import OptionParser
+
+
+HEADER		= struct.Struct(">I")
+
+
+def encode(kind, fields):
+	r = dict((k, v) for (k, v) in fields.iteritems() if v is not None)
+	r['kind'] = kind
+	payload = json.dumps(r, separators = (',', ':'))
+	return HEADER.pack(len(payload)) + payload
+
+
+def parse_address(address):
+	"""
+	(family, address) for a Unix socket path or "host:port".
+	"""
+	if ":" in address and not "/" in address:
+		(host, port) = address.rsplit(":", 1)
+		return (socket.AF_INET, (host, int(port)))
+	return (socket.AF_UNIX, address)
+
+
+class _subscriber(asyncore.dispatcher):
+
+	def __init__(self, sock, publisher, max_frames):
+		asyncore.dispatcher.__init__(self, sock, map = publisher._map)
+		self._publisher = publisher
+		self._frames = deque()
+		self._max_frames = max_frames
+		self._out = ""
+		self.dropped = 0		# since the last 'dropped' event
+		self.sent = 0
+
+
+	def push(self, frame):
+		if len(self._frames) >= self._max_frames:
+			self._frames.popleft()
+			self.dropped += 1
+			self._publisher.dropped_frames += 1
+		self._frames.append(frame)
+
+
+	def writable(self):
+		return len(self._out) > 0 or len(self._frames) > 0
+
+
+	def readable(self):
+		return True
+
+
+	def handle_read(self):
+		# nothing is expected from subscribers; this is only to notice them going away
+		if len(self.recv(4096)) == 0:
+			self.close()
+
+
+	def handle_write(self):
+		if len(self._out) == 0:
+			if self.dropped > 0 and len(self._frames) < self._max_frames / 2:
+				self._out = encode('dropped', {'time': time.time(), 'count': self.dropped})
+				self.dropped = 0
+			else:
+				frames = list()
+				size = 0
+				while len(self._frames) > 0 and size < 65536:
+					f = self._frames.popleft()
+					frames.append(f)
+					size += len(f)
+				self.sent += len(frames)
+				self._out = "".join(frames)
+
+		try:
+			n = self.send(self._out)
+		except socket.error, e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return
+			self.close()
+			return
+		self._out = self._out[n:]
+
+
+	def handle_close(self):
+		self.close()
+
+
+	def handle_error(self):
+		self.close()
+
+
+	def close(self):
+		self._publisher._subscribers.discard(self)
+		asyncore.dispatcher.close(self)
+
+
+class _server(asyncore.dispatcher):
+
+	def __init__(self, address, publisher):
+		asyncore.dispatcher.__init__(self, map = publisher._map)
+		self._publisher = publisher
+		(family, addr) = parse_address(address)
+		if family == socket.AF_UNIX and os.path.exists(addr):
+			os.unlink(addr)		# left over from an earlier run
+		self.create_socket(family, socket.SOCK_STREAM)
+		if family != socket.AF_UNIX:
+			self.set_reuse_addr()
+		self.bind(addr)
+		self.listen(8)
+		self.address = addr
+
+
+	def writable(self):
+		return False
+
+
+	def handle_accept(self):
+		r = self.accept()
+		if r is None:
+			return
+		s = _subscriber(r[0], self._publisher, self._publisher._max_frames)
+		self._publisher._subscribers.add(s)
+
+
+class event_publisher:
+
+	_POLL = 0.02			# longest an event waits in the queue
+
+	def __init__(self, address, max_queue = 10000, max_frames = 10000):
+
+		self._map = dict()
+		self._subscribers = set()
+		self._max_frames = max_frames
+		self._server = _server(address, self)
+
+		self._queue = Queue.Queue(max_queue)
+		self.dropped = 0		# events the publisher thread could not keep up with
+		self.dropped_frames = 0		# frames dropped for slow subscribers
+		self.published = 0
+		self._running = True
+
+		self._thread = threading.Thread(target = self.run)
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def __call__(self, kind, fields):
+		"""
+		osw_handler listener; never blocks.
+		"""
+		try:
+			self._queue.put_nowait((kind, fields))
+		except Queue.Full:
+			self.dropped += 1
+
+
+	def depth(self):
+		return self._queue.qsize()
+
+
+	def subscribers(self):
+		return len(self._subscribers)
+
+
+	def run(self):
+		while self._running:
+			asyncore.loop(timeout = self._POLL, map = self._map, count = 1)
+			while True:
+				try:
+					(kind, fields) = self._queue.get_nowait()
+				except Queue.Empty:
+					break
+				if len(self._subscribers) == 0:
+					continue
+				frame = encode(kind, fields)
+				for s in list(self._subscribers):
+					s.push(frame)
+				self.published += 1
+
+		for s in list(self._subscribers):
+			s.close()
+		self._server.close()
+		if isinstance(self._server.address, str):
+			try:
+				os.unlink(self._server.address)
+			except OSError:
+				pass
+
+
+	def close(self):
+		self._running = False
+		self._thread.join()
+
+
+def subscribe(address):
+	"""
+	Connect to a publisher and yield its events as dicts.
+	"""
+	(family, addr) = parse_address(address)
+	s = socket.socket(family, socket.SOCK_STREAM)
+	s.connect(addr)
+	buf = ""
+	try:
+		while True:
+			d = s.recv(65536)
+			if len(d) == 0:
+				return
+			buf += d
+			pos = 0
+			while len(buf) - pos >= HEADER.size:
+				(n,) = HEADER.unpack_from(buf, pos)
+				if len(buf) - pos - HEADER.size < n:
+					break
+				yield json.loads(buf[pos + HEADER.size:pos + HEADER.size + n])
+				pos += HEADER.size + n
+			buf = buf[pos:]
+	finally:
+		s.close()
+
+
+def main():
+
+	parser = OptionParser(usage = "%prog: [options] address")
+	parser.add_option("-k", "--kind", type = "string", action = "append", default = None, help = "Only events of this kind (may be repeated).")
+	(options, args) = parser.parse_args()
+
+	if len(args) != 1:
+		parser.print_help()
+		return 1
+
+	try:
+		for r in subscribe(args[0]):
+			if options.kind is None or r['kind'] in options.kind:
+				print json.dumps(r, separators = (',', ':'))
+				sys.stdout.flush()
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
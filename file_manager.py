@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+#
+# Where recordings go, and getting their files ready ahead of time.
+#
+#	Recordings are kept in a day/hour hierarchy so no directory gets too
+#	big:
+#
+#		<save_dir>/<sys_id>/<YYYYMMDD>/<HH>/<call name>
+#
+#	Directories that are known to exist are remembered, and a helper thread
+#	creates the next hour's directories before they are needed.
+#
+#	The helper thread also keeps a few wavfile_sink blocks opened on spare
+#	files for each system.  A new call takes one of those, so no file is
+#	created while the flow graph is stopped; the spare file gets its real
+#	name when the call is closed.
+#
+
+import os
+import time
+import errno
+import itertools
+import threading
+
+from gnuradio import blocks
+
+
+SPARE_PREFIX	= ".spare-"
+
+
+class recorder_files:
+
+	_REFILL_INTERVAL = 1.0
+
+	def __init__(self, save_dir, spares = 4, bits_per_sample = 8):
+		self._save_dir = save_dir
+		self._spares_wanted = spares
+		self._bits = bits_per_sample
+
+		self._known = set()			# directories known to exist
+		self._spares = dict()			# (sys_id, rate) -> [(path, wavfile_sink), ...]
+		self._lock = threading.Lock()
+		self._counter = itertools.count()
+		self._closed = False
+
+		self._helper = threading.Thread(target = self.helper)
+		self._helper.daemon = True
+		self._helper.start()
+
+
+	def directory(self, sys_id, t = None):
+		"""
+		The directory for recordings of sys_id made at time t; it is created
+		if it is not known to exist.
+		"""
+
+		d = "%s/%x/%s" % (self._save_dir, sys_id, time.strftime("%Y%m%d/%H", time.localtime(t)))
+		if d in self._known:
+			return d
+		try:
+			os.makedirs(d)
+		except OSError, e:
+			if e.errno != errno.EEXIST:
+				raise
+		self._known.add(d)
+		return d
+
+
+	def path(self, sys_id, name, t = None):
+		return "%s/%s" % (self.directory(sys_id, t), name)
+
+
+	def _new_spare(self, sys_id, rate):
+		path = "%s/%s%d-%d" % (self.directory(sys_id), SPARE_PREFIX, os.getpid(), self._counter.next())
+		return (path, blocks.wavfile_sink(path, 1, rate, self._bits))
+
+
+	def wav_sink(self, sys_id, rate):
+		"""
+		Return (spare path, wavfile_sink) for a new recording.  Pass the spare
+		path to finish() when the recording is closed.
+		"""
+
+		key = (sys_id, rate)
+		self._lock.acquire()
+		pool = self._spares.setdefault(key, list())
+		s = pool.pop() if len(pool) > 0 else None
+		self._lock.release()
+
+		if s is None:
+			# the first call on a system, or we are taking them faster than the helper makes them
+			s = self._new_spare(sys_id, rate)
+		return s
+
+
+	def finish(self, spare_path, final_path):
+		"""
+		Give a closed recording its real name.
+		"""
+		os.rename(spare_path, final_path)
+
+
+	def helper(self):
+		while not self._closed:
+			self._lock.acquire()
+			keys = self._spares.keys()
+			self._lock.release()
+
+			for (sys_id, rate) in keys:
+				# next hour's directory, before anyone waits on it
+				self.directory(sys_id, time.time() + 3600)
+
+				while True:
+					self._lock.acquire()
+					n = len(self._spares[(sys_id, rate)])
+					self._lock.release()
+					if n >= self._spares_wanted:
+						break
+					s = self._new_spare(sys_id, rate)
+					self._lock.acquire()
+					if self._closed:
+						# made while close() ran; nobody will take it
+						self._lock.release()
+						self._remove_spare(s)
+						return
+					self._spares[(sys_id, rate)].append(s)
+					self._lock.release()
+
+			time.sleep(self._REFILL_INTERVAL)
+
+
+	def _remove_spare(self, s):
+		(path, sink) = s
+		sink.close()
+		try:
+			os.unlink(path)
+		except OSError:
+			pass
+
+
+	def close(self):
+		"""
+		Stop making spares and remove the spare files that were never used.
+		"""
+		self._lock.acquire()
+		self._closed = True
+		spares = [s for pool in self._spares.values() for s in pool]
+		for pool in self._spares.values():
+			del pool[:]
+		self._lock.release()
+
+		for s in spares:
+			self._remove_spare(s)
+
+
+# vim:ts=8:nowrap
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+#
+# Grants from the control channel through smartzone's message receiver.
+# Every grant must reach the archive's grant log and get an audio channel,
+# not just the first.
+#
+
+import time
+import threading
+
+from gnuradio import gr
+
+from smartzone import smartzone
+from message_handler import message_handler
+from latency import latency_tracker
+
+
+class grant_log:
+	"""
+	Stands in for iq_archive.
+	"""
+
+	def __init__(self):
+		self.grants = list()
+
+
+	def log_grant(self, args, t):
+		self.grants.append(args)
+
+
+def main():
+	failed = 0
+
+	# only what message_receiver uses; no flow graph
+	sz = smartzone.__new__(smartzone)
+	sz._cc_msg_q = gr.msg_queue(0)
+	sz._latency = latency_tracker()
+	sz._archive = grant_log()
+	sz._archive_only = False
+	sz._supervisor = None
+	added = list()
+	sz.audio_channel_add = lambda args, grant_time = None, frame_time = None: added.append(args)
+
+	sz._receiving = True
+	sz._message_receiver = threading.Thread(target = sz.message_receiver)
+	sz._message_receiver.start()
+
+	try:
+		mh = message_handler(sz._cc_msg_q)
+		mh.set_sysid(0x1234, 0x100)
+		mh.start_call(0x2a50, 0x10, 101)
+		mh.start_call(0x2a60, 0x20, 102, is_group = 0)
+
+		end = time.time() + 5.0
+		while len(added) < 2 and time.time() < end:
+			time.sleep(0.01)
+	finally:
+		sz._receiving = False
+		sz._message_receiver.join()
+
+	want = [[0x1234, 0x10, 0x2a50, 101, 1], [0x1234, 0x20, 0x2a60, 102, 0]]
+	if added != want:
+		print "audio channels added for %s, expected %s" % (added, want)
+		failed += 1
+	if sz._archive.grants != want:
+		print "grants logged %s, expected %s" % (sz._archive.grants, want)
+		failed += 1
+	if sz._message_receiver.is_alive():
+		print "message receiver still running"
+		failed += 1
+
+	return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+	exit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+#
+# Wideband IQ archive.
+#
+#	The stream from the USRP is written to a directory of raw fc32 segment
+#	files, one every segment_seconds of samples, so that any call can be
+#	demodulated later.  Alongside the segments are two text files:
+#
+#		index.txt	"<start time> <sample rate> <center freq> <segment file>"
+#				one line per segment
+#		grants.txt	"<time> <sys_id> <chan> <group_id> <radio_id>"
+#				one line per grant sent by the control channel
+#
+#	Each segment holds samples without a break, so its start time gives the
+#	time of every sample in it (see archive_writer); a gap in the stream
+#	falls between segments.  Segments are plain complex64 arrays and are
+#	read back with numpy.memmap.
+#
+
+import os
+import time
+import bisect
+import threading
+import numpy
+import pmt
+
+from gnuradio import gr
+
+
+INDEX_FILE	= "index.txt"
+GRANTS_FILE	= "grants.txt"
+
+SAMPLE_SIZE	= numpy.dtype(numpy.complex64).itemsize
+
+
+class archive_writer(gr.sync_block):
+	"""
+	Writes the stream into segment files and the index.
+
+	A segment is started when the stream starts, every segment_seconds of
+	samples, and wherever the stream is broken: at an rx_time tag (the USRP
+	tags the first sample after a start or an overflow) or when samples
+	arrive later than their count says they should (a flow graph restart).
+	Each segment is therefore continuous, and its start time, taken from
+	the clock when its first sample arrives, holds for every sample in it.
+	"""
+
+	_GAP = 0.25		# seconds of lateness taken to be a break in the stream
+
+	def __init__(self, archive_dir, sample_rate, center_freq, segment_seconds):
+
+		gr.sync_block.__init__(
+			self,
+			name = "IQ Archive Writer",
+			in_sig = [numpy.complex64],
+			out_sig = None
+		)
+
+		self._dir = archive_dir
+		self._sample_rate = float(sample_rate)
+		self._center_freq = center_freq
+		self._segment_samples = max(int(segment_seconds * sample_rate), 1)
+
+		self._index = open(os.path.join(archive_dir, INDEX_FILE), "a")
+		self._rx_time = pmt.intern("rx_time")
+
+		self._f = None			# open segment
+		self._start = 0.0		# time of its first sample
+		self._count = 0			# samples in it
+		self._next = None		# start of the segment following a full one
+
+		self.breaks = 0			# segments started for a break in the stream
+
+
+	def _open(self, t):
+		self._close()
+		name = "%.6f.cfile" % (t,)
+		self._f = open(os.path.join(self._dir, name), "wb")
+		self._start = t
+		self._count = 0
+		self._index.write("%.6f %f %f %s\n" % (t, self._sample_rate, self._center_freq, name))
+		self._index.flush()
+
+
+	def _close(self):
+		if self._f is not None:
+			self._f.close()
+			self._f = None
+		self._next = None
+
+
+	def close(self):
+		self._close()
+		self._index.close()
+
+
+	def work(self, input_items, output_items):
+
+		x = input_items[0]
+		n = len(x)
+		now = time.time()
+		first = self.nitems_read(0)
+
+		# where this buffer must be cut: tags, then segment boundaries
+		breaks = sorted(set([t.offset - first for t in self.get_tags_in_window(0, 0, n, self._rx_time)]))
+
+		# the buffer ends about now; its first sample came n samples earlier
+		t0 = now - n / self._sample_rate
+		expected = self._next if self._next is not None else self._start + self._count / self._sample_rate
+		if (self._f is not None or self._next is not None) and t0 - expected > self._GAP:
+			self.breaks += 1
+			self._close()
+
+		i = 0
+		while i < n:
+			if len(breaks) > 0 and breaks[0] == i:
+				breaks.pop(0)
+				if self._f is not None or self._next is not None:
+					self.breaks += 1
+					self._close()
+			if self._f is None:
+				self._open(self._next if self._next is not None else t0 + i / self._sample_rate)
+			j = min(n, i + self._segment_samples - self._count)
+			if len(breaks) > 0:
+				j = min(j, breaks[0])
+			x[i:j].tofile(self._f)
+			self._count += j - i
+			if self._count >= self._segment_samples:
+				t = self._start + self._count / self._sample_rate
+				self._close()
+				self._next = t
+			i = j
+
+		return n
+
+
+class iq_archive(gr.hier_block2):
+
+	def __init__(self, archive_dir, sample_rate, center_freq, segment_seconds = 60.0):
+
+		gr.hier_block2.__init__(
+			self,
+			"SmartZone IQ Archive",
+			gr.io_signature(1, 1, gr.sizeof_gr_complex),		# input signature
+			gr.io_signature(0, 0, 0)				# output signature
+		)
+
+		if not os.path.isdir(archive_dir):
+			os.makedirs(archive_dir)
+
+		self._grants = open(os.path.join(archive_dir, GRANTS_FILE), "a")
+		self._grants_lock = threading.Lock()
+
+		self._writer = archive_writer(archive_dir, sample_rate, center_freq, segment_seconds)
+		self.connect(self, self._writer)
+
+
+	def close(self):
+		self._writer.close()
+		self._grants.close()
+
+
+	def log_grant(self, args, grant_time):
+		(sys_id, chan, group_id, radio_id) = args[:4]
+		self._grants_lock.acquire()
+		self._grants.write("%.6f %d %d %d %d\n" % (grant_time, sys_id, chan, group_id, radio_id))
+		self._grants.flush()
+		self._grants_lock.release()
+
+
+class archive_index:
+	"""
+	Read side of an archive directory.
+	"""
+
+	def __init__(self, archive_dir):
+
+		self._dir = archive_dir
+
+		self._segments = list()		# [start, sample_rate, center_freq, path]
+		with open(os.path.join(archive_dir, INDEX_FILE), "r") as f:
+			for l in f:
+				r = l.split()
+				if len(r) != 4:
+					continue
+				self._segments.append([float(r[0]), float(r[1]), float(r[2]), os.path.join(archive_dir, r[3])])
+		self._segments.sort()
+		self._starts = [s[0] for s in self._segments]
+
+		self._grants = list()		# (time, sys_id, chan, group_id, radio_id)
+		p = os.path.join(archive_dir, GRANTS_FILE)
+		if os.path.exists(p):
+			with open(p, "r") as f:
+				for l in f:
+					r = l.split()
+					if len(r) != 5:
+						continue
+					self._grants.append((float(r[0]),) + tuple(map(int, r[1:])))
+		self._grants.sort()
+
+
+	def segment_length(self, i):
+		return os.path.getsize(self._segments[i][3]) / SAMPLE_SIZE
+
+
+	def sample_rate(self, t):
+		return self._segments[max(bisect.bisect_right(self._starts, t) - 1, 0)][1]
+
+
+	def center_freq(self, t):
+		return self._segments[max(bisect.bisect_right(self._starts, t) - 1, 0)][2]
+
+
+	def locate(self, t):
+		"""
+		Return (segment path, sample offset) of the sample at time t, or None
+		if t is not in the archive.
+		"""
+
+		i = bisect.bisect_right(self._starts, t) - 1
+		if i < 0:
+			return None
+		(start, rate, center, path) = self._segments[i]
+		offset = int((t - start) * rate)
+		if offset >= self.segment_length(i):
+			return None
+		return (path, offset)
+
+
+	def pieces(self, t0, t1):
+		"""
+		Return the [(path, offset, count), ...] that together hold [t0, t1).
+		"""
+
+		r = list()
+		i = max(bisect.bisect_right(self._starts, t0) - 1, 0)
+		while i < len(self._segments):
+			(start, rate, center, path) = self._segments[i]
+			if start >= t1:
+				break
+			n = self.segment_length(i)
+			a = max(int((t0 - start) * rate), 0)
+			b = min(int((t1 - start) * rate), n)
+			if a < b:
+				r.append((path, a, b - a))
+			i += 1
+		return r
+
+
+	def grants(self, t0, t1, group_id = None, chan = None):
+		r = list()
+		for g in self._grants[bisect.bisect_left(self._grants, (t0,)):]:
+			if g[0] >= t1:
+				break
+			if (group_id is not None) and (g[3] != group_id):
+				continue
+			if (chan is not None) and (g[2] != chan):
+				continue
+			r.append(g)
+		return r
+
+
+	def call_end(self, grant, max_len):
+		"""
+		Calls are logged when they start, not when they end.  A call is taken
+		to last until the channel is granted to someone else, or max_len.
+		"""
+
+		(t, sys_id, chan, group_id, radio_id) = grant
+		for g in self.grants(t, t + max_len, chan = chan):
+			if g[3] != group_id:
+				return g[0]
+		return t + max_len
+
+
+class archive_source(gr.sync_block):
+	"""
+	Play back [(path, offset, count), ...] from memory-mapped segments.
+	"""
+
+	def __init__(self, pieces):
+
+		gr.sync_block.__init__(
+			self,
+			name = "IQ Archive Source",
+			in_sig = None,
+			out_sig = [numpy.complex64]
+		)
+
+		self._pieces = list(pieces)
+		self._current = None
+
+
+	def work(self, input_items, output_items):
+
+		out = output_items[0]
+		while self._current is None or len(self._current) == 0:
+			if len(self._pieces) == 0:
+				return -1	# WORK_DONE
+			(path, offset, count) = self._pieces.pop(0)
+			self._current = numpy.memmap(path, numpy.complex64, "r", offset * SAMPLE_SIZE, (count,))
+
+		n = min(len(out), len(self._current))
+		out[:n] = self._current[:n]
+		self._current = self._current[n:]
+		return n
+
+
+# vim:ts=8:nowrap
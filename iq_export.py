@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+#
+# Per-call export of the channelized (decimated) IQ of an audio channel.
+#
+#	A call at the ~40kS/s channel rate is tiny next to the wideband stream,
+#	and quantized to 16 or 8 bits it is smaller still.  The files can be
+#	demodulated again later (see load_iq_export()).
+#
+#	File layout (little endian):
+#
+#		header:	"SZIQ"	magic
+#			uint8	version (1)
+#			uint8	bits per component (8 or 16)
+#			uint16	reserved
+#			float64	sample rate
+#			float64	time of the first sample
+#
+#		chunks:	uint32	number of complex samples n
+#			float32	scale; sample = scale * (i + 1j * q)
+#			n * 2 * (int8 | int16) interleaved i, q
+#
+#	Each chunk carries its own scale so that no gain setting is needed.
+#
+
+import struct
+import numpy
+from gnuradio import gr
+
+
+IQ_EXPORT_MAGIC		= "SZIQ"
+IQ_EXPORT_VERSION	= 1
+
+IQ_EXPORT_HEADER	= struct.Struct("<4sBBHdd")
+IQ_EXPORT_CHUNK		= struct.Struct("<If")
+
+IQ_EXPORT_FORMATS	= {
+	'int8':		(8, numpy.int8, 127.0),
+	'int16':	(16, numpy.int16, 32767.0),
+}
+
+IQ_EXPORT_EXTENSION	= {
+	'int8':		".iq8",
+	'int16':	".iq16",
+}
+
+
+def quantize(x, fmt):
+	"""
+	Return (scale, interleaved integer array) for the complex samples x.
+	"""
+
+	(bits, dtype, full_scale) = IQ_EXPORT_FORMATS[fmt]
+	f = x.view(numpy.float32)
+	peak = float(numpy.max(numpy.abs(f))) if len(f) > 0 else 0.0
+	scale = (peak / full_scale) if peak > 0.0 else 1.0
+	return (scale, numpy.round(f / scale).astype(dtype))
+
+
+def load_iq_export(path):
+	"""
+	Read an exported file.  Returns (sample_rate, start_time, complex64 samples).
+	"""
+
+	with open(path, "rb") as f:
+		(magic, version, bits, reserved, sample_rate, start_time) = IQ_EXPORT_HEADER.unpack(f.read(IQ_EXPORT_HEADER.size))
+		if magic != IQ_EXPORT_MAGIC or version != IQ_EXPORT_VERSION:
+			raise ValueError("%s: not an iq export file" % (path,))
+		dtype = numpy.int8 if bits == 8 else numpy.int16
+
+		chunks = list()
+		while True:
+			h = f.read(IQ_EXPORT_CHUNK.size)
+			if len(h) < IQ_EXPORT_CHUNK.size:
+				break
+			(n, scale) = IQ_EXPORT_CHUNK.unpack(h)
+			q = numpy.fromfile(f, dtype, 2 * n)
+			if len(q) < 2 * n:
+				break		# truncated at the end of a recording
+			chunks.append((q.astype(numpy.float32) * scale).view(numpy.complex64))
+
+	if len(chunks) == 0:
+		return (sample_rate, start_time, numpy.zeros(0, numpy.complex64))
+	return (sample_rate, start_time, numpy.concatenate(chunks))
+
+
+class iq_export_sink(gr.sync_block):
+
+	def __init__(self, filename, sample_rate, fmt = 'int16', start_time = 0.0):
+
+		gr.sync_block.__init__(
+			self,
+			name = "SmartZone IQ Export Sink",
+			in_sig = [numpy.complex64],
+			out_sig = None
+		)
+
+		if fmt not in IQ_EXPORT_FORMATS:
+			raise ValueError("unknown iq export format: %s" % (fmt,))
+		self._fmt = fmt
+
+		self._f = open(filename, "wb")
+		self._f.write(IQ_EXPORT_HEADER.pack(IQ_EXPORT_MAGIC, IQ_EXPORT_VERSION, IQ_EXPORT_FORMATS[fmt][0], 0, sample_rate, start_time))
+
+
+	def stop(self):
+		# the flow graph is stopped and restarted whenever a channel is added
+		self._f.flush()
+		return True
+
+
+	def close(self):
+		self._f.close()
+
+
+	def work(self, input_items, output_items):
+
+		x = input_items[0]
+		(scale, q) = quantize(x, self._fmt)
+		self._f.write(IQ_EXPORT_CHUNK.pack(len(x), scale))
+		q.tofile(self._f)
+		return len(x)
+
+
+# vim:ts=8:nowrap
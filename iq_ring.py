@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+#
+# Shared-memory ring buffer of wideband IQ samples.
+#
+#	One writer (the process that owns the USRP) copies each block of fc32
+#	samples into a memory-mapped file once.  Any number of readers, in any
+#	process, map the same file and get numpy views of the samples without
+#	copying them again.
+#
+#	Layout of the mapped file:
+#
+#		[0, HEADER_LEN)			header, an array of 64-bit words
+#		[HEADER_LEN, ...)		capacity complex64 samples
+#
+#	Header words:
+#		H_MAGIC			RING_MAGIC
+#		H_CAPACITY		number of samples in the ring
+#		H_MAX_READERS		number of reader slots
+#		H_WRITE_COUNT		total samples ever written
+#		H_SAMPLE_RATE		(float) sample rate of the stream
+#		H_WRITE_TIME		(float) time.time() of the sample at H_WRITE_COUNT
+#		H_CENTER_FREQ		(float) center frequency of the stream
+#		H_WRITE_CLAIM		write count once the write in progress is done
+#
+#	Each reader owns a slot of R_SLOT_LEN words starting at R_BASE:
+#		R_ACTIVE		non-zero when the slot is in use
+#		R_CURSOR		index of the next sample the reader wants
+#		R_OVERRUNS		number of times the writer lapped the reader
+#		R_DROPPED		number of samples lost to overruns
+#
+#	The writer stores the samples before it publishes the new write count,
+#	so a reader never sees samples that are not there yet.  Before it
+#	stores anything it raises H_WRITE_CLAIM to the count the write will
+#	reach, so a reader that checks valid() after copying its samples also
+#	notices a write still in progress that overwrote them.  A reader that
+#	falls more than the ring capacity behind has lost data; that is counted
+#	and the reader is moved forward.
+#
+
+import os
+import mmap
+import time
+import fcntl
+import numpy
+
+
+RING_MAGIC	= 0x5a4f4e4549515231	# "ZONEIQR1"
+HEADER_LEN	= 4096
+
+H_MAGIC		= 0
+H_CAPACITY	= 1
+H_MAX_READERS	= 2
+H_WRITE_COUNT	= 3
+H_SAMPLE_RATE	= 4
+H_WRITE_TIME	= 5
+H_CENTER_FREQ	= 6
+H_WRITE_CLAIM	= 7
+
+R_BASE		= 16
+R_SLOT_LEN	= 4
+R_ACTIVE	= 0
+R_CURSOR	= 1
+R_OVERRUNS	= 2
+R_DROPPED	= 3
+
+MAX_READERS	= (HEADER_LEN / 8 - R_BASE) / R_SLOT_LEN
+
+
+class iq_ring:
+
+	def __init__(self, path, capacity = None, sample_rate = 0.0, center_freq = 0.0, max_readers = 32):
+		"""
+		Open the ring at path.  When capacity is given the ring is created
+		(or re-created) with room for that many samples; otherwise an
+		existing ring is attached to.
+		"""
+
+		self._path = path
+
+		if capacity is not None:
+			if max_readers > MAX_READERS:
+				raise ValueError("at most %d readers" % (MAX_READERS,))
+			fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0644)
+			os.ftruncate(fd, HEADER_LEN + capacity * numpy.dtype(numpy.complex64).itemsize)
+		else:
+			fd = os.open(path, os.O_RDWR)
+		self._fd = fd
+		self._mm = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+		self._hdr = numpy.ndarray((HEADER_LEN / 8,), numpy.uint64, self._mm, 0)
+		self._hdr_f = numpy.ndarray((HEADER_LEN / 8,), numpy.float64, self._mm, 0)
+
+		if capacity is not None:
+			self._hdr[:] = 0
+			self._hdr[H_CAPACITY] = capacity
+			self._hdr[H_MAX_READERS] = max_readers
+			self._hdr_f[H_SAMPLE_RATE] = sample_rate
+			self._hdr_f[H_CENTER_FREQ] = center_freq
+			self._hdr_f[H_WRITE_TIME] = time.time()
+			self._hdr[H_MAGIC] = RING_MAGIC
+		elif int(self._hdr[H_MAGIC]) != RING_MAGIC:
+			raise ValueError("%s: not an iq ring" % (path,))
+
+		self._capacity = int(self._hdr[H_CAPACITY])
+		self._data = numpy.ndarray((self._capacity,), numpy.complex64, self._mm, HEADER_LEN)
+
+
+	def close(self):
+		self._hdr = self._hdr_f = self._data = None
+		self._mm.close()
+		os.close(self._fd)
+
+
+	def path(self):
+		return self._path
+
+
+	def capacity(self):
+		return self._capacity
+
+
+	def sample_rate(self):
+		return float(self._hdr_f[H_SAMPLE_RATE])
+
+
+	def center_freq(self):
+		return float(self._hdr_f[H_CENTER_FREQ])
+
+
+	def write_count(self):
+		return int(self._hdr[H_WRITE_COUNT])
+
+
+	def write_time(self):
+		return float(self._hdr_f[H_WRITE_TIME])
+
+
+	def index_at(self, t):
+		"""
+		Sample index that was (or will be) written at time t.
+		"""
+		return self.write_count() - int(round((self.write_time() - t) * self.sample_rate()))
+
+
+	def time_at(self, index):
+		return self.write_time() - (self.write_count() - index) / self.sample_rate()
+
+
+#
+#	Writer side
+#
+
+	def write(self, x):
+		"""
+		Append the samples in x (complex64).  Only one process may write.
+		"""
+
+		n = len(x)
+		w = int(self._hdr[H_WRITE_COUNT])
+		cap = self._capacity
+
+		if n > cap:
+			# only the newest capacity samples can be kept
+			w += n - cap
+			x = x[n - cap:]
+			n = cap
+
+		# samples before w + n - cap are about to go
+		self._hdr[H_WRITE_CLAIM] = w + n
+
+		i = w % cap
+		k = min(n, cap - i)
+		self._data[i:i + k] = x[:k]
+		if k < n:
+			self._data[:n - k] = x[k:]
+
+		self._hdr_f[H_WRITE_TIME] = time.time()
+		self._hdr[H_WRITE_COUNT] = w + n
+
+
+#
+#	Reader side
+#
+
+	def window(self, start, n):
+		"""
+		Return the samples [start, start + n) as a list of at most two
+		views (two when the window wraps), or None if they have been
+		overwritten or not yet written.
+		"""
+
+		w = self.write_count()
+		cap = self._capacity
+		if (start < self._claimed() - cap) or (start + n > w) or (n < 0):
+			return None
+		i = start % cap
+		k = min(n, cap - i)
+		if k == n:
+			return [self._data[i:i + n],]
+		return [self._data[i:], self._data[:n - k]]
+
+
+	def _claimed(self):
+		return max(int(self._hdr[H_WRITE_CLAIM]), self.write_count())
+
+
+	def valid(self, start):
+		"""
+		True if the sample at start has not been overwritten, nor is being
+		overwritten by a write in progress.  Check this after using a view
+		to be sure the writer did not lap it meanwhile.
+		"""
+		return start >= self._claimed() - self._capacity
+
+
+	def attach(self, start = None):
+		"""
+		Claim a reader slot.  The reader starts at the sample index start,
+		or at the newest sample when start is None.
+		"""
+
+		fcntl.lockf(self._fd, fcntl.LOCK_EX)
+		try:
+			for slot in range(int(self._hdr[H_MAX_READERS])):
+				b = R_BASE + slot * R_SLOT_LEN
+				if int(self._hdr[b + R_ACTIVE]) == 0:
+					self._hdr[b + R_CURSOR] = self.write_count() if start is None else max(start, 0)
+					self._hdr[b + R_OVERRUNS] = 0
+					self._hdr[b + R_DROPPED] = 0
+					self._hdr[b + R_ACTIVE] = 1
+					return ring_reader(self, slot)
+		finally:
+			fcntl.lockf(self._fd, fcntl.LOCK_UN)
+		raise RuntimeError("%s: no free reader slots" % (self._path,))
+
+
+	def stats(self):
+		"""
+		Return a list of (slot, lag, overruns, dropped) for the active readers.
+		"""
+
+		w = self.write_count()
+		r = list()
+		for slot in range(int(self._hdr[H_MAX_READERS])):
+			b = R_BASE + slot * R_SLOT_LEN
+			if int(self._hdr[b + R_ACTIVE]) == 0:
+				continue
+			r.append((slot, w - int(self._hdr[b + R_CURSOR]), int(self._hdr[b + R_OVERRUNS]), int(self._hdr[b + R_DROPPED])))
+		return r
+
+
+class ring_reader:
+
+	def __init__(self, ring, slot):
+		self._ring = ring
+		self._slot = slot
+		self._b = R_BASE + slot * R_SLOT_LEN
+		self._hdr = ring._hdr
+
+
+	def detach(self):
+		self._hdr[self._b + R_ACTIVE] = 0
+
+
+	def cursor(self):
+		return int(self._hdr[self._b + R_CURSOR])
+
+
+	def seek(self, index):
+		self._hdr[self._b + R_CURSOR] = index
+
+
+	def overruns(self):
+		return int(self._hdr[self._b + R_OVERRUNS])
+
+
+	def dropped(self):
+		return int(self._hdr[self._b + R_DROPPED])
+
+
+	def available(self):
+		return self._ring.write_count() - self.cursor()
+
+
+	def _catch_up(self):
+		"""
+		If the writer has lapped us, count it and skip to the oldest
+		sample still in the ring (plus some slack so we are not lapped
+		again straight away).
+		"""
+
+		c = self.cursor()
+		w = self._ring.write_count()
+		cap = self._ring.capacity()
+		if w - c <= cap:
+			return c
+
+		n = (w - cap + cap / 8) - c
+		self._hdr[self._b + R_OVERRUNS] = self.overruns() + 1
+		self._hdr[self._b + R_DROPPED] = self.dropped() + n
+		c += n
+		self.seek(c)
+		return c
+
+
+	def read(self, max_n):
+		"""
+		Return a view of up to max_n unread samples; the view never wraps,
+		so fewer samples than are available may be returned.  The cursor
+		is not moved; call consume() when done with the view.
+		"""
+
+		c = self._catch_up()
+		n = min(max_n, self._ring.write_count() - c)
+		if n <= 0:
+			return self._ring._data[:0]
+		cap = self._ring.capacity()
+		i = c % cap
+		n = min(n, cap - i)
+		return self._ring._data[i:i + n]
+
+
+	def consume(self, n):
+		"""
+		Move the cursor past n samples.  Returns False if those samples
+		were overwritten while the caller was using them.
+		"""
+
+		c = self.cursor()
+		ok = self._ring.valid(c)
+		self.seek(c + n)
+		return ok
+
+
+# vim:ts=8:nowrap
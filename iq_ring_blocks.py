@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+#
+# GNU Radio blocks to put a stream into an iq_ring and take it back out.
+#
+
+import os
+import time
+import numpy
+from gnuradio import gr
+
+from iq_ring import iq_ring
+
+
+class iq_ring_sink(gr.sync_block):
+	"""
+	Write the input stream into a (newly created) shared ring.
+	"""
+
+	def __init__(self, path, capacity, sample_rate, center_freq = 0.0):
+
+		gr.sync_block.__init__(
+			self,
+			name = "IQ Ring Sink",
+			in_sig = [numpy.complex64],
+			out_sig = None
+		)
+
+		self.ring = iq_ring(path, capacity, sample_rate, center_freq)
+
+
+	def close(self):
+		"""
+		Close the ring and remove its file.  Readers that have it open keep
+		their mapping until they close it.
+		"""
+		path = self.ring.path()
+		self.ring.close()
+		try:
+			os.unlink(path)
+		except OSError:
+			pass
+
+
+	def work(self, input_items, output_items):
+
+		self.ring.write(input_items[0])
+		return len(input_items[0])
+
+
+class iq_ring_source(gr.sync_block):
+	"""
+	Read a stream out of an existing shared ring.
+
+	The copy into the output buffer is the only copy a reader makes.
+
+	The reader slot is kept across stop() and start() (the flow graph is
+	restarted for every new call) and given up by close(), when the block
+	leaves the flow graph for good.
+	"""
+
+	_IDLE_SLEEP = 0.001
+
+	def __init__(self, path, start = None):
+
+		gr.sync_block.__init__(
+			self,
+			name = "IQ Ring Source",
+			in_sig = None,
+			out_sig = [numpy.complex64]
+		)
+
+		self.ring = iq_ring(path)
+		self.reader = self.ring.attach(start)
+
+		# reads whose samples the writer overwrote while they were copied
+		self.overwritten = 0
+
+
+	def close(self):
+		if self.reader is not None:
+			self.reader.detach()
+			self.reader = None
+			self.ring.close()
+
+
+	def work(self, input_items, output_items):
+
+		out = output_items[0]
+		v = self.reader.read(len(out))
+		n = len(v)
+		if n == 0:
+			# nothing new yet; don't spin the scheduler
+			time.sleep(self._IDLE_SLEEP)
+			return 0
+		out[:n] = v
+		if not self.reader.consume(n):
+			self.overwritten += 1
+		return n
+
+
+# vim:ts=8:nowrap
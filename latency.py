@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+#
+# Where the time goes between a grant going out on the control channel and
+# its audio landing in a file.
+#
+#	Each stage records how long after the frame carrying the grant was
+#	complete (control_channel_sink.work) it was reached:
+#
+#		crc		the frame passed its CRC
+#		grant		message_handler.start_call queued the grant
+#		dequeue		smartzone took the grant off the message queue
+#		reconfigure	the flow graph was running again with the new audio channel
+#		first_sample	the first audio sample reached the recorder
+#
+#	Times go into log-linear histograms (as HDR histograms do): exact below
+#	2**_SUB_BITS microseconds, then 2**(_SUB_BITS - 1) buckets per power of
+#	two, so every value is kept to within about 6% in a few hundred
+#	counters.  Recording is a handful of integer operations, cheap enough to
+#	leave on.  Counts are not locked; a rare lost increment is accepted.
+#
+
+import time
+import threading
+import numpy
+
+from gnuradio import gr
+
+
+STAGES	= ["crc", "grant", "dequeue", "reconfigure", "first_sample"]
+
+
+class latency_histogram:
+
+	_SUB_BITS	= 5
+	_MAX_US		= 1 << 32		# a little over an hour
+
+	def __init__(self):
+		s = self._SUB_BITS
+		self._n = ((self._MAX_US.bit_length() - s + 1) << (s - 1)) + (1 << (s - 1))
+		self.counts = [0,] * self._n
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+
+	def _index(self, us):
+		s = self._SUB_BITS
+		e = us.bit_length() - s
+		if e <= 0:
+			return us
+		return (e << (s - 1)) + (us >> e)
+
+
+	def _value(self, i):
+		"""
+		Lower bound (microseconds) of bucket i.
+		"""
+		s = self._SUB_BITS
+		if i < (1 << s):
+			return i
+		e = (i >> (s - 1)) - 1
+		return (i - (e << (s - 1))) << e
+
+
+	def record(self, seconds):
+		us = min(max(int(seconds * 1e6), 0), self._MAX_US - 1)
+		self.counts[self._index(us)] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+
+	def mean(self):
+		if self.count == 0:
+			return 0.0
+		return self.total / self.count
+
+
+	def percentile(self, p):
+		"""
+		Seconds below which p percent of the recorded values fall.
+		"""
+		if self.count == 0:
+			return 0.0
+		c = numpy.cumsum(self.counts)
+		i = int(numpy.searchsorted(c, c[-1] * p / 100.0))
+		return self._value(i + 1) / 1e6
+
+
+	def reset(self):
+		self.counts = [0,] * self._n
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+
+class latency_tracker:
+
+	def __init__(self, logger = None, interval = None):
+		self.histograms = dict((s, latency_histogram()) for s in STAGES)
+		self._logger = logger
+
+		if logger is not None and interval:
+			self._interval = interval
+			self._reporter = threading.Thread(target = self.reporter)
+			self._reporter.daemon = True
+			self._reporter.start()
+
+
+	def record(self, stage, frame_time, now = None):
+		"""
+		Note that stage was reached for the grant in the frame completed at frame_time.
+		"""
+		if frame_time is None:
+			return
+		if now is None:
+			now = time.time()
+		self.histograms[stage].record(now - frame_time)
+
+
+	def summary(self):
+		"""
+		{stage: {'count', 'mean', 'p50', 'p99', 'max'}}, times in seconds.
+		"""
+		r = dict()
+		for s in STAGES:
+			h = self.histograms[s]
+			r[s] = {'count': h.count, 'mean': h.mean(), 'p50': h.percentile(50), 'p99': h.percentile(99), 'max': h.max}
+		return r
+
+
+	def summary_text(self):
+		r = self.summary()
+		return "; ".join(["%s %d p50 %.1fms p99 %.1fms max %.1fms" % (s, r[s]['count'], r[s]['p50'] * 1e3, r[s]['p99'] * 1e3, r[s]['max'] * 1e3) for s in STAGES if r[s]['count'] > 0])
+
+
+	def reporter(self):
+		while True:
+			time.sleep(self._interval)
+			t = self.summary_text()
+			if len(t) > 0:
+				self._logger.log("latency: %s" % (t,))
+
+
+class first_sample_probe(gr.sync_block):
+	"""
+	Calls first_sample() once, when the first sample arrives; after that
+	it only consumes.
+	"""
+
+	def __init__(self, first_sample):
+		gr.sync_block.__init__(
+			self,
+			name = "First Sample Probe",
+			in_sig = [numpy.float32],
+			out_sig = None
+		)
+		self._first_sample = first_sample
+
+
+	def work(self, input_items, output_items):
+		if self._first_sample is not None and len(input_items[0]) > 0:
+			f = self._first_sample
+			self._first_sample = None
+			f()
+		return len(input_items[0])
+
+
+# vim:ts=8:nowrap
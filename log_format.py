@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+#
+# The fixed-width text view of decoded control channel events.
+#
+#	Command (5 spaces) | Source (9 spaces) | Target (18 spaces) | Frequency (12 spaces) | Text
+#
+#	osw_handler renders its log lines with this, and event_log.py renders
+#	stored records with it, so both look the same.
+#
+
+from band_plan_800 import get_freq
+
+
+# Readable strings
+#
+# GROUP_TYPE[0] = "Normal Talkgroup", but that was redundant
+GROUP_TYPES	= [ "", "All Talkgroup", "Emergency", "Talkgroup Patch to Another", "Emergency Patch", "Emergency Multi-group", "Not Assigned",
+		   "Multi-select (initiated by dispatcher)", "DES Encryption Talkgroup", "DES All Talkgroup", "DES Emergency", "DES Talkgroup Patch", "DES Emergency Patch",
+		   "DES Emergency Multi-group", "Not Assigned", "DES Multi-select" ]
+
+
+def fillto(n, s = None):
+
+	if s is None:
+		return " " * n
+	if len(s) >= n:
+		return s[:n]
+	return s + " " * (n - len(s))
+
+
+def render_text(command = None, source = None, count = None, target = None, target_is_group = None, channel = None, text = None, raw = None, alpha_tag = None):
+	"""
+	Render one log line.  count is shown next to the source when given;
+	alpha_tag(group) looks up a talkgroup name.
+	"""
+
+	cmd = ""
+	if command is not None:
+		cmd += command
+	cmd = fillto(5, cmd)
+
+	src = ""
+	if source is not None:
+		if count is not None:
+			src = "%4x (%d)" % (source, count)
+		else:
+			src = "%4x" % (source,)
+	src = fillto(9, src)
+
+	tgt = ""
+	txt = ""
+	if target is not None:
+		if target_is_group:
+			txt = GROUP_TYPES[target & 0xf]
+			t = alpha_tag((target & 0xfff0) >> 4) if alpha_tag is not None else None
+			if t is not None:
+				tgt = "%4x  %s" % (target, t)
+			else:
+				tgt = "%4x  G" % (target,)
+		else:
+			tgt = "%4x" % (target,)
+	tgt = fillto(18, tgt)
+
+	freq = ""
+	if channel is not None:
+		freq += "%3.4f MHz" % (get_freq(channel),)
+	freq = fillto(12, freq)
+
+	if text is not None:
+		if txt != "":
+			txt += "; "
+		txt += text
+
+	if raw is not None:
+		txt += raw
+
+	txt = fillto(40, txt)
+
+	return cmd + " | " + src + " | " + tgt + " | " + freq + " | " + txt
+
+
+def render_record(r, alpha_tag = None):
+	"""
+	Render a 'log' event record (see osw_handler.log()).
+	"""
+	return render_text(r.get('command'), r.get('source'), r.get('count'), r.get('target'), r.get('target_is_group'), r.get('channel'), r.get('text'), r.get('raw'), alpha_tag)
+
+
+# vim:ts=8:nowrap
@@ -18,44 +18,57 @@ class message_handler:
 
 	_TIMEOUT = 1
 
-	def __init__(self, queue):
+	def __init__(self, queue, call_ended = None, latency = None):
 		self._queue = queue
 		self._call_history = list()
 		self._sys_id = -1
 		self._sys_channel = -1
 
+		# called with (group_id, chan, radio_id, last_seen) when a call times out
+		self._call_ended = call_ended
 
-	def clean_call_history(self):
+		# when the frame being handled was complete (see control_channel_sink.work)
+		self.frame_time = None
+		self._latency = latency
+
+
+	def clean_call_history(self, now = None):
+		if now is None:
+			now = time.time()
 		n = list()
-		now = time.time()
 		for h in self._call_history:
 			if now < h[3] + self._TIMEOUT:
 				n.append(h)
+			elif self._call_ended is not None:
+				self._call_ended(h[0], h[1], h[2], h[3])
 		self._call_history = n
 
 
-	def start_call(self, group_id, chan, radio_id = None):
+	def start_call(self, group_id, chan, radio_id = None, is_group = 1):
 		if self._sys_id < 0:
 			return False
 
-		call_found = False
-		new_history = list()
+		now = time.time()
+		self.clean_call_history(now)
 		for h in self._call_history:
-			if time.time() < h[3] + self._TIMEOUT:
-				new_history.append(h)
-				if [group_id, chan, radio_id] == h[:3]:
-					h[3] = time.time()
-					call_found = True
-		self._call_history = new_history
-		if call_found:
-			return False
-		self._call_history.append([group_id, chan, radio_id, time.time()])
-		msg = message().make_from_string("%d %d %d %d" % (self._sys_id, chan, group_id, (radio_id) if radio_id is not None else (-1)))
+			if [group_id, chan, radio_id] == h[:3]:
+				h[3] = now
+				return False
+		self._call_history.append([group_id, chan, radio_id, now])
+		msg = message().make_from_string("%d %d %d %d %d" % (self._sys_id, chan, group_id, (radio_id) if radio_id is not None else (-1), 1 if is_group else 0))
 		msg.set_type(0)
+		msg.set_arg1(self._call_history[-1][3])		# time of grant
+		msg.set_arg2(self.frame_time if self.frame_time is not None else now)		# time the grant's frame was complete
 		self._queue.insert_tail(msg)
+		if self._latency is not None:
+			self._latency.record('grant', self.frame_time)
 		return True
 
 
+	def active_calls(self):
+		return len(self._call_history)
+
+
 	def set_sysid(self, sys_id, chan):
 		self._sys_id = sys_id
 		self._sys_channel = chan
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+#
+# Runtime metrics.
+#
+#	A registry holds metrics as functions that read the value when asked,
+#	so nothing is added to the decode path: the sink, the handlers and the
+#	queues keep the counts they already keep, and the registry reads them
+#	on a scrape.
+#
+#	A metric's function returns either a number, or a list of
+#	(label values, number) for a metric with labels.  Metrics whose
+#	function raises (e.g. GNU Radio performance counters when they are not
+#	enabled) are left out of that scrape.
+#
+#	The registry is rendered in the Prometheus text format, served on a
+#	local HTTP port (any path), and written to the log on SIGUSR1.
+#
+
+import signal
+import threading
+import BaseHTTPServer
+
+
+COUNTER	= "counter"
+GAUGE	= "gauge"
+
+
+class registry:
+
+	def __init__(self):
+		self._metrics = list()
+		self._lock = threading.Lock()
+
+
+	def add(self, name, kind, help, fn, labels = ()):
+		self._lock.acquire()
+		self._metrics.append((name, kind, help, fn, tuple(labels)))
+		self._lock.release()
+
+
+	def counter(self, name, help, fn, labels = ()):
+		self.add(name, COUNTER, help, fn, labels)
+
+
+	def gauge(self, name, help, fn, labels = ()):
+		self.add(name, GAUGE, help, fn, labels)
+
+
+	def collect(self):
+		"""
+		[(name, kind, help, [(label dict, value), ...]), ...]
+		"""
+		self._lock.acquire()
+		metrics = list(self._metrics)
+		self._lock.release()
+
+		r = list()
+		for (name, kind, help, fn, labels) in metrics:
+			try:
+				v = fn()
+			except Exception:
+				continue
+			if len(labels) == 0:
+				samples = [({}, v)]
+			else:
+				samples = [(dict(zip(labels, l)), x) for (l, x) in v]
+			r.append((name, kind, help, samples))
+		return r
+
+
+	def text(self):
+		"""
+		The Prometheus text exposition format.
+		"""
+		lines = list()
+		for (name, kind, help, samples) in self.collect():
+			lines.append("# HELP %s %s" % (name, help))
+			lines.append("# TYPE %s %s" % (name, kind))
+			for (labels, v) in samples:
+				if v is None:
+					continue
+				if len(labels) > 0:
+					l = ",".join(['%s="%s"' % (k, str(labels[k]).replace('\\', '\\\\').replace('"', '\\"')) for k in sorted(labels)])
+					lines.append("%s{%s} %s" % (name, l, format_value(v)))
+				else:
+					lines.append("%s %s" % (name, format_value(v)))
+		return "\n".join(lines) + "\n"
+
+
+def format_value(v):
+	if isinstance(v, float):
+		return repr(v)
+	return str(v)
+
+
+class _handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	def do_GET(self):
+		body = self.server.registry.text()
+		self.send_response(200)
+		self.send_header("Content-Type", "text/plain; version=0.0.4")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+
+	def log_message(self, format, *args):
+		pass
+
+
+def serve(r, port, address = "127.0.0.1"):
+	"""
+	Serve registry r over HTTP from a daemon thread; returns the server.
+	"""
+	server = BaseHTTPServer.HTTPServer((address, port), _handler)
+	server.registry = r
+	t = threading.Thread(target = server.serve_forever)
+	t.daemon = True
+	t.start()
+	return server
+
+
+def dump_on_signal(r, logger, signum = signal.SIGUSR1):
+	"""
+	Write the registry to logger when signum arrives.  Call from the main thread.
+	"""
+	def dump(signum, frame):
+		for l in r.text().splitlines():
+			if not l.startswith("#"):
+				logger.log("metrics: %s" % (l,))
+	signal.signal(signum, dump)
+
+
+# vim:ts=8:nowrap
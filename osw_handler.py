@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 
 import time
-from load_csv import load_csv
 from message_handler import message_handler
 from band_plan_800 import is_valid_channel, get_freq
+from log_format import GROUP_TYPES, render_text
+from affiliation_store import affiliation_store
+from source_counter import source_counter
+from alias_table import shared_alias_table
 
 
 # Known OSW commands
@@ -27,12 +30,7 @@ class OSW_CMD:
 	SYS_STATUS		= 0x03c0
 
 
-# Readable strings
-#
-# GROUP_TYPE[0] = "Normal Talkgroup", but that was redundant
-GROUP_TYPES	= [ "", "All Talkgroup", "Emergency", "Talkgroup Patch to Another", "Emergency Patch", "Emergency Multi-group", "Not Assigned",
-		   "Multi-select (initiated by dispatcher)", "DES Encryption Talkgroup", "DES All Talkgroup", "DES Emergency", "DES Talkgroup Patch", "DES Emergency Patch",
-		   "DES Emergency Multi-group", "Not Assigned", "DES Multi-select" ]
+# Readable strings (GROUP_TYPES is in log_format)
 TONE_NAMES	= [ "105.88", "76.76", "83.72", "90", "97.3", "116.3", "128.57", "138.46" ]
 BAND_LIST	= ["800", "Unknown (1)", "800 (2)", "821", "900", "Unknown (5)", "Unknown (6)", "Unknown (7)"]
 
@@ -51,11 +49,15 @@ def get_equipment_name(n):
 
 class osw_handler:
 
-	def __init__(self, logger, queue, group_description_csv = None):
+	def __init__(self, logger, queue, group_description_csv = None, listeners = None, text_log = True, latency = None, max_neighbors = None, source_decay = None):
 
 		self.osw_list = list()
 		self.logger = logger
-		self.message_handler = message_handler(queue)
+		self.message_handler = message_handler(queue, call_ended = self.call_ended, latency = latency)
+
+		# called with (kind, fields) for each decoded event; see emit()
+		self._listeners = list(listeners) if listeners is not None else list()
+		self._text_log = text_log	# write the fixed-width text log through logger
 		
 		self._site_id = -1
 		self._sys_id = -1
@@ -63,24 +65,22 @@ class osw_handler:
 		self._sys_channel = -1
 		self._tone = None
 		self._neighbors = list()
-		self._affiliated_map = dict()
-		self._logsrc_count = dict()
-
-		self.group_map = None
+		self._max_neighbors = max_neighbors	# None: remember every neighbor channel seen
+		self.affiliations = affiliation_store()
+		self.source_counts = source_counter(source_decay)	# None: count since start
+		self.opcode_counts = [0,] * 0x400		# OSWs seen, by command
+		self.profile = None				# see enable_profiling()
+
+		# shared by every osw_handler using the same csv; reloaded when it changes
+		self.aliases = None
 		if group_description_csv is not None:
-			self.group_map = dict()
-			l = load_csv(group_description_csv)
-			for r in l[1:]:
-				if len(r) >= 2:
-					self.group_map[int(r[1], 16)] = r
+			self.aliases = shared_alias_table(group_description_csv)
 
 
 	def alpha_tag(self, gid):
-		if self.group_map is None:
+		if self.aliases is None:
 			return None
-		if gid in self.group_map:
-			return self.group_map[gid][3]
-		return None
+		return self.aliases.get(gid)
 
 
 	def _list_to_uint(self, l):
@@ -101,13 +101,44 @@ class osw_handler:
 		}
 
 
-	def handle(self, osw):
+	def handle(self, osw, frame_time = None):
 		"""
 		Main entry point for the osw_handler.  It parses lists of bits as OSW packets.
+		frame_time is when the frame carrying osw was complete, for latency tracking.
 		"""
+		self.message_handler.frame_time = frame_time
 		self.process_osw(self.parse_raw_osw(osw))
 
 
+	def enable_profiling(self):
+		"""
+		Time every handler and every command from now on; returns the
+		osw_profile.  Until this is called nothing is timed.
+		"""
+		if self.profile is None:
+			from osw_profile import osw_profile
+			self.profile = osw_profile(self)
+			self.profile.install()
+		return self.profile
+
+
+	def add_listener(self, l):
+		self._listeners.append(l)
+
+
+	def emit(self, kind, **fields):
+		"""
+		Hand a decoded event to the listeners (call database, event log, ...).
+		Every event carries 'time' and 'sys_id'.
+		"""
+		if len(self._listeners) == 0:
+			return
+		fields['time'] = time.time()
+		fields['sys_id'] = self._sys_id
+		for l in self._listeners:
+			l(kind, fields)
+
+
 #
 #	OSW history functions
 #
@@ -132,68 +163,29 @@ class osw_handler:
 # Log functions
 #
 
-	def fillto(self, n, s = None):
-
-		if s is None:
-			return " " * n
-		if len(s) >= n:
-			return s[:n]
-		return s + " " * (n - len(s))
-
-
 	def log(self, command = None, source = None, source_display_count = False, target = None, target_is_group = None, channel = None, text = None, raw = None):
 		"""
-		Write a formatted log entry.
+		Record a decoded event.  Listeners get it as a 'log' event, and the
+		formatted text log entry (see log_format) is rendered from the same
+		fields when text logging is on.
 
 			Command (5 spaces) | Source (9 spaces) | Target (18 spaces) | Frequency (12 spaces) | Text
 		"""
 
-		cmd = ""
-		if command is not None:
-			cmd += command
-		cmd = self.fillto(5, cmd)
-
-		src = ""
+		count = None
 		if source is not None:
-			if source not in self._logsrc_count:
-				self._logsrc_count[source] = 0
-			self._logsrc_count[source] += 1
+			n = self.source_counts.add(source)
 			if source_display_count:
-				src = "%4x (%d)" % (source, self._logsrc_count[source])
-			else:
-				src = "%4x" % (source,)
-		src = self.fillto(9, src)
-
-		tgt = ""
-		txt = ""
-		if target is not None:
-			if target_is_group:
-				txt = GROUP_TYPES[target & 0xf]
-				t = self.alpha_tag((target & 0xfff0) >> 4)
-				if t is not None:
-					tgt = "%4x  %s" % (target, t)
-				else:
-					tgt = "%4x  G" % (target,)
-			else:
-				tgt = "%4x" % (target,)
-		tgt = self.fillto(18, tgt)
-
-		freq = ""
-		if channel is not None:
-			freq += "%3.4f MHz" % (get_freq(channel),)
-		freq = self.fillto(12, freq)
-
-		if text is not None:
-			if txt != "":
-				txt += "; "
-			txt += text
+				count = n
 
 		if raw is not None:
-			txt += self.osw_str(raw)
+			raw = self.osw_str(raw)
 
-		txt = self.fillto(40, txt)
+		if len(self._listeners) > 0:
+			self.emit('log', command = command, source = source, count = count, target = target, target_is_group = target_is_group, channel = channel, text = text, raw = raw)
 
-		self.logger.log(cmd + " | " + src + " | " + tgt + " | " + freq + " | " + txt)
+		if self._text_log:
+			self.logger.log(render_text(command, source, count, target, target_is_group, channel, text, raw, self.alpha_tag))
 
 
 	def osw_str(self, osw):
@@ -244,6 +236,8 @@ class osw_handler:
 
 	def site_idle(self, osw):
 		# self.log(command = "IDLE")
+		# calls end by not being granted again; notice that even when no new call comes in
+		self.message_handler.clean_call_history()
 		return
 
 
@@ -257,6 +251,7 @@ class osw_handler:
 			if t != self._tone:
 				self._tone = t;
 				self.log(command = "SYSSTAT", text = "tone = %s" % (self._tone,))
+				self.emit('site_status', chan = self._sys_channel, tone = self._tone)
 
 
 	def scan_marker(self, osw):
@@ -283,20 +278,27 @@ class osw_handler:
 		self.log(command = "DIAG", text = "code (%x) not known" % (osw['id'],))
 
 
+	def call_ended(self, group_id, chan, radio_id, last_seen):
+		self.emit('call_end', group_id = group_id, chan = chan, radio_id = radio_id, last_seen = last_seen)
+
+
 	def call(self, oswl):
 		if len(oswl) == 1:
 			# single-osw case
 			(osw,) = oswl
 			if osw['id'] == 0x1ff2: # no idea what this is
 				return
-			if self.message_handler.start_call(osw['id'], osw['cmd']):
+			if self.message_handler.start_call(osw['id'], osw['cmd'], is_group = osw['g']):
 				self.log(command = "CALL", target = osw['id'], target_is_group = osw['g'], channel = osw['cmd'])
+				self.emit('grant', group_id = osw['id'], is_group = osw['g'], chan = osw['cmd'], radio_id = None)
 			return
 
 		# dual-osw case
 		(osw1, osw2) = oswl
-		if self.message_handler.start_call(osw2['id'], osw2['cmd'], osw1['id']):
+		self.affiliations.seen(osw1['id'], time.time())
+		if self.message_handler.start_call(osw2['id'], osw2['cmd'], osw1['id'], is_group = osw2['g']):
 			self.log(command = "CALL", source = osw1['id'], source_display_count = True, target = osw2['id'], target_is_group = osw2['g'], channel = osw2['cmd'])
+			self.emit('grant', group_id = osw2['id'], is_group = osw2['g'], chan = osw2['cmd'], radio_id = osw1['id'])
 
 
 	def sys_id(self, osw1, osw2):
@@ -305,6 +307,7 @@ class osw_handler:
 			self._sys_channel = osw2['id'] & 0x3ff
 			self.message_handler.set_sysid(self._sys_id, self._sys_channel)
 			self.log(command = "SYSID", channel = self._sys_channel, source = self._sys_id)
+			self.emit('sys_id', chan = self._sys_channel)
 
 
 	def peer_id(self, osw1, osw2):
@@ -317,24 +320,18 @@ class osw_handler:
 
 	def unaffiliate(self, osw1, osw2):
 		radio_id = osw1['id']
-		if radio_id in self._affiliated_map:
-			group_id = self._affiliated_map[radio_id]['group_id']
+		group_id = self.affiliations.unaffiliate(radio_id, time.time())
+		if group_id is not None:
 			# self.log(command = "UNAFF", source = radio_id, target = group_id, target_is_group = True);
-			del self._affiliated_map[radio_id]
+			self.emit('unaffiliation', radio_id = radio_id, group_id = group_id)
 
 	
 	def affiliate(self, osw1, osw2):
 		radio_id = osw1['id']
 		group_id = osw2['id'] & 0xfff0
-		if radio_id not in self._affiliated_map:
-			self._affiliated_map[radio_id] = dict()
-			self._affiliated_map[radio_id]['group_id'] = -1
-			self._affiliated_map[radio_id]['count'] = 1
-
-		if self._affiliated_map[radio_id]['group_id'] != group_id:
-			self._affiliated_map[radio_id]['group_id'] = group_id
-			self._affiliated_map[radio_id]['count'] += 1
-			# self.log(command = "AFF", source = osw1['id'], target = group_id, target_is_group = True, text = "aff num: %d; group flag: %x" % (self._affiliated_map[radio_id]['count'], osw2['id'] & 0xf))
+		if self.affiliations.affiliate(radio_id, group_id, time.time()):
+			self.emit('affiliation', radio_id = radio_id, group_id = group_id)
+			# self.log(command = "AFF", source = osw1['id'], target = group_id, target_is_group = True, text = "aff num: %d; group flag: %x" % (self.affiliations.count[radio_id], osw2['id'] & 0xf))
 
 
 	def call_alert(self, osw1, osw2):
@@ -356,6 +353,8 @@ class osw_handler:
 			# self.log(text = "NEIGH known: %3.4f" % (get_freq(osw3['id'] & 0x3ff),))
 			return
 		else:
+			if self._max_neighbors is not None and len(self._neighbors) >= self._max_neighbors:
+				del self._neighbors[0]
 			self._neighbors.append(osw3['id'] & 0x3ff)
 		txt = "Band %d" % ((osw2['id'] >> 7) & 7,)
 		if ((osw2['id'] >> 5) & 1):
@@ -371,6 +370,8 @@ class osw_handler:
 		if (osw2['id'] & 1) == 0:
 			txt += "; Active"
 
+		self.emit('neighbor', site = (osw2['id'] >> 10) & 0x3f, chan = osw3['id'] & 0x3ff, band = (osw2['id'] >> 7) & 7, flags = osw2['id'] & 0x3f)
+
 		txt = ""
 		for n in self._neighbors:
 			txt += "%3.4f " % (get_freq(n),)
@@ -401,6 +402,8 @@ class osw_handler:
 
 	def process_osw(self, osw):
 
+		self.opcode_counts[osw['cmd']] += 1
+
 		# check for idle
 		if osw['cmd'] == OSW_CMD.BACKGROUND_IDLE:
 			self.site_idle(osw)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+#
+# Where osw_handler spends its time.
+#
+#	An osw_profile installs timing wrappers on one osw_handler: on
+#	process_osw, to time each OSW by its command, and on each handler it
+#	dispatches to.  The wrappers are instance attributes shadowing the
+#	class's methods, so a handler that is not being profiled runs exactly
+#	as before, and remove() puts it back.
+#
+#	Counts, total and longest times are kept in lists allocated up front.
+#	Handler times include whatever the handler calls (logging, listeners,
+#	start_call).  The clock is timeit.default_timer, the cheapest
+#	fine-grained clock Python 2 has.
+#
+
+import timeit
+
+from osw_handler import OSW_CMD
+from band_plan_800 import is_valid_channel
+
+
+HANDLERS = [
+	"site_idle", "site_id", "call", "sys_netstat", "sys_status", "scan_marker",
+	"affiliate", "unaffiliate", "call_alert", "system_clock",
+	"emergency_announcement", "affil_fcn", "patch", "ack_status", "ack_msg",
+	"unknown_ack", "sys_id", "peer_id", "msc", "neighbor", "call_astro",
+	"call_coded_pc", "unhandled",
+]
+
+COMMANDS	= 0x400
+
+_clock = timeit.default_timer
+
+# command -> name, for the report
+_COMMAND_NAMES = dict((v, k) for (k, v) in vars(OSW_CMD).items() if isinstance(v, int))
+
+
+def command_name(cmd):
+	if cmd in _COMMAND_NAMES:
+		return _COMMAND_NAMES[cmd]
+	if is_valid_channel(cmd):
+		return "chan %d" % (cmd,)
+	return "%03x" % (cmd,)
+
+
+class osw_profile:
+
+	def __init__(self, handler):
+		self._handler = handler
+
+		n = len(HANDLERS)
+		self.handler_calls = [0,] * n
+		self.handler_time = [0.0,] * n
+		self.handler_max = [0.0,] * n
+
+		self.command_calls = [0,] * COMMANDS
+		self.command_time = [0.0,] * COMMANDS
+		self.command_max = [0.0,] * COMMANDS
+
+		self.started = None
+
+
+	def install(self):
+		h = self._handler
+		for (i, name) in enumerate(HANDLERS):
+			if not hasattr(h, name):
+				continue
+			setattr(h, name, self._wrap_handler(i, getattr(h, name)))
+		h.process_osw = self._wrap_process_osw(h.process_osw)
+		self.started = _clock()
+
+
+	def remove(self):
+		h = self._handler
+		for name in HANDLERS + ["process_osw",]:
+			if name in h.__dict__:
+				delattr(h, name)
+
+
+	def _wrap_handler(self, i, f):
+		calls = self.handler_calls
+		total = self.handler_time
+		longest = self.handler_max
+
+		def timed(*args, **kwargs):
+			t0 = _clock()
+			try:
+				return f(*args, **kwargs)
+			finally:
+				dt = _clock() - t0
+				calls[i] += 1
+				total[i] += dt
+				if dt > longest[i]:
+					longest[i] = dt
+		return timed
+
+
+	def _wrap_process_osw(self, f):
+		calls = self.command_calls
+		total = self.command_time
+		longest = self.command_max
+
+		def timed(osw):
+			t0 = _clock()
+			try:
+				return f(osw)
+			finally:
+				dt = _clock() - t0
+				c = osw['cmd']
+				calls[c] += 1
+				total[c] += dt
+				if dt > longest[c]:
+					longest[c] = dt
+		return timed
+
+
+	def handlers(self):
+		"""
+		[(name, calls, total seconds, longest seconds), ...], most total time first.
+		"""
+		r = [(HANDLERS[i], self.handler_calls[i], self.handler_time[i], self.handler_max[i]) for i in range(len(HANDLERS)) if self.handler_calls[i] > 0]
+		return sorted(r, key = lambda x: x[2], reverse = True)
+
+
+	def commands(self):
+		"""
+		[(command, calls, total seconds, longest seconds), ...], most total time first.
+		"""
+		r = [(c, self.command_calls[c], self.command_time[c], self.command_max[c]) for c in range(COMMANDS) if self.command_calls[c] > 0]
+		return sorted(r, key = lambda x: x[2], reverse = True)
+
+
+	def report(self, top = 20):
+		"""
+		The report, as a list of lines.
+		"""
+		elapsed = (_clock() - self.started) if self.started is not None else 0.0
+		total = sum(self.command_time)
+		lines = ["osw profile: %d OSWs in %.1fs, %.3fs handling them (%.2f%%)" % (sum(self.command_calls), elapsed, total, 100.0 * total / elapsed if elapsed > 0 else 0.0)]
+
+		lines.append("%-24s %10s %12s %10s %10s %6s" % ("handler", "calls", "total ms", "mean us", "max us", "%"))
+		for (name, n, t, m) in self.handlers():
+			lines.append("%-24s %10d %12.2f %10.1f %10.1f %6.1f" % (name, n, t * 1e3, t / n * 1e6, m * 1e6, 100.0 * t / total if total > 0 else 0.0))
+
+		lines.append("%-24s %10s %12s %10s %10s %6s" % ("command", "calls", "total ms", "mean us", "max us", "%"))
+		for (c, n, t, m) in self.commands()[:top]:
+			lines.append("%-24s %10d %12.2f %10.1f %10.1f %6.1f" % (command_name(c), n, t * 1e3, t / n * 1e6, m * 1e6, 100.0 * t / total if total > 0 else 0.0))
+		return lines
+
+
+# vim:ts=8:nowrap
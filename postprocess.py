@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+#
+# Post-processing of finished recordings.
+#
+#	When a call is closed its wav files are queued here and handled on a
+#	small pool of threads, well away from the flow graph:
+#
+#		trim		drop leading and trailing silence
+#		normalize	scale so the peak is at _PEAK of full scale
+#		encode		'pcm'  - write back as 16-bit wav
+#				'ulaw' - G.711 mu-law .au (8 bits per sample)
+#				'flac' - .flac, if the flac encoder is installed
+#				'opus' - .opus, if opusenc is installed
+#
+#	The queue is bounded; when it is full a recording is left as it is
+#	rather than holding up the caller.
+#
+#	A recording's indexes are rewritten with it, so they name the output
+#	and count from its first sample:
+#
+#		<recording>.talkers	offsets moved back by the trimmed lead-in;
+#					talkers granted only in trimmed silence are
+#					dropped (whole-call recordings)
+#		<call>.segments		the segment's line gets the output's name,
+#					and its start and duration after trimming
+#					(gated recordings, passed to submit())
+#
+
+import os
+import time
+import wave
+import sunau
+import tempfile
+import threading
+import subprocess
+import Queue
+import numpy
+from distutils.spawn import find_executable
+
+from talker_timeline import load_talker_index, TALKER_INDEX_EXTENSION
+
+
+ENCODERS = {
+	'pcm':	None,
+	'ulaw':	None,
+	'flac':	"flac",
+	'opus':	"opusenc",
+}
+
+
+def available_encodings():
+	return [e for e in ENCODERS if ENCODERS[e] is None or find_executable(ENCODERS[e]) is not None]
+
+
+def read_wav(path):
+	"""
+	Return (rate, float32 samples in [-1, 1]).
+	"""
+	w = wave.open(path, "rb")
+	rate = w.getframerate()
+	width = w.getsampwidth()
+	data = w.readframes(w.getnframes())
+	w.close()
+	if width == 1:
+		return (rate, (numpy.frombuffer(data, numpy.uint8).astype(numpy.float32) - 128.0) / 128.0)
+	return (rate, numpy.frombuffer(data, '<i2').astype(numpy.float32) / 32768.0)
+
+
+def trim_bounds(x, rate, threshold = -40.0, frame_time = 0.02):
+	"""
+	(start, end) of x without whole frames of silence at either end.
+	"""
+	n = int(rate * frame_time)
+	if len(x) < n:
+		return (0, len(x))
+	m = len(x) / n
+	p = numpy.mean(x[:m * n].reshape(m, n) ** 2, axis = 1)
+	loud = numpy.nonzero(p > 10.0 ** (threshold / 10.0))[0]
+	if len(loud) == 0:
+		return (0, 0)
+	return (loud[0] * n, (loud[-1] + 1) * n)
+
+
+def trim(x, rate, threshold = -40.0, frame_time = 0.02):
+	"""
+	Drop whole frames of silence from the start and the end.
+	"""
+	(start, end) = trim_bounds(x, rate, threshold, frame_time)
+	return x[start:end]
+
+
+def replace_file(path, lines):
+	"""
+	Write lines to path through a temporary file, so readers never see half.
+	"""
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		f.writelines(lines)
+	os.rename(tmp, path)
+
+
+def rewrite_talkers(path, out, lead, duration):
+	"""
+	Move path's talker index to out's, lead seconds having been cut from the
+	front and duration seconds kept.
+	"""
+	old = path + TALKER_INDEX_EXTENSION
+	if not os.path.exists(old):
+		return None
+	new = (os.path.splitext(out)[0] if out != path else path) + TALKER_INDEX_EXTENSION
+
+	entries = load_talker_index(old)
+	lines = list()
+	for i in range(len(entries)):
+		(offset, radio_id) = entries[i]
+		if i + 1 < len(entries) and entries[i + 1][0] <= lead:
+			continue		# replaced before the audio starts
+		offset = max(offset - lead, 0.0)
+		if offset >= duration and len(lines) > 0:
+			continue		# granted after the audio ends
+		lines.append("%.3f %d\n" % (offset, radio_id))
+	replace_file(new, lines)
+	return (old, new)
+
+
+def rewrite_segment(index, path, out, lead, duration):
+	"""
+	Point path's line in the segment index at out, with its start moved by
+	lead and its new duration.
+	"""
+	name = os.path.basename(path)
+	lines = list()
+	with open(index, "r") as f:
+		for l in f:
+			(start, length, segment) = l.split()
+			if segment == name:
+				l = "%.6f %.3f %s\n" % (float(start) + lead, duration, os.path.basename(out))
+			lines.append(l)
+	replace_file(index, lines)
+
+
+def normalize(x, peak):
+	m = numpy.max(numpy.abs(x)) if len(x) > 0 else 0.0
+	if m <= 0.0:
+		return x
+	return x * (peak / m)
+
+
+class post_processor:
+
+	_PEAK = 0.89		# -1dBFS
+
+	def __init__(self, encoding = 'pcm', threads = 2, max_queue = 256, logger = None, keep_original = False, done = None):
+
+		if encoding not in available_encodings():
+			raise ValueError("encoding %s not available (have %s)" % (encoding, ", ".join(available_encodings())))
+
+		self._encoding = encoding
+		self._logger = logger
+		self._keep_original = keep_original
+		self._done = done		# called with (recording, output path) after each recording
+
+		self._queue = Queue.Queue(max_queue)
+		self._lock = threading.Lock()
+		self._index_lock = threading.Lock()	# segments of one call share an index
+		self.processed = 0
+		self.dropped = 0
+		self.failed = 0
+		self._latency_sum = 0.0
+		self.latency_max = 0.0
+
+		self._threads = list()
+		for i in range(threads):
+			t = threading.Thread(target = self.worker)
+			t.daemon = True
+			t.start()
+			self._threads.append(t)
+
+
+	def depth(self):
+		return self._queue.qsize()
+
+
+	def latency_mean(self):
+		if self.processed == 0:
+			return 0.0
+		return self._latency_sum / self.processed
+
+
+	def submit(self, path, info = None, segment_index = None):
+		"""
+		Queue a finished recording.  Returns False if the queue was full.
+		info is passed on to the done callback.  segment_index is the
+		.segments index listing path, if it is one segment of a gated call.
+		"""
+		try:
+			self._queue.put_nowait((path, info, segment_index, time.time()))
+		except Queue.Full:
+			self.dropped += 1
+			return False
+		return True
+
+
+	def close(self):
+		"""
+		Process everything queued so far, then stop the threads.
+		"""
+		for t in self._threads:
+			self._queue.put(None)
+		for t in self._threads:
+			t.join()
+
+
+	def worker(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+			(path, info, segment_index, queued) = item
+			try:
+				out = self.process(path, segment_index)
+			except Exception, e:
+				self._lock.acquire()
+				self.failed += 1
+				self._lock.release()
+				if self._logger is not None:
+					self._logger.log_error("postprocess %s: %s" % (path, e))
+				continue
+
+			latency = time.time() - queued
+			self._lock.acquire()
+			self.processed += 1
+			self._latency_sum += latency
+			self.latency_max = max(self.latency_max, latency)
+			self._lock.release()
+
+			if self._logger is not None:
+				self._logger.log_info("postprocess %s: %.2fs (queue %d)" % (out, latency, self.depth()))
+			if self._done is not None:
+				self._done(out, info)
+
+
+	def process(self, path, segment_index = None):
+		(rate, x) = read_wav(path)
+		(start, end) = trim_bounds(x, rate)
+		x = normalize(x[start:end], self._PEAK)
+		pcm = (numpy.clip(x, -1.0, 1.0) * 32767.0).astype('<i2').tostring()
+
+		base = os.path.splitext(path)[0] if path.endswith(".wav") else path
+
+		if self._encoding == 'ulaw':
+			out = base + ".au"
+			a = sunau.open(out, "wb")
+			a.setnchannels(1)
+			a.setsampwidth(2)
+			a.setframerate(rate)
+			a.setcomptype('ULAW', 'CCITT G.711 u-law')
+			a.writeframes(pcm)
+			a.close()
+		else:
+			# pcm, and the input to the external encoders
+			tmp = tempfile.NamedTemporaryFile(suffix = ".wav", dir = os.path.dirname(path) or ".", delete = False)
+			tmp.close()
+			w = wave.open(tmp.name, "wb")
+			w.setnchannels(1)
+			w.setsampwidth(2)
+			w.setframerate(rate)
+			w.writeframes(pcm)
+			w.close()
+
+			if self._encoding == 'pcm':
+				out = base + ".wav"
+				os.rename(tmp.name, out)
+			else:
+				if self._encoding == 'flac':
+					out = base + ".flac"
+					cmd = [ENCODERS['flac'], "--silent", "--force", "-o", out, tmp.name]
+				else:
+					out = base + ".opus"
+					cmd = [ENCODERS['opus'], "--quiet", "--speech", tmp.name, out]
+				try:
+					subprocess.check_call(cmd)
+				finally:
+					os.unlink(tmp.name)
+
+		lead = start / float(rate)
+		duration = (end - start) / float(rate)
+		if segment_index is not None:
+			self._index_lock.acquire()
+			try:
+				rewrite_segment(segment_index, path, out, lead, duration)
+			finally:
+				self._index_lock.release()
+			moved = None
+		else:
+			moved = rewrite_talkers(path, out, lead, duration)
+
+		if not self._keep_original and out != path:
+			os.unlink(path)
+			if moved is not None and moved[0] != moved[1]:
+				os.unlink(moved[0])
+		return out
+
+
+# vim:ts=8:nowrap
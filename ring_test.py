@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+#
+# Two calls reading the shared ring through iq_ring_source, as smartzone
+# does with a pre-trigger, across the flow graph stop/start every new call
+# causes.  Each reader must see every sample, in order, exactly once, and
+# must notice a read torn by a write still in progress.  The ring's file
+# must be gone once its sink is closed.
+#
+
+import os
+import shutil
+import tempfile
+import numpy
+
+from iq_ring_blocks import iq_ring_sink, iq_ring_source
+from iq_ring import iq_ring, H_WRITE_CLAIM
+
+
+CAPACITY	= 1 << 16
+BLOCK		= 1000
+
+
+def restart(block):
+	"""
+	What the scheduler does to a block on top_block stop(), wait(), start().
+	"""
+	for f in ("stop", "start"):
+		m = getattr(block, f, None)
+		if m is not None:
+			m()
+
+
+def pull(src, out, n):
+	"""
+	Run src's work() until it has produced n samples into the list out.
+	"""
+	done = 0
+	buf = numpy.zeros(BLOCK, numpy.complex64)
+	while done < n:
+		k = src.work([], [buf[:min(BLOCK, n - done)]])
+		if k == 0:
+			break
+		out.append(buf[:k].copy())
+		done += k
+	return done
+
+
+def continuous(name, chunks, first, last):
+	"""
+	Returns the number of failures: chunks must hold first .. last - 1.
+	"""
+	x = numpy.concatenate(chunks).real.astype(numpy.int64) if len(chunks) > 0 else numpy.zeros(0, numpy.int64)
+	want = numpy.arange(first, last)
+	if len(x) != len(want) or (x != want).any():
+		print "%s: got %d samples (%s .. %s), expected %d .. %d" % (name, len(x), x[:1], x[-1:], first, last - 1)
+		return 1
+	return 0
+
+
+def main():
+	failed = 0
+	d = tempfile.mkdtemp()
+	try:
+		path = os.path.join(d, "ring")
+		ring = iq_ring(path, CAPACITY, 1e6)
+		written = [0]
+
+		def write(n):
+			ring.write(numpy.arange(written[0], written[0] + n).astype(numpy.complex64))
+			written[0] += n
+
+		# the first call starts with some history behind it
+		write(5000)
+		a = iq_ring_source(path, start = 1000)
+		got_a = list()
+		pull(a, got_a, 4000)
+
+		# a second call: the flow graph is stopped and restarted with it
+		write(3000)
+		restart(a)
+		b = iq_ring_source(path, start = 6000)
+		restart(b)
+		got_b = list()
+
+		if a.reader._slot == b.reader._slot:
+			print "both readers in slot %d" % (a.reader._slot,)
+			failed += 1
+
+		for i in range(5):
+			write(2000)
+			pull(a, got_a, 2000)
+			pull(b, got_b, 1500)
+			restart(a)
+			restart(b)
+
+		# drain both, then the first call ends
+		pull(a, got_a, written[0])
+		pull(b, got_b, written[0])
+		failed += continuous("first call", got_a, 1000, written[0])
+		failed += continuous("second call", got_b, 6000, written[0])
+
+		if a.overwritten != 0 or b.overwritten != 0:
+			print "overwritten reads: %d, %d" % (a.overwritten, b.overwritten)
+			failed += 1
+
+		# a write that has begun overwriting what b is copying, but has
+		# not yet published its count
+		write(CAPACITY / 2)
+		v = b.reader.read(BLOCK)
+		ring._hdr[H_WRITE_CLAIM] = b.reader.cursor() + CAPACITY + 1
+		if b.reader.consume(len(v)):
+			print "read torn by a write in progress not noticed"
+			failed += 1
+		ring._hdr[H_WRITE_CLAIM] = ring.write_count()
+
+		slot = a.reader._slot
+		a.close()
+		c = iq_ring_source(path)
+		if c.reader._slot != slot:
+			print "closed slot %d not reused (got %d)" % (slot, c.reader._slot)
+			failed += 1
+		if len(ring.stats()) != 2:
+			print "%d active readers, expected 2" % (len(ring.stats()),)
+			failed += 1
+		b.close()
+		c.close()
+		ring.close()
+
+		# the process that made the ring removes it when it closes
+		path = os.path.join(d, "sink")
+		sink = iq_ring_sink(path, CAPACITY, 1e6)
+		sink.close()
+		if os.path.exists(path):
+			print "%s left behind by iq_ring_sink.close()" % (path,)
+			failed += 1
+	finally:
+		shutil.rmtree(d)
+
+	return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+	exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+#
+# Gated audio recorder.
+#
+#	Writes audio only while someone is talking and splits a call into one
+#	wav file per transmission.
+#
+#	The audio is judged 20ms at a time.  A frame is active when its power is
+#	above the threshold; the squelch ahead of the recorder runs ungated so a
+#	closed squelch shows up here as silence, and so does an open carrier with
+#	nobody talking.  A segment starts at the first active frame and ends once
+#	hang_time has passed without one.
+#
+#	Next to the segments a per-call index is kept (call name + ".segments"),
+#	one line per segment:
+#
+#		<start time> <duration> <segment file>
+#
+#	Times are derived from the sample count, so they stay right when the
+#	channel is being fed from the pre-trigger buffer.
+#
+
+import os
+import math
+import wave
+import numpy
+from gnuradio import gr
+
+
+SEGMENT_INDEX_EXTENSION	= ".segments"
+
+
+class segment_recorder(gr.sync_block):
+
+	def __init__(self, call_name, segment_name, audio_rate, start_time, hang_time = 1.0, threshold = -40.0, bits_per_sample = 8, frame_time = 0.02):
+		"""
+		call_name:	path of the call; the segment index is written next to it
+		segment_name:	function of a start time returning the path of a segment
+		threshold:	frame power, in dB relative to full scale, that counts as audio
+		"""
+
+		gr.sync_block.__init__(
+			self,
+			name = "SmartZone Segment Recorder",
+			in_sig = [numpy.float32],
+			out_sig = None
+		)
+
+		self._segment_name = segment_name
+		self._rate = int(round(audio_rate))
+		self._start_time = start_time
+		self._bits = bits_per_sample
+
+		self._frame_len = int(round(audio_rate * frame_time))
+		self._hang_frames = int(math.ceil(hang_time / frame_time))
+		self._threshold = 10.0 ** (threshold / 10.0)
+
+		self._index_name = call_name + SEGMENT_INDEX_EXTENSION
+		self._index = None
+
+		self._pending = numpy.zeros(0, numpy.float32)	# partial frame carried to the next work()
+		self._frames = 0				# frames seen since the start of the call
+		self._hang = 0					# frames of hang time left
+
+		self._seg = None				# wave writer of the open segment
+		self._seg_path = None
+		self._seg_start = 0				# frame the open segment started at
+		self._seg_frames = 0
+		self._split = False				# split() asked for, done by work()
+
+		self.segments = list()				# [(start time, duration, path), ...]
+
+
+	def time_of(self, frame):
+		return self._start_time + frame * self._frame_len / float(self._rate)
+
+
+	def _open_segment(self, frame):
+		self._seg_path = self._segment_name(self.time_of(frame))
+		self._seg = wave.open(self._seg_path, "wb")
+		self._seg.setnchannels(1)
+		self._seg.setsampwidth(self._bits / 8)
+		self._seg.setframerate(self._rate)
+		self._seg_start = frame
+		self._seg_frames = 0
+
+
+	def _close_segment(self):
+		if self._seg is None:
+			return
+		self._seg.close()
+		duration = self._seg_frames * self._frame_len / float(self._rate)
+		self.segments.append((self.time_of(self._seg_start), duration, self._seg_path))
+		if self._index is None:
+			self._index = open(self._index_name, "a")
+		self._index.write("%.6f %.3f %s\n" % (self.time_of(self._seg_start), duration, os.path.basename(self._seg_path)))
+		self._index.flush()
+		self._seg = None
+		self._seg_path = None
+
+
+	def _pcm(self, x):
+		x = numpy.clip(x, -1.0, 1.0)
+		if self._bits == 8:
+			return (x * 127.0 + 128.0).astype(numpy.uint8).tostring()
+		return (x * 32767.0).astype('<i2').tostring()
+
+
+	def index_name(self):
+		return self._index_name
+
+
+	def split(self):
+		"""
+		End the current segment here (e.g. the talker changed); the next
+		active frame starts a new one.  Called from outside the scheduler,
+		so the segment is closed by work(), which owns it.
+		"""
+		self._split = True
+
+
+	def stop(self):
+		# the flow graph is stopped and restarted whenever a channel is added
+		return True
+
+
+	def close(self):
+		self._close_segment()
+		if self._index is not None:
+			self._index.close()
+			self._index = None
+
+
+	def work(self, input_items, output_items):
+
+		if self._split:
+			self._split = False
+			self._close_segment()
+
+		x = input_items[0]
+		if len(self._pending) > 0:
+			x = numpy.concatenate((self._pending, x))
+		n = len(x) / self._frame_len
+		frames = x[:n * self._frame_len].reshape(n, self._frame_len)
+		self._pending = numpy.array(x[n * self._frame_len:])
+
+		active = numpy.mean(frames * frames, axis = 1) > self._threshold
+
+		w = list()
+		for i in range(n):
+			if active[i]:
+				if self._seg is None:
+					self._open_segment(self._frames + i)
+				self._hang = self._hang_frames
+			elif self._seg is not None:
+				if self._hang > 0:
+					self._hang -= 1
+				else:
+					if len(w) > 0:
+						self._seg.writeframesraw(self._pcm(numpy.concatenate(w)))
+						w = list()
+					self._close_segment()
+					continue
+			if self._seg is not None:
+				w.append(frames[i])
+				self._seg_frames += 1
+
+		if len(w) > 0:
+			self._seg.writeframesraw(self._pcm(numpy.concatenate(w)))
+
+		self._frames += n
+		return len(input_items[0])
+
+
+# vim:ts=8:nowrap
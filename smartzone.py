@@ -1,16 +1,29 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import time
+import signal
+import tempfile
 import threading
 
-from gnuradio import gr, uhd
+from gnuradio import gr, uhd, blocks
 from gnuradio.eng_option import eng_option
 from optparse import OptionParser
 
 import trunk_logger
-from control_channel import control_channel
+from control_channel import control_channel, PROFILES
 from audio_channel import audio_channel
+from voice_worker import worker_supervisor
+from iq_ring_blocks import iq_ring_sink, iq_ring_source
+from iq_archive import iq_archive
+from postprocess import post_processor
+from file_manager import recorder_files
+from call_db import call_db
+from event_log import event_log
+from event_stream import event_publisher
+from latency import latency_tracker, STAGES
+import metrics
 from band_plan_800 import get_freq, get_chan
 
 
@@ -36,9 +49,62 @@ class smartzone(gr.top_block):
 		self._center_freq = (options.center * 1e6) if options.center < 1e6 else (options.center)
 		self._bandwidth = (options.bandwidth * 1e6) if options.bandwidth < 1e6 else (options.bandwidth)
 
-		self._logger = trunk_logger.logger(options.log_file)
+		self._logger = trunk_logger.logger(options.log_file, queue_size = options.log_queue)
 		self._cc_msg_q = gr.msg_queue(0)
 
+		# when voice workers are used, grants are handed to them rather than demodulated here
+		self._supervisor = None
+		self._archive = None
+		self._archive_only = options.archive_only
+
+		# seconds of wideband iq replayed into each new audio channel
+		self._pretrigger = options.pretrigger
+
+		# None, 'int16' or 'int8': also save each call's channelized iq
+		self._iq_export = options.iq_export
+
+		# write only while someone is talking, one file per transmission
+		self._gated = options.gated
+		self._hang_time = options.hang_time
+
+		# grants, affiliations and recordings, in sqlite
+		self._db = None
+		if options.db is not None:
+			self._db = call_db(options.db, logger = self._logger)
+
+		# everything the control channel decodes, as indexed records
+		self._event_log = None
+		if options.event_log is not None:
+			self._event_log = event_log(options.event_log)
+
+		# live events for local consumers
+		self._stream = None
+		if options.stream is not None:
+			self._stream = event_publisher(options.stream)
+
+		# grant to audio latency, summarized in the log every latency_interval seconds
+		self._latency = latency_tracker(self._logger, options.latency_interval)
+
+		# osw_handler listeners
+		self._listeners = [l for l in [self._db, self._event_log, self._stream] if l is not None]
+		self._text_log = options.text_log
+		self._max_neighbors = options.max_neighbors
+		self._source_decay = options.source_decay
+		self._framer = options.framer
+		self._demod_profile = options.demod_profile
+		self._chase_bits = options.chase_bits
+
+		# recording directories and files, prepared off the grant path
+		self._files = None
+		if options.workers == 0:
+			self._files = recorder_files(self._save_dir)
+
+		# trim, normalize and encode finished recordings off the flow graph
+		self._post = None
+		if (options.post is not None) and (options.workers == 0):
+			self._post = post_processor(options.post, options.post_threads, logger = self._logger, done = self.recording_done)
+
+		self._receiving = True
 		self._message_receiver = threading.Thread(target = self.message_receiver)
 		self._message_receiver.start()
 
@@ -58,27 +124,159 @@ class smartzone(gr.top_block):
 		# Each entry of this dictionary is itself a dictionary with the following
 		# keys:
 		#	'group_id':	the group id being broadcasted to on this channel
-		#	'radio_ids':	a list of radio ids (talkers) with timestamp
+		#	'radio_ids':	talker_timeline of the radio ids (talkers) with timestamp
 		#	'audio_block':	the audio processing block (to disable on channel tear-down)
+		#	'source':	the block feeding audio_block (self.u or its own ring reader)
 		#
 		self._audio_channels = dict()
 		self._audio_channel_list = list()	# iterative list of monitored audio channels
 		self._ac_lock = threading.Lock()	# hold lock when accessing audio channels
 
-		self.u = uhd.usrp_source(
-			device_addr = "",
-			stream_args = uhd.stream_args(
-				cpu_format = "fc32",
-				channels = range(1),
-			),
-		)
-		self.u.set_samp_rate(self._bandwidth)
-		self.u.set_center_freq(self._center_freq, 0)
-		self.u.set_antenna(options.antenna, 0)
+		if options.iq_file is not None:
+			# a recorded or synthetic (see synthetic.py) wideband stream, at its real rate
+			self._file_source = blocks.file_source(gr.sizeof_gr_complex, options.iq_file, options.repeat)
+			self.u = blocks.throttle(gr.sizeof_gr_complex, self._bandwidth)
+			self.connect(self._file_source, self.u)
+		else:
+			self.u = uhd.usrp_source(
+				device_addr = "",
+				stream_args = uhd.stream_args(
+					cpu_format = "fc32",
+					channels = range(1),
+				),
+			)
+			self.u.set_samp_rate(self._bandwidth)
+			self.u.set_center_freq(self._center_freq, 0)
+			self.u.set_antenna(options.antenna, 0)
+
+			gain_range = self.u.get_gain_range(0)
+			gain = gain_range.start() + self._GAIN * (gain_range.stop() - gain_range.start())
+			self.u.set_gain(gain)
 
-		gain_range = self.u.get_gain_range(0)
-		gain = gain_range.start() + self._GAIN * (gain_range.stop() - gain_range.start())
-		self.u.set_gain(gain)
+		#
+		# The iq ring holds the last few seconds of the wideband stream.  It is
+		# shared with the voice workers and is where pre-trigger audio comes from.
+		#
+		self._ring_sink = None
+		ring_path = options.ring
+		if (ring_path is None) and ((self._pretrigger > 0) or (options.workers > 0)):
+			ring_path = default_ring_path()
+		if ring_path is not None:
+			# one copy into shared memory; readers use it in place
+			self._ring_sink = iq_ring_sink(ring_path, int((options.ring_seconds + self._pretrigger) * self._bandwidth), self._bandwidth, self._center_freq)
+			self.connect(self.u, self._ring_sink)
+
+		# record-now, demodulate-later (see demod_archive.py)
+		if options.archive is not None:
+			self._archive = iq_archive(options.archive, self._bandwidth, self._center_freq, options.segment_seconds)
+			self.connect(self.u, self._archive)
+
+		# metrics, read when asked for: over http, and in the log on SIGUSR1
+		self.metrics = metrics.registry()
+		self.register_metrics(self.metrics)
+		metrics.dump_on_signal(self.metrics, self._logger)
+		if options.metrics_port is not None:
+			metrics.serve(self.metrics, options.metrics_port)
+
+		# per handler and per command osw_handler timing, reported on SIGUSR2 and on exit
+		self._profile_osw = options.profile_osw
+		if self._profile_osw:
+			signal.signal(signal.SIGUSR2, lambda signum, frame: self.log_profiles())
+
+		if options.workers > 0:
+			self._supervisor = worker_supervisor(options.workers, self._center_freq, self._bandwidth, self._save_dir, self._logger, ring = ring_path, pretrigger = self._pretrigger, iq_export = self._iq_export, gated = self._gated, hang_time = self._hang_time, post = options.post, post_threads = options.post_threads, db = options.db)
+
+
+	def _sinks(self):
+		return [(("%d" % (c,),), self._control_channels[c]['cc_block'].sink) for c in list(self._control_channel_list)]
+
+
+	def _block_perf(self, counter):
+		"""
+		A metric function reading a GNU Radio performance counter of every
+		block; blocks without the counter (or with counters off) are skipped.
+		"""
+		def read():
+			blocks = [("cc%d/%s" % (c, n), b) for c in list(self._control_channel_list) for (n, b) in self._control_channels[c]['cc_block'].perf_blocks]
+			blocks += [("ac%d/%s" % (c, n), b) for c in list(self._audio_channel_list) for (n, b) in self._audio_channels[c]['audio_block'].perf_blocks]
+			r = list()
+			for (name, b) in blocks:
+				try:
+					r.append(((name,), getattr(b, counter)()))
+				except (AttributeError, RuntimeError):
+					pass
+			return r
+		return read
+
+
+	def register_metrics(self, m):
+		m.counter("smartzone_frames_total", "Control channel frames received.", lambda: [(l, s.valid + s.errors) for (l, s) in self._sinks()], ("chan",))
+		m.counter("smartzone_crc_errors_total", "Control channel frames that failed their CRC.", lambda: [(l, s.errors) for (l, s) in self._sinks()], ("chan",))
+		m.gauge("smartzone_frame_rate", "Frames per second over the last minute.", lambda: [(l, s.frame_rate) for (l, s) in self._sinks()], ("chan",))
+		m.gauge("smartzone_crc_error_rate", "Fraction of frames failing their CRC over the last minute.", lambda: [(l, s.crc_error_rate) for (l, s) in self._sinks()], ("chan",))
+		m.counter("smartzone_osw_total", "OSWs decoded, by command.", lambda: [(l + ("%03x" % (cmd,),), n) for (l, s) in self._sinks() for (cmd, n) in enumerate(s.osw_handler.opcode_counts) if n > 0], ("chan", "cmd"))
+		m.counter("smartzone_soft_corrected_total", "Frames failing their CRC recovered by soft decision decoding (--framer only).", lambda: [(l, s.corrected) for (l, s) in self._sinks()], ("chan",))
+		m.counter("smartzone_soft_rejected_total", "Frames soft decision decoding refused as ambiguous or too far from what was received.", lambda: [(l, s.chase_rejected) for (l, s) in self._sinks()], ("chan",))
+		m.gauge("smartzone_frame_confidence", "Running mean of the frames' weakest symbol relative to their mean (--framer only).", lambda: [(l, s.confidence) for (l, s) in self._sinks()], ("chan",))
+		m.gauge("smartzone_active_calls", "Calls granted within the last second.", lambda: [(l, s.osw_handler.message_handler.active_calls()) for (l, s) in self._sinks()], ("chan",))
+		m.gauge("smartzone_demods", "Audio channels demodulated in this process.", lambda: len(self._audio_channel_list))
+		m.gauge("smartzone_msg_queue_depth", "Grants waiting for the message receiver.", self._cc_msg_q.count)
+		m.gauge("smartzone_log_queue_depth", "Log lines waiting to be written.", self._logger.depth)
+		m.counter("smartzone_log_dropped_total", "Log lines dropped because the log queue was full.", lambda: self._logger.dropped)
+		m.gauge("smartzone_listener_queue_depth", "Events waiting in each listener.", lambda: [((l.__class__.__name__,), l.depth()) for l in self._listeners], ("listener",))
+		m.counter("smartzone_listener_dropped_total", "Events dropped by each listener.", lambda: [((l.__class__.__name__,), l.dropped) for l in self._listeners], ("listener",))
+		if self._db is not None:
+			m.counter("smartzone_db_errors_total", "Call database batches lost to sqlite errors.", lambda: self._db.errors)
+		m.gauge("smartzone_latency_seconds", "Time from a grant's frame to each stage (see latency.py).", lambda: [((s, q), self._latency.histograms[s].percentile(p)) for s in STAGES for (q, p) in (("0.5", 50), ("0.99", 99))], ("stage", "quantile"))
+		m.gauge("smartzone_block_work_time_avg", "GNU Radio average work() time per block.", self._block_perf("pc_work_time_avg"), ("block",))
+		m.gauge("smartzone_block_throughput_avg", "GNU Radio average throughput per block.", self._block_perf("pc_throughput_avg"), ("block",))
+
+
+	def log_profiles(self):
+		for c in list(self._control_channel_list):
+			p = self._control_channels[c]['cc_block'].sink.osw_handler.profile
+			if p is not None:
+				for l in p.report():
+					self._logger.log("chan %d %s" % (c, l))
+
+
+	def close(self):
+		"""
+		Stop taking grants, finish the calls in progress and their
+		post-processing, then flush and close what outlives the flow graph:
+		the listeners (call database, event log, event stream), the archive,
+		the spare recording files, the iq ring, whose file is removed, and
+		the log.  Call it after stop() and wait().
+		"""
+
+		self._receiving = False
+		self._message_receiver.join()
+
+		# calls still up are over; their recordings are finished and
+		# post-processed (which reports them to the listeners) first
+		self._ac_lock.acquire()
+		for chan in self._audio_channel_list:
+			c = self._audio_channels[chan]
+			if c['source'] is not self.u:
+				c['source'].close()
+			self.audio_channel_closed(c['audio_block'])
+		self._audio_channel_list = list()
+		self._audio_channels = dict()
+		self._ac_lock.release()
+		if self._post is not None:
+			self._post.close()
+
+		for l in self._listeners:
+			l.close()
+		if self._archive is not None:
+			self._archive.close()
+		if self._files is not None:
+			self._files.close()
+		if self._ring_sink is not None:
+			self._ring_sink.close()
+
+		# last, so whatever the rest logged is written out
+		self._logger.close()
 
 
 	def control_channel_add(self, chan):
@@ -90,7 +288,10 @@ class smartzone(gr.top_block):
 			return
 
 		# XXX group description csv
-		cc = control_channel(self._bandwidth, get_freq(chan) * 1e6 - self._center_freq, queue = self._cc_msg_q, logger = self._logger, group_description_csv = "./SERS.groups.csv")
+		cc = control_channel(self._bandwidth, get_freq(chan) * 1e6 - self._center_freq, queue = self._cc_msg_q, logger = self._logger, group_description_csv = "./SERS.groups.csv", listeners = self._listeners, text_log = self._text_log, latency = self._latency, max_neighbors = self._max_neighbors, source_decay = self._source_decay, framer = self._framer, profile = self._demod_profile)
+		cc.sink.chase_bits = self._chase_bits
+		if self._profile_osw:
+			cc.sink.osw_handler.enable_profiling()
 		self.lock()
 		self.connect(self.u, cc)
 		self.unlock()
@@ -101,27 +302,66 @@ class smartzone(gr.top_block):
 		self._cc_lock.release()
 
 
-	def audio_channel_add(self, args):
+	def audio_source(self, grant_time):
+		"""
+		Return the block a new audio channel should be fed from.  With a
+		pre-trigger the channel gets its own ring reader that starts just
+		before the grant and catches up to live; otherwise it is the USRP.
+		"""
+
+		if self._pretrigger <= 0:
+			return self.u
+		ring = self._ring_sink.ring
+		return iq_ring_source(ring.path(), start = ring.index_at(grant_time - self._pretrigger))
+
+
+	def audio_channel_closed(self, ac):
+		"""
+		Finish a call that is no longer in the flow graph.
+		"""
+
+		ac.close()
+		for r in ac.recordings():
+			if self._post is not None:
+				self._post.submit(r, ac, ac.segment_index())
+			else:
+				self.recording_done(r, ac)
 
-		(sys_id, chan, group_id, radio_id) = args
+
+	def recording_done(self, path, ac):
+		fields = {'time': ac.start_time(), 'sys_id': ac.sys_id, 'chan': ac.chan, 'group_id': ac.group_id, 'is_group': ac.is_group, 'path': path}
+		for l in self._listeners:
+			l('recording', fields)
+
+
+	def audio_channel_add(self, args, grant_time = None, frame_time = None):
+
+		(sys_id, chan, group_id, radio_id, is_group) = args
+		if grant_time is None:
+			grant_time = time.time()
 		print "sys_id: %x, freq: %f, group: %x, radio: %d" % (sys_id, get_freq(chan), group_id, radio_id)
 
 		self._ac_lock.acquire()
 		ab_to_remove = None
+		src_to_remove = None
 		if chan in self._audio_channel_list:
 			c = self._audio_channels[chan]
 			if c['group_id'] == group_id:
-				c['radio_ids'].append([radio_id, time.time()]) # even if None
+				c['audio_block'].talker(radio_id, time.time())
 				self._ac_lock.release()
 				return
 
 			# group changed; that session must be over
 			ab_to_remove = self._audio_channels[chan]['audio_block']
+			src_to_remove = self._audio_channels[chan]['source']
 			del self._audio_channel_list[self._audio_channel_list.index(chan)]	# XXX write metadata about call
 			del self._audio_channels[chan]
 
 		# we have a new session
-		ac = audio_channel(self._bandwidth, get_freq(chan) * 1e6 - self._center_freq, sys_id, chan, group_id, self._save_dir)
+		# with a pre-trigger the recording starts before the grant
+		start_time = (grant_time - self._pretrigger) if self._pretrigger > 0 else None
+		ac = audio_channel(self._bandwidth, get_freq(chan) * 1e6 - self._center_freq, sys_id, chan, group_id, self._save_dir, is_group = is_group, start_time = start_time, iq_export = self._iq_export, gated = self._gated, hang_time = self._hang_time, files = self._files, first_sample = lambda: self._latency.record('first_sample', frame_time))
+		src = self.audio_source(grant_time)
 
 		print "stop flow graph"
 
@@ -132,39 +372,75 @@ class smartzone(gr.top_block):
 
 		print "connecting"
 		if ab_to_remove is not None:
-			self.disconnect(ab_to_remove)
-		self.connect(self.u, ac)
+			if src_to_remove is self.u:
+				self.disconnect(ab_to_remove)
+			else:
+				self.disconnect(src_to_remove, ab_to_remove)
+		self.connect(src, ac)
 
 		print "starting"
 		self.unlock()
 		self.start()
 
 		print "started"
+		self._latency.record('reconfigure', frame_time)
 
 		# remember it
-		self._audio_channels[chan] = {'group_id': group_id, 'radio_ids': [[radio_id, time.time()],], 'audio_block': ac}
+		ac.talker(radio_id, time.time())
+		self._audio_channels[chan] = {'group_id': group_id, 'radio_ids': ac.talkers, 'audio_block': ac, 'source': src}
 		self._audio_channel_list.append(chan)
 
 		self._ac_lock.release()
 
+		# the old call is out of the flow graph; finish it (renames, index
+		# files, post-processing) without holding up the next grant
+		if ab_to_remove is not None:
+			if src_to_remove is not self.u:
+				src_to_remove.close()
+			self.audio_channel_closed(ab_to_remove)
+
 
 	# 
 	# Messages are sent from a control channel to us each time
 	# a channel assignment is made.  The messages are the following:
 	#
-	#	analog audio:	type = 0, "sysid chan group_id <radio_id | -1>"
+	#	analog audio:	type = 0, "sysid chan group_id <radio_id | -1> is_group", arg1 = time of grant,
+	#			arg2 = time the grant's frame was complete
 	#
 	def message_receiver(self):
-		while True:
+		while self._receiving:
 			if not self._cc_msg_q.empty_p():
 				msg = self._cc_msg_q.delete_head()
 				if msg.type() == 0:
-					self.audio_channel_add(map(int, msg.to_string().split(' ')))
-					return
+					self._latency.record('dequeue', msg.arg2())
+					args = map(int, msg.to_string().split(' '))
+					if self._archive is not None:
+						self._archive.log_grant(args, msg.arg1())
+						if self._archive_only:
+							continue
+					if self._supervisor is not None:
+						self._supervisor.dispatch(args, msg.arg1())
+						continue
+					self.audio_channel_add(args, msg.arg1(), msg.arg2())
+					continue
 			time.sleep(0.001)
 		return
 
 
+def default_ring_path():
+	d = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+	return "%s/smartzone.%d.iq" % (d, os.getpid())
+
+
+def remove_ring(path):
+	if path is None:
+		return
+	try:
+		os.unlink(path)
+	except OSError:
+		pass
+
+
 def main():
 
 	SERS_WEST_SIMULCAST = 868.3375	# XXX should have stored file with previous good values
@@ -175,12 +451,56 @@ def main():
 	parser.add_option("-b", "--bandwidth", type = "float", default = 5, help = "Monitoring bandwidth in MHz.")
 	parser.add_option("-C", "--control-channel", type = "float", default = SERS_WEST_SIMULCAST, help = "Control channel in MHz. [default = %default]")
 	parser.add_option("-A", "--antenna", type = "string", default = "RX2", help = "Select RX antenna where appropriate.")
+	parser.add_option("-w", "--workers", type = "int", default = 0, help = "Demodulate voice in this many worker processes rather than in-process. [default = %default]")
+	parser.add_option("-R", "--ring", type = "string", default = None, help = "Share samples with the workers through an iq ring at this path. [default = /dev/shm/smartzone.<pid>.iq with --workers or --pretrigger]")
+	parser.add_option("-P", "--pretrigger", type = "float", default = 0.0, help = "Seconds of audio before each grant to record (uses an iq ring). [default = %default]")
+	parser.add_option("-I", "--iq-export", type = "choice", choices = ["int16", "int8"], default = None, help = "Also save each call's channelized iq quantized to int16 or int8.")
+	parser.add_option("-G", "--gated", action = "store_true", default = False, help = "Only write audio while someone is talking; one file per transmission.")
+	parser.add_option("", "--hang-time", type = "float", default = 1.0, help = "Seconds of silence that end a transmission when --gated. [default = %default]")
+	parser.add_option("-p", "--post", type = "choice", choices = ["pcm", "ulaw", "flac", "opus"], default = None, help = "Trim, normalize and encode finished recordings (pcm, ulaw, flac or opus).")
+	parser.add_option("", "--post-threads", type = "int", default = 2, help = "Threads used for --post. [default = %default]")
+	parser.add_option("-d", "--db", type = "string", default = None, help = "Keep grants, affiliations and recordings in this sqlite database (see call_db.py).")
+	parser.add_option("-e", "--event-log", type = "string", default = None, help = "Keep every decoded event in an indexed event log in this directory (see event_log.py).")
+	parser.add_option("-S", "--stream", type = "string", default = None, help = "Publish decoded events on this Unix socket path, or host:port (see event_stream.py).")
+	parser.add_option("", "--no-text-log", action = "store_false", dest = "text_log", default = True, help = "Do not write the text log of decoded events.")
+	parser.add_option("-a", "--archive", type = "string", default = None, help = "Archive the wideband stream and grants to this directory.")
+	parser.add_option("", "--archive-only", action = "store_true", default = False, help = "Only archive; do not demodulate calls live.")
+	parser.add_option("", "--segment-seconds", type = "float", default = 60.0, help = "Length of each archive segment in seconds. [default = %default]")
+	parser.add_option("-L", "--latency-interval", type = "float", default = 300.0, help = "Log a grant to audio latency summary this often (seconds, 0 for never). [default = %default]")
+	parser.add_option("-M", "--metrics-port", type = "int", default = None, help = "Serve metrics (Prometheus text format) on this local port.")
+	parser.add_option("", "--log-queue", type = "int", default = None, help = "Write the log from its own thread through a queue of this many lines.")
+	parser.add_option("", "--demod-profile", type = "choice", choices = PROFILES, default = "robust", help = "Control channel demodulator: %s (see control_channel.py; lean is not yet measured against robust). [default = %%default]" % (", ".join(PROFILES),))
+	parser.add_option("", "--framer", action = "store_true", default = False, help = "Slice, sync and frame control channel symbols in one block (see control_channel_framer.py).")
+	parser.add_option("", "--chase-bits", type = "int", default = 0, help = "With --framer, retry frames failing their CRC with this many of the least reliable bits flipped every way (6 is a good start; 0 for none). [default = %default]")
+	parser.add_option("", "--max-neighbors", type = "int", default = None, help = "Remember at most this many neighbor channels per control channel.")
+	parser.add_option("", "--source-decay", type = "float", default = None, help = "Halve the per-radio counts in the text log every this many seconds, so they follow recent activity. [default = count since start]")
+	parser.add_option("", "--profile-osw", action = "store_true", default = False, help = "Time osw_handler per handler and per command; reported on SIGUSR2 and on exit.")
+	parser.add_option("-i", "--iq-file", type = "string", default = None, help = "Read the wideband stream from this complex64 file instead of the radio.")
+	parser.add_option("", "--repeat", action = "store_true", default = False, help = "Play --iq-file over and over.")
+	parser.add_option("", "--ring-seconds", type = "float", default = 2.0, help = "Length of the shared iq ring in seconds. [default = %default]")
 	(options, args) = parser.parse_args()
 
 
-	sz = smartzone(options)
-	sz.control_channel_add(get_chan(options.control_channel))	# until we can scan for control channels
-	sz.run()
+	# the ring is hundreds of MB of tmpfs; it must go however we exit
+	if (options.ring is None) and ((options.pretrigger > 0) or (options.workers > 0)):
+		options.ring = default_ring_path()
+
+	try:
+		sz = smartzone(options)
+		sz.control_channel_add(get_chan(options.control_channel))	# until we can scan for control channels
+		sz.start()
+
+		# sleep rather than wait() so that signal handlers (metrics on SIGUSR1) run
+		try:
+			while True:
+				time.sleep(1.0)
+		finally:
+			sz.stop()
+			sz.wait()
+			sz.log_profiles()
+			sz.close()
+	finally:
+		remove_ring(options.ring)
 
 
 if __name__ == "__main__":
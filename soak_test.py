@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+#
+# Soak test: days of control channel traffic in minutes.
+#
+#	A synthetic_system (see synthetic.py) feeds frames to a
+#	control_channel_sink as fast as they can be made, under a fake clock
+#	that follows the workload's own time, so grants time out, logs expire
+#	and counters age as they would over the simulated days.  Grants taken
+#	off the queue are kept per channel the way smartzone keeps them
+#	(a talker_timeline per channel, replaced when the group changes).
+#
+#	Every --sample-minutes of simulated time the size of each long-lived
+#	structure is recorded, with the process's RSS and the number of objects
+#	the garbage collector knows of (there is no tracemalloc in Python 2).
+#	After --warmup-hours the rest of the run is cut into --windows windows;
+#	a measure that grows by more than --growth from each window to the next
+#	is growing without bound and the run fails.  Measures kept in fixed
+#	arrays (FIXED) are reported but not judged.  A measure with a bound
+#	(--max-neighbors, --history-size) fails the run as soon as it is sampled
+#	above it, with or without --unbounded.
+#
+#	The workload is made to need those bounds: a neighbor site moves to
+#	another channel every --neighbor-turnover seconds, so new neighbor
+#	channels keep being announced, and a scan marker is sent every
+#	--scan-marker seconds.  The scan marker's log line repeats before the
+#	logger's history expires it, so it stays at the head of the history and
+#	every distinct line logged after it (each CALL line carries a new count)
+#	is kept.
+#
+#	--check runs the workload twice and passes only when the bounded run
+#	passes and the --unbounded run fails.
+#
+
+import gc
+import sys
+import time
+import json
+from optparse import OptionParser
+
+from gnuradio import gr
+
+import trunk_logger
+from synthetic import synthetic_system, SYNC_BITS
+from control_channel_sink import control_channel_sink
+from talker_timeline import talker_timeline
+
+
+CC_CHAN		= 0x100
+CENTER		= 857.5
+EPOCH		= 1.5e9		# where the fake clock starts
+
+# fixed arrays over every radio id (affiliation_store, source_counter);
+# their counts fill up towards the number of radios but the memory never grows
+FIXED		= ['affiliations', 'sources']
+
+# measure -> option holding its bound
+BOUNDS		= {'neighbors': 'max_neighbors', 'log_history': 'history_size'}
+FAR		= 8		# a run stops once a measure is this many times its bound
+
+
+class fake_clock:
+	"""
+	Stands in for time.time while installed.
+	"""
+
+	def __init__(self, now):
+		self.now = now
+		self._time = None
+
+
+	def time(self):
+		return self.now
+
+
+	def install(self):
+		self._time = time.time
+		time.time = self.time
+
+
+	def remove(self):
+		if self._time is not None:
+			time.time = self._time
+			self._time = None
+
+
+def rss_kb():
+	"""
+	Resident set size from /proc/self/status, in kB (0 where there is no /proc).
+	"""
+	try:
+		with open("/proc/self/status", "r") as f:
+			for l in f:
+				if l.startswith("VmRSS:"):
+					return int(l.split()[1])
+	except IOError:
+		pass
+	return 0
+
+
+class soak:
+
+	def __init__(self, options, bounded = True):
+		self._options = options
+		self.clock = fake_clock(EPOCH)
+
+		self.system = synthetic_system(1e6, CENTER, CC_CHAN, grant_rate = options.grant_rate,
+			affiliation_rate = options.affiliation_rate, crc_error_rate = options.crc_errors,
+			radios = options.radios, groups = options.groups, neighbors = options.neighbors,
+			neighbor_turnover = options.neighbor_turnover, scan_marker_interval = options.scan_marker,
+			voice = False, truth = False, seed = options.seed)
+
+		self.logger = trunk_logger.logger("/dev/null", log_history = True, history_size = options.history_size if bounded else None)
+		self.queue = gr.msg_queue(0)
+		self.sink = control_channel_sink(self.logger, self.queue, max_neighbors = options.max_neighbors if bounded else None)
+		self.handler = self.sink.osw_handler
+
+		# chan -> {'group_id', 'radio_ids'}, as smartzone._audio_channels
+		self.channels = dict()
+
+		self.samples = list()
+
+
+	def measures(self):
+		"""
+		{name: size} of everything that could grow.
+		"""
+		h = self.handler
+		return {
+			'rss_kb':		rss_kb(),
+			'gc_objects':		len(gc.get_objects()),
+			'affiliations':		h.affiliations.affiliated(),
+			'sources':		int((h.source_counts.counts > 0).sum()),
+			'neighbors':		len(h._neighbors),
+			'log_history':		len(self.logger._history),
+			'call_history':		h.message_handler.active_calls(),
+			'osw_list':		h.len(),
+			'channels':		len(self.channels),
+			'talkers':		sum([len(c['radio_ids']) for c in self.channels.values()]),
+		}
+
+
+	def grants(self):
+		while not self.queue.empty_p():
+			msg = self.queue.delete_head()
+			(sys_id, chan, group_id, radio_id, is_group) = map(int, msg.to_string().split(' '))
+			c = self.channels.get(chan)
+			if c is None or c['group_id'] != group_id:
+				c = {'group_id': group_id, 'radio_ids': talker_timeline()}
+				self.channels[chan] = c
+			c['radio_ids'].add(radio_id, self.clock.now)
+
+
+	def sample(self):
+		m = self.measures()
+		m['hours'] = self.system.time / 3600.0
+		self.samples.append(m)
+		if self._options.verbose:
+			print " ".join(["%s %s" % (k, m[k]) for k in sorted(m)])
+
+
+	def far_past_bound(self):
+		"""
+		Measures in the last sample more than FAR times their bound.  Without
+		the bounds the log history is searched line by line for every line
+		logged, so a run goes no further once this is not empty.
+		"""
+		m = self.samples[-1]
+		return [k for k in BOUNDS if m[k] > FAR * getattr(self._options, BOUNDS[k])]
+
+
+	def run(self):
+		w = self.system
+		end = self._options.hours * 3600.0
+		every = self._options.sample_minutes * 60.0
+		next_sample = 0.0
+		start = time.time()
+
+		self.clock.install()
+		try:
+			while w.time < end:
+				b = w.next_frame()
+				self.clock.now = EPOCH + w.time
+				self.sink.process_stream(b[len(SYNC_BITS):])
+				self.grants()
+				if w.time >= next_sample:
+					self.clock.remove()
+					self.sample()
+					self.clock.install()
+					next_sample += every
+					if len(self.far_past_bound()) > 0:
+						break
+		finally:
+			self.clock.remove()
+		self.sample()
+		return time.time() - start
+
+
+def growing(samples, name, warmup_hours, windows, growth, floor):
+	"""
+	True when name grew by more than growth (and more than floor) from
+	each window after the warmup to the next.
+	"""
+	s = [x[name] for x in samples if x['hours'] >= warmup_hours]
+	n = len(s) / windows
+	if n == 0:
+		return False
+	peaks = [max(s[i * n:(i + 1) * n]) for i in range(windows)]
+	for i in range(1, windows):
+		if peaks[i] - peaks[i - 1] <= max(growth * peaks[i - 1], floor):
+			return False
+	return True
+
+
+def judge(s, options):
+	"""
+	Prints the first and last sample of each measure; returns the names of
+	those growing or over their bound.
+	"""
+	failed = list()
+	first = s.samples[0]
+	last = s.samples[-1]
+	for name in sorted(last):
+		if name == 'hours':
+			continue
+		if name in FIXED:
+			print "%-16s %12d %12d  (fixed)" % (name, first[name], last[name])
+			continue
+		g = growing(s.samples, name, options.warmup_hours, options.windows, options.growth, options.rss_floor if name == 'rss_kb' else 1)
+		bound = getattr(options, BOUNDS[name]) if name in BOUNDS else None
+		peak = max([x[name] for x in s.samples])
+		over = bound is not None and peak > bound
+		print "%-16s %12d %12d%s%s" % (name, first[name], last[name], "  GROWING" if g else "", ("  OVER BOUND (%d > %d)" % (peak, bound)) if over else "")
+		if g or over:
+			failed.append(name)
+	return failed
+
+
+def run(options, bounded):
+	s = soak(options, bounded)
+	elapsed = s.run()
+	hours = s.system.time / 3600.0
+	print "%s: %.1f simulated hours in %.0fs (%.0fx), %d frames" % ("bounded" if bounded else "unbounded",
+		hours, elapsed, hours * 3600.0 / elapsed, s.system.frames)
+	far = s.far_past_bound()
+	if len(far) > 0:
+		print "stopped early: %s past %d times the bound" % (", ".join(far), FAR)
+
+	if options.output is not None:
+		with open(options.output if bounded or options.unbounded else options.output + ".unbounded", "w") as f:
+			json.dump(s.samples, f, indent = 1, sort_keys = True)
+
+	failed = judge(s, options)
+	if len(failed) > 0:
+		print "growing or over bound: %s" % (", ".join(failed),)
+	return failed
+
+
+def main():
+
+	parser = OptionParser(usage = "%prog: [options]")
+	parser.add_option("-H", "--hours", type = "float", default = 24.0, help = "Simulated hours. [default = %default]")
+	parser.add_option("-s", "--sample-minutes", type = "float", default = 30.0, help = "Simulated minutes between samples. [default = %default]")
+	parser.add_option("-w", "--warmup-hours", type = "float", default = 2.0, help = "Growth before this is not held against the run. [default = %default]")
+	parser.add_option("-W", "--windows", type = "int", default = 4, help = "Windows the rest of the run is cut into. [default = %default]")
+	parser.add_option("-g", "--growth", type = "float", default = 0.05, help = "Fail on growth by more than this from every window to the next. [default = %default]")
+	parser.add_option("", "--rss-floor", type = "int", default = 1024, help = "Ignore RSS growth below this (kB) per window. [default = %default]")
+	parser.add_option("", "--grant-rate", type = "float", default = 2.0, help = "New calls per second. [default = %default]")
+	parser.add_option("", "--affiliation-rate", type = "float", default = 1.0, help = "Affiliations per second. [default = %default]")
+	parser.add_option("", "--crc-errors", type = "float", default = 0.01, help = "Fraction of frames with a bad CRC. [default = %default]")
+	parser.add_option("", "--radios", type = "int", default = 20000, help = "Radios in the system. [default = %default]")
+	parser.add_option("", "--groups", type = "int", default = 512, help = "Talkgroups in the system. [default = %default]")
+	parser.add_option("", "--neighbors", type = "int", default = 16, help = "Neighbor sites announced. [default = %default]")
+	parser.add_option("", "--neighbor-turnover", type = "float", default = 30.0, help = "Seconds between a neighbor site moving to a new channel, 0 for never. [default = %default]")
+	parser.add_option("", "--scan-marker", type = "float", default = 0.25, help = "Seconds between scan markers, 0 for none. [default = %default]")
+	parser.add_option("", "--max-neighbors", type = "int", default = 64, help = "Bound on remembered neighbor channels. [default = %default]")
+	parser.add_option("", "--history-size", type = "int", default = 256, help = "Bound on the logger's repeat history. [default = %default]")
+	parser.add_option("", "--unbounded", action = "store_true", default = False, help = "Run without the bounds above.")
+	parser.add_option("", "--check", action = "store_true", default = False, help = "Run with and without the bounds; pass when only the run without fails.")
+	parser.add_option("", "--seed", type = "int", default = 1, help = "Random seed. [default = %default]")
+	parser.add_option("-o", "--output", type = "string", default = None, help = "Write the samples here as JSON.")
+	parser.add_option("-v", "--verbose", action = "store_true", default = False, help = "Print each sample.")
+	(options, args) = parser.parse_args()
+
+	if options.check:
+		bounded = run(options, True)
+		print
+		unbounded = run(options, False)
+		print
+		if len(bounded) > 0 or len(unbounded) == 0:
+			print "check failed: the bounded run %s, the unbounded run %s" % ("failed" if len(bounded) > 0 else "passed", "failed" if len(unbounded) > 0 else "passed")
+			return 1
+		print "check passed: the bounds hold and are needed (%s)" % (", ".join(unbounded),)
+		return 0
+
+	return 1 if len(run(options, not options.unbounded)) > 0 else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
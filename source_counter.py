@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+#
+# How often each source id has been seen.
+#
+#	Ids are 16 bits, so the counts are a fixed array indexed by id and the
+#	memory used does not grow with the number of ids heard.  With a decay
+#	interval every count is halved once per interval, so the counts (and
+#	top()) follow recent activity rather than all time.  Intervals with
+#	nothing counted are caught up on the next add() or top().
+#
+
+import time
+import numpy
+
+
+SOURCE_IDS	= 0x10000
+
+
+class source_counter:
+
+	def __init__(self, decay_interval = None):
+		self.counts = numpy.zeros(SOURCE_IDS, numpy.uint32)
+		self._decay_interval = decay_interval
+		self._next_decay = (time.time() + decay_interval) if decay_interval is not None else None
+
+
+	def add(self, source):
+		"""
+		Count source and return its new count.
+		"""
+		self.maybe_decay()
+		n = self.counts[source] + 1
+		self.counts[source] = n
+		return int(n)
+
+
+	def __getitem__(self, source):
+		return int(self.counts[source])
+
+
+	def maybe_decay(self, now = None):
+		"""
+		Halve the counts once for every decay interval that has ended.
+		"""
+		if self._next_decay is None:
+			return
+		if now is None:
+			now = time.time()
+		if now < self._next_decay:
+			return
+		k = 1 + int((now - self._next_decay) / self._decay_interval)
+		self.counts >>= min(k, 32)
+		self._next_decay += k * self._decay_interval
+
+
+	def decay(self):
+		self.counts >>= 1
+		if self._decay_interval is not None:
+			self._next_decay = time.time() + self._decay_interval
+
+
+	def reset(self):
+		self.counts.fill(0)
+
+
+	def top(self, k = 10):
+		"""
+		[(source, count), ...] for the k most frequent sources, most frequent first.
+		"""
+		if k <= 0:
+			return []
+		self.maybe_decay()
+		k = min(k, SOURCE_IDS)
+		i = numpy.argpartition(self.counts, SOURCE_IDS - k)[SOURCE_IDS - k:]
+		i = i[numpy.argsort(self.counts[i])[::-1]]
+		return [(int(s), int(self.counts[s])) for s in i if self.counts[s] > 0]
+
+
+# vim:ts=8:nowrap
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+
+#
+# Synthetic SmartZone signal, for load testing without the real system.
+#
+#	This is control_channel_sink run backwards.  Each OSW (id, group bit,
+#	command) is turned into the 38 bits the sink parses, with its CRC and a
+#	spare bit, parity encoded to 76 bits, interleaved, and sent after the
+#	"10101100" sync as an 84-bit frame at 3600 baud.  A synthetic_system
+#	decides which OSWs go out (system id, grants and their refreshes,
+#	affiliations, idle words), FSK modulates them at the control channel's
+#	offset, adds an FM carrier on the channel of every call in progress
+#	and noise, and keeps a list of what it sent.
+#
+#	The result can be written as an iq file (complex64, what file_source
+#	reads; see smartzone.py --iq-file), as sliced bits, or used directly.
+#	Everything is driven from one seed, so a workload is repeatable.
+#
+#	Noise is given as the carrier to noise ratio (dB) in 12.5kHz.
+#
+
+import sys
+import json
+import math
+import numpy
+from collections import deque
+from optparse import OptionParser
+
+from osw_handler import OSW_CMD
+from band_plan import STANDARD_800
+
+
+BAUD		= 3600.0
+SYNC_BITS	= [1, 0, 1, 0, 1, 1, 0, 0]
+FRAME_BITS	= 84
+CC_DEVIATION	= 4e3		# as control_channel expects
+VOICE_DEVIATION	= 2.5e3
+NOISE_BANDWIDTH	= 12.5e3
+
+
+#
+#	Bits
+#
+
+def uint_to_list(v, n):
+	"""
+	The inverse of control_channel_sink.list_to_uint: n bits, msb first, inverted.
+	"""
+	return [((v >> (n - 1 - i)) & 1) ^ 1 for i in range(n)]
+
+
+def crc(d):
+	"""
+	The CRC control_channel_sink.check_crc expects for the first 27 bits of d.
+	"""
+	a = 0x0393
+	o = 0x036e
+	for b in d[:27]:
+		if bool(o & 1):
+			o = (o >> 1) ^ 0x0225
+		else:
+			o = (o >> 1)
+		if bool(b):
+			a = a ^ o
+	return a
+
+
+def osw_bits(osw_id, g, cmd, crc_error = 0):
+	"""
+	The 38 bits osw_handler.parse_raw_osw parses.  A nonzero crc_error is
+	xored into the CRC.
+	"""
+	d = uint_to_list(osw_id ^ 0x33c7, 16) + [g ^ 1,] + uint_to_list(cmd ^ 0x032a, 10)
+	return d + uint_to_list(crc(d) ^ crc_error, 10) + [1,]
+
+
+def parity_encode(data):
+	"""
+	(data, parity) pairs, as control_channel_sink.parity_decode takes them apart.
+	"""
+	r = list()
+	p = 0
+	for b in data:
+		r += [b, b ^ p]
+		p = b
+	return r
+
+
+def interleave(d):
+	"""
+	The inverse of control_channel_sink.deinterleave.
+	"""
+	n = len(d) / 4
+	s = [0,] * len(d)
+	for k in range(n):
+		for l in range(4):
+			s[k + l * n] = d[4 * k + l]
+	return s
+
+
+def frame_bits(osw_id, g, cmd, crc_error = 0):
+	"""
+	One OSW as sent on air, sync included.
+	"""
+	return SYNC_BITS + interleave(parity_encode(osw_bits(osw_id, g, cmd, crc_error)))
+
+
+def correlated(bits, frames):
+	"""
+	bits (a whole number of frames, from the first sync bit) marked as
+	correlate_access_code_bb marks them: bit 1 set on the first bit after
+	each sync.  This is what control_channel_sink takes.
+	"""
+	r = numpy.array(bits, numpy.uint8)
+	r[len(SYNC_BITS) + FRAME_BITS * numpy.arange(frames)] |= 2
+	return r
+
+
+#
+#	OSW sequences
+#
+
+def idle_words(sys_id):
+	return [(sys_id, 0, OSW_CMD.BACKGROUND_IDLE)]
+
+
+def sys_id_words(sys_id, chan):
+	return [(sys_id, 0, OSW_CMD.FIRST_NORMAL), (0x2800 | chan, 0, OSW_CMD.EXTENDED_FCN)]
+
+
+def scan_marker_words(sys_id):
+	return [(sys_id, 0, OSW_CMD.SCAN_MARKER)]
+
+
+def sys_status_words(tone):
+	return [((1 << 13) | (tone << 5), 0, OSW_CMD.SYS_STATUS)]
+
+
+def grant_words(radio_id, group_id, chan):
+	return [(radio_id, 0, OSW_CMD.FIRST_NORMAL), (group_id, 1, chan)]
+
+
+def affiliation_words(radio_id, group_id):
+	return [(radio_id, 0, OSW_CMD.FIRST_NORMAL), (group_id, 1, OSW_CMD.TY2_AFFILIATION)]
+
+
+def unaffiliation_words(radio_id):
+	return [(radio_id, 0, OSW_CMD.FIRST_NORMAL), (0x2610, 0, OSW_CMD.EXTENDED_FCN)]
+
+
+def neighbor_words(sys_id, site, chan, band = 0, flags = 0x10):
+	return [(sys_id, 0, OSW_CMD.FIRST_NORMAL), ((site << 10) | (band << 7) | flags, 0, 0x320), (chan, 0, OSW_CMD.EXTENDED_FCN)]
+
+
+#
+#	Signal
+#
+
+class _oscillator:
+	"""
+	Continuous phase from one block to the next.
+	"""
+
+	def __init__(self):
+		self.phase = 0.0
+
+	def run(self, inst_freq, sample_rate):
+		p = self.phase + numpy.cumsum(inst_freq) * (2.0 * math.pi / sample_rate)
+		self.phase = math.fmod(p[-1], 2.0 * math.pi) if len(p) > 0 else self.phase
+		return numpy.exp(1j * p)
+
+
+class synthetic_system:
+
+	_SYS_ID_INTERVAL	= 1.0		# seconds between system id words
+	_REFRESH_INTERVAL	= 0.4		# seconds between grant refreshes of a call (message_handler times out at 1)
+	_TALKER_CHANGE		= 0.2		# chance a refresh names a new talker
+
+	def __init__(self, sample_rate, center_freq, cc_chan, sys_id = 0x1234, plan = STANDARD_800,
+			grant_rate = 1.0, max_calls = 8, call_seconds = 8.0, affiliation_rate = 0.5,
+			crc_error_rate = 0.0, snr = 30.0, voice = True, groups = 64, radios = 2000, neighbors = 0,
+			neighbor_turnover = 0.0, scan_marker_interval = 0.0, truth = True, seed = None):
+
+		self.sample_rate = float(sample_rate)
+		self.center_freq = (center_freq * 1e6) if center_freq < 1e6 else center_freq
+		self.sys_id = sys_id
+		self.cc_chan = cc_chan
+		self._plan = plan
+		self._grant_rate = grant_rate
+		self._max_calls = max_calls
+		self._call_seconds = call_seconds
+		self._affiliation_rate = affiliation_rate
+		self._crc_error_rate = crc_error_rate
+		self._voice = voice
+		self._groups = groups
+		self._radios = radios
+		self._rng = numpy.random.RandomState(seed)			# what is sent
+		self._signal_rng = numpy.random.RandomState(self._rng.randint(1 << 30))	# audio and noise
+		self._noise_std = math.sqrt(self.sample_rate / NOISE_BANDWIDTH / 10.0 ** (snr / 10.0) / 2.0) if snr is not None else 0.0
+
+		self._cc_offset = plan.get_freq(cc_chan) * 1e6 - self.center_freq
+		if abs(self._cc_offset) > self.sample_rate / 2:
+			raise ValueError("control channel %d is outside the band" % (cc_chan,))
+		# channels far enough inside the band for a voice carrier
+		self._voice_chans = [c for c in numpy.flatnonzero(plan.valid).tolist()
+			if c != cc_chan and abs(plan.get_freq(c) * 1e6 - self.center_freq) < 0.45 * self.sample_rate]
+		# neighbor sites, one announced after each system id
+		self._neighbor_chans = numpy.flatnonzero(plan.valid).tolist()
+		self._neighbors = [(i + 1, self._neighbor_chans[self._rng.randint(len(self._neighbor_chans))]) for i in range(neighbors)]
+		self._next_neighbor = 0
+		# seconds between one neighbor site moving to another channel (0: never)
+		self._neighbor_turnover = neighbor_turnover
+		self._next_turnover = neighbor_turnover
+		# seconds between scan markers (0: none)
+		self._scan_marker_interval = scan_marker_interval
+		self._next_scan_marker = 0.0
+
+		self.slot = 0
+		self.time = 0.0
+		self._slot_seconds = FRAME_BITS / BAUD
+		self._samples_done = 0
+		self._pending = deque()
+		self._next_sys_id = 0.0
+		self._calls = dict()			# chan -> call
+		self._cc_osc = _oscillator()
+
+		self.truth = list()			# (time, kind, fields) of what was sent, if truth
+		self._keep_truth = truth
+		self.frames = 0
+		self.crc_errors = 0
+
+		self._pending.extend(sys_status_words(3))
+
+
+	def _note(self, kind, **fields):
+		if not self._keep_truth:
+			return
+		self.truth.append((self.time, kind, fields))
+
+
+	def _schedule(self):
+		"""
+		Decide what is sent in the current slot; returns one OSW.
+		"""
+		t = self.time
+		rng = self._rng
+
+		for chan in [c for c in self._calls if self._calls[c]['end'] <= t]:
+			self._note('call_end', chan = chan, group_id = self._calls[chan]['group_id'])
+			del self._calls[chan]
+
+		if t >= self._next_sys_id:
+			self._pending.extend(sys_id_words(self.sys_id, self.cc_chan))
+			if len(self._neighbors) > 0:
+				if self._neighbor_turnover > 0 and t >= self._next_turnover:
+					i = rng.randint(len(self._neighbors))
+					self._neighbors[i] = (self._neighbors[i][0], self._neighbor_chans[rng.randint(len(self._neighbor_chans))])
+					self._next_turnover = t + self._neighbor_turnover
+				(site, chan) = self._neighbors[self._next_neighbor]
+				self._next_neighbor = (self._next_neighbor + 1) % len(self._neighbors)
+				self._pending.extend(neighbor_words(self.sys_id, site, chan))
+			self._next_sys_id = t + self._SYS_ID_INTERVAL
+
+		if self._scan_marker_interval > 0 and t >= self._next_scan_marker:
+			self._pending.extend(scan_marker_words(self.sys_id))
+			self._next_scan_marker = t + self._scan_marker_interval
+
+		for i in range(rng.poisson(self._grant_rate * self._slot_seconds)):
+			free = [c for c in self._voice_chans if c not in self._calls]
+			if len(self._calls) >= self._max_calls or len(free) == 0:
+				self._note('blocked')
+				continue
+			c = {
+				'chan':		free[rng.randint(len(free))],
+				'group_id':	rng.randint(1, self._groups + 1) << 4,
+				'radio_id':	rng.randint(1, self._radios + 1),
+				'end':		t + rng.exponential(self._call_seconds),
+				'refresh':	t + self._REFRESH_INTERVAL,
+				'osc':		_oscillator(),
+			}
+			self._calls[c['chan']] = c
+			self._pending.extend(grant_words(c['radio_id'], c['group_id'], c['chan']))
+			self._note('grant', chan = c['chan'], group_id = c['group_id'], radio_id = c['radio_id'])
+
+		for i in range(rng.poisson(self._affiliation_rate * self._slot_seconds)):
+			radio_id = rng.randint(1, self._radios + 1)
+			if rng.random_sample() < 0.1:
+				self._pending.extend(unaffiliation_words(radio_id))
+				self._note('unaffiliation', radio_id = radio_id)
+			else:
+				group_id = rng.randint(1, self._groups + 1) << 4
+				self._pending.extend(affiliation_words(radio_id, group_id))
+				self._note('affiliation', radio_id = radio_id, group_id = group_id)
+
+		if len(self._pending) == 0:
+			for c in self._calls.values():
+				if c['refresh'] <= t:
+					if rng.random_sample() < self._TALKER_CHANGE:
+						c['radio_id'] = rng.randint(1, self._radios + 1)
+						self._note('talker', chan = c['chan'], radio_id = c['radio_id'])
+					self._pending.extend(grant_words(c['radio_id'], c['group_id'], c['chan']))
+					c['refresh'] = t + self._REFRESH_INTERVAL
+					break
+
+		if len(self._pending) == 0:
+			return idle_words(self.sys_id)[0]
+		return self._pending.popleft()
+
+
+	def next_frame(self):
+		"""
+		Bits of the next frame, advancing the workload by one slot.
+		"""
+		(osw_id, g, cmd) = self._schedule()
+		crc_error = 0
+		if self._crc_error_rate > 0 and self._rng.random_sample() < self._crc_error_rate:
+			crc_error = self._rng.randint(1, 1024)
+			self.crc_errors += 1
+		self.frames += 1
+		self.slot += 1
+		self.time = self.slot * self._slot_seconds
+		return frame_bits(osw_id, g, cmd, crc_error)
+
+
+	def bits(self, frames):
+		"""
+		frames frames of sliced bits, as a uint8 array of 0 and 1.
+		"""
+		r = list()
+		for i in range(frames):
+			r += self.next_frame()
+		return numpy.array(r, numpy.uint8)
+
+
+	def _voice_audio(self, n):
+		"""
+		Band limited noise, standing in for speech.
+		"""
+		w = max(int(self.sample_rate / 3000.0), 1)
+		x = self._signal_rng.standard_normal(n + w)
+		s = numpy.cumsum(x)
+		a = (s[w:] - s[:-w]) / math.sqrt(w)
+		return numpy.clip(a * 0.5, -1.0, 1.0)
+
+
+	def samples_for_frame(self):
+		"""
+		The next frame as complex baseband at sample_rate, control channel,
+		voice carriers and noise.
+		"""
+		start = self._samples_done
+		t0 = self.time
+		bits = self.next_frame()
+		end = int(round(self.slot * self._slot_seconds * self.sample_rate))
+		n = end - start
+		self._samples_done = end
+
+		# which bit each sample falls in
+		k = numpy.floor((numpy.arange(start, end) / self.sample_rate - t0) * BAUD).astype(numpy.int64)
+		sym = numpy.array(bits, numpy.float64)[numpy.clip(k, 0, FRAME_BITS - 1)] * 2.0 - 1.0
+		x = self._cc_osc.run(CC_DEVIATION * sym + self._cc_offset, self.sample_rate)
+
+		if self._voice:
+			for c in self._calls.values():
+				f = VOICE_DEVIATION * self._voice_audio(n) + (self._plan.get_freq(c['chan']) * 1e6 - self.center_freq)
+				x += c['osc'].run(f, self.sample_rate)
+
+		if self._noise_std > 0:
+			x += self._noise_std * (self._signal_rng.standard_normal(n) + 1j * self._signal_rng.standard_normal(n))
+
+		return x.astype(numpy.complex64)
+
+
+	def samples(self, seconds):
+		r = list()
+		end = self.time + seconds
+		while self.time < end:
+			r.append(self.samples_for_frame())
+		return numpy.concatenate(r)
+
+
+	def write_truth(self, path):
+		with open(path, "w") as f:
+			for (t, kind, fields) in self.truth:
+				r = dict(fields)
+				r['time'] = t
+				r['kind'] = kind
+				f.write(json.dumps(r, separators = (',', ':')) + "\n")
+
+
+def write_iq(system, path, seconds, block_seconds = 1.0):
+	"""
+	Write seconds of system's signal to path as complex64.
+	"""
+	with open(path, "wb") as f:
+		end = system.time + seconds
+		while system.time < end:
+			system.samples(min(block_seconds, end - system.time)).tofile(f)
+
+
+def main():
+
+	parser = OptionParser(usage = "%prog: [options] output")
+	parser.add_option("-s", "--seconds", type = "float", default = 60.0, help = "Length of the output. [default = %default]")
+	parser.add_option("-r", "--sample-rate", type = "float", default = 1e6, help = "Sample rate. [default = %default]")
+	parser.add_option("-f", "--center", type = "float", default = 857.5, help = "Center frequency (MHz). [default = %default]")
+	parser.add_option("-c", "--control-channel", type = "float", default = 857.4875, help = "Control channel frequency (MHz). [default = %default]")
+	parser.add_option("-S", "--sys-id", type = "string", default = "1234", help = "System id (hex). [default = %default]")
+	parser.add_option("-g", "--grant-rate", type = "float", default = 1.0, help = "New calls per second. [default = %default]")
+	parser.add_option("-n", "--calls", type = "int", default = 8, help = "Most calls at once. [default = %default]")
+	parser.add_option("-l", "--call-seconds", type = "float", default = 8.0, help = "Mean call length. [default = %default]")
+	parser.add_option("-a", "--affiliation-rate", type = "float", default = 0.5, help = "Affiliations per second. [default = %default]")
+	parser.add_option("-e", "--crc-errors", type = "float", default = 0.0, help = "Fraction of frames sent with a bad CRC. [default = %default]")
+	parser.add_option("", "--snr", type = "float", default = 30.0, help = "Carrier to noise ratio in 12.5kHz (dB). [default = %default]")
+	parser.add_option("", "--no-voice", action = "store_false", dest = "voice", default = True, help = "No voice carriers.")
+	parser.add_option("", "--seed", type = "int", default = 1, help = "Random seed. [default = %default]")
+	parser.add_option("-b", "--bits", action = "store_true", default = False, help = "Write sliced bits (one 0/1 byte per bit) rather than iq.")
+	(options, args) = parser.parse_args()
+
+	if len(args) != 1:
+		parser.print_help()
+		return 1
+
+	system = synthetic_system(options.sample_rate, options.center, STANDARD_800.get_chan(options.control_channel),
+		sys_id = int(options.sys_id, 16), grant_rate = options.grant_rate, max_calls = options.calls,
+		call_seconds = options.call_seconds, affiliation_rate = options.affiliation_rate,
+		crc_error_rate = options.crc_errors, snr = options.snr, voice = options.voice, seed = options.seed)
+
+	if options.bits:
+		system.bits(int(options.seconds / (FRAME_BITS / BAUD))).tofile(args[0])
+	else:
+		write_iq(system, args[0], options.seconds)
+	system.write_truth(args[0] + ".truth")
+
+	print "%d frames (%d with bad crc), %d grants" % (system.frames, system.crc_errors, len([e for e in system.truth if e[1] == 'grant']))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap
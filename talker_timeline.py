@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#
+# Who talked when, during one call.
+#
+#	Every grant refresh for a call names the radio that keyed up.  Only
+#	changes of talker are kept, in two parallel arrays, and the number of
+#	entries is bounded so a call that stays up for hours cannot grow it
+#	without limit (the oldest entries are dropped first).
+#
+
+import bisect
+from array import array
+
+
+TALKER_INDEX_EXTENSION	= ".talkers"
+
+
+class talker_timeline:
+
+	def __init__(self, max_len = 256):
+		self._max_len = max_len
+		self._ids = array('i')
+		self._times = array('d')
+		self.dropped = 0
+
+
+	def __len__(self):
+		return len(self._ids)
+
+
+	def add(self, radio_id, t):
+		"""
+		Note that radio_id was granted the call at time t.  Returns True when
+		this is a change of talker.  Grants without a talker (radio_id < 0)
+		are ignored.
+		"""
+
+		if radio_id is None or radio_id < 0:
+			return False
+		if len(self._ids) > 0 and self._ids[-1] == radio_id:
+			return False
+
+		if len(self._ids) >= self._max_len:
+			del self._ids[0]
+			del self._times[0]
+			self.dropped += 1
+		self._ids.append(radio_id)
+		self._times.append(t)
+		return True
+
+
+	def current(self):
+		if len(self._ids) == 0:
+			return None
+		return self._ids[-1]
+
+
+	def at(self, t):
+		"""
+		The radio talking at time t, if known.
+		"""
+		i = bisect.bisect_right(self._times, t) - 1
+		if i < 0:
+			return None
+		return self._ids[i]
+
+
+	def entries(self):
+		return zip(self._ids, self._times)
+
+
+	def talkers(self):
+		return sorted(set(self._ids))
+
+
+	def intervals(self, radio_id, end_time):
+		"""
+		[(start, end), ...] during which radio_id held the call.
+		"""
+		r = list()
+		n = len(self._ids)
+		for i in range(n):
+			if self._ids[i] == radio_id:
+				r.append((self._times[i], self._times[i + 1] if i + 1 < n else end_time))
+		return r
+
+
+	def write_index(self, path, start_time):
+		"""
+		Write "<offset in seconds> <radio id>" lines, offsets relative to
+		start_time (the start of the recording).
+		"""
+		with open(path, "w") as f:
+			for (radio_id, t) in self.entries():
+				f.write("%.3f %d\n" % (max(t - start_time, 0.0), radio_id))
+
+
+def load_talker_index(path):
+	"""
+	Read back a per-call index as a list of (offset, radio_id).
+	"""
+	r = list()
+	with open(path, "r") as f:
+		for l in f:
+			(offset, radio_id) = l.split()
+			r.append((float(offset), int(radio_id)))
+	return r
+
+
+# vim:ts=8:nowrap
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import time
+import Queue
+import threading
 from sys import stdout
 
 
@@ -12,12 +14,23 @@ LOG_DEBUG	= 4
 
 class logger:
 
-	def __init__(self, log_filename = None, log_prio = LOG_NORMAL, log_include_date = True, log_history = False):
+	def __init__(self, log_filename = None, log_prio = LOG_NORMAL, log_include_date = True, log_history = False, queue_size = None, history_size = None):
 		self._prio = log_prio
 		self._include_date = log_include_date
 		self._logfile = (stdout) if log_filename is None else (open(log_filename, "a"))
 		self._enable_history = log_history
 		self._history = list()
+		self._history_size = history_size	# None: bounded only by expiry
+
+		# with a queue_size, lines are written by a thread of their own and
+		# dropped (and counted) when the queue is full
+		self._queue = None
+		self.dropped = 0
+		if queue_size is not None:
+			self._queue = Queue.Queue(queue_size)
+			self._writer = threading.Thread(target = self.writer)
+			self._writer.daemon = True
+			self._writer.start()
 
 
 	def __del__(self):
@@ -29,6 +42,54 @@ class logger:
 		self._prio = p
 
 
+	def depth(self):
+		if self._queue is None:
+			return 0
+		return self._queue.qsize()
+
+
+	def write(self, line):
+		if self._queue is None:
+			self._logfile.write(line)
+			self._logfile.flush()
+			return
+		try:
+			self._queue.put_nowait(line)
+		except Queue.Full:
+			self.dropped += 1
+
+
+	def writer(self):
+		while True:
+			lines = [self._queue.get(),]
+			while True:
+				try:
+					lines.append(self._queue.get_nowait())
+				except Queue.Empty:
+					break
+			done = None in lines
+			if done:
+				lines = lines[:lines.index(None)]
+			self._logfile.write("".join(lines))
+			self._logfile.flush()
+			if done:
+				return
+
+
+	def close(self):
+		"""
+		Write out every line queued so far, stop the writer and close the
+		log file.  Lines logged afterwards are dropped.
+		"""
+		if self._queue is not None:
+			self._queue.put(None)
+			self._writer.join()
+		f = self._logfile
+		self._logfile = None
+		if f is not None and f is not stdout:
+			f.close()
+
+
 	def expire_log_history(self):
 		now = time.time()
 		n = list(self._history)
@@ -45,6 +106,8 @@ class logger:
 			if s == self._history[i][1]:
 				self._history[i][0] = time.time()
 				return True
+		if self._history_size is not None and len(self._history) >= self._history_size:
+			del self._history[0]
 		self._history.append([time.time(), s])
 		return False
 
@@ -55,10 +118,9 @@ class logger:
 				if self._enable_history and self.remember_log(s):
 					return
 				if self._include_date:
-					self._logfile.write("%s:   %s\n" % (time.asctime(), s))
+					self.write("%s:   %s\n" % (time.asctime(), s))
 				else:
-					self._logfile.write("%s" % (s,))
-				self._logfile.flush()
+					self.write("%s" % (s,))
 
 
 	def log_error(self, s):
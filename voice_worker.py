@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+#
+# Voice demodulation worker.
+#
+#	The control channel process owns the USRP and decodes the control channel.
+#	Voice demodulation is moved into one or more worker processes so that the
+#	audio_channel chains (and any python work they do) never share a GIL with
+#	the control channel sink.
+#
+#	Samples:	the control channel process writes the wideband stream once
+#			into a shared iq_ring that all workers read.  (Forwarding it
+#			over local UDP, about 40 MB/s per worker, lost samples without
+#			any sign of it.)
+#	Grants:		sent to the worker on its stdin, one per line, in the same
+#			"sysid chan group_id radio_id is_group" form used on the cc msg_queue,
+#			followed by the time of the grant.
+#
+#	The supervisor lives in the control channel process.  It starts the
+#	workers, hands each grant to the worker that owns the channel and
+#	restarts any worker that exits.
+#
+
+import os
+import sys
+import time
+import threading
+import subprocess
+
+from gnuradio import gr, blocks
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+
+from audio_channel import audio_channel
+from iq_ring_blocks import iq_ring_source
+from postprocess import post_processor
+from file_manager import recorder_files
+from call_db import call_db
+from band_plan_800 import get_freq
+
+
+class voice_worker(gr.top_block):
+
+	def __init__(self, options):
+		gr.top_block.__init__(self, "SmartZone Voice Worker %d" % (options.index,))
+
+		self._save_dir = options.save_dir
+		self._center_freq = options.center
+		self._bandwidth = options.bandwidth
+		self._pretrigger = options.pretrigger
+		self._iq_export = options.iq_export
+		self._gated = options.gated
+		self._hang_time = options.hang_time
+
+		self._files = recorder_files(self._save_dir)
+
+		# the control channel process writes grants; we add the recordings
+		self._db = None
+		if options.db is not None:
+			self._db = call_db(options.db)
+
+		self._post = None
+		if options.post is not None:
+			self._post = post_processor(options.post, options.post_threads, done = self.recording_done)
+
+		#
+		# Same layout as smartzone._audio_channels:
+		#	'group_id':	the group id being broadcasted to on this channel
+		#	'radio_ids':	talker_timeline of the radio ids (talkers) with timestamp
+		#	'audio_block':	the audio processing block
+		#	'source':	the block feeding audio_block
+		#
+		self._audio_channels = dict()
+
+		self._src = iq_ring_source(options.ring)
+
+		# a flow graph needs at least one connection before it can be started
+		self._null = blocks.null_sink(gr.sizeof_gr_complex)
+		self.connect(self._src, self._null)
+
+
+	def audio_source(self, grant_time):
+		if self._pretrigger <= 0:
+			return self._src
+		ring = self._src.ring
+		return iq_ring_source(ring.path(), start = ring.index_at(grant_time - self._pretrigger))
+
+
+	def audio_channel_closed(self, ac):
+		"""
+		Finish a call that is no longer in the flow graph.
+		"""
+
+		ac.close()
+		for r in ac.recordings():
+			if self._post is not None:
+				self._post.submit(r, ac, ac.segment_index())
+			else:
+				self.recording_done(r, ac)
+
+
+	def recording_done(self, path, ac):
+		if self._db is not None:
+			self._db('recording', {'time': ac.start_time(), 'sys_id': ac.sys_id, 'chan': ac.chan, 'group_id': ac.group_id, 'is_group': ac.is_group, 'path': path})
+
+
+	def audio_channel_add(self, args, grant_time):
+
+		(sys_id, chan, group_id, radio_id, is_group) = args
+
+		ab_to_remove = None
+		src_to_remove = None
+		if chan in self._audio_channels:
+			c = self._audio_channels[chan]
+			if c['group_id'] == group_id:
+				c['audio_block'].talker(radio_id, time.time())
+				return
+
+			# group changed; that session must be over
+			ab_to_remove = c['audio_block']
+			src_to_remove = c['source']
+			del self._audio_channels[chan]
+
+		start_time = (grant_time - self._pretrigger) if self._pretrigger > 0 else None
+		ac = audio_channel(self._bandwidth, get_freq(chan) * 1e6 - self._center_freq, sys_id, chan, group_id, self._save_dir, is_group = is_group, start_time = start_time, iq_export = self._iq_export, gated = self._gated, hang_time = self._hang_time, files = self._files)
+		src = self.audio_source(grant_time)
+
+		# XXX bug: python block requires stop (the ring reader is a python
+		# block)
+		self.stop()
+		self.wait()
+		self.lock()
+		if ab_to_remove is not None:
+			self.disconnect(src_to_remove, ab_to_remove)
+		self.connect(src, ac)
+		self.unlock()
+		self.start()
+
+		if ab_to_remove is not None:
+			if src_to_remove is not self._src:
+				src_to_remove.close()
+			self.audio_channel_closed(ab_to_remove)
+
+		ac.talker(radio_id, time.time())
+		self._audio_channels[chan] = {'group_id': group_id, 'radio_ids': ac.talkers, 'audio_block': ac, 'source': src}
+
+
+	def close(self):
+		if self._ring is not None:
+			self._src.close()
+		self._files.close()
+		if self._post is not None:
+			self._post.close()
+		if self._db is not None:
+			self._db.close()
+
+
+	def grant_receiver(self, f):
+		for l in iter(f.readline, ''):
+			r = l.split()
+			if len(r) != 6:
+				continue
+			try:
+				args = map(int, r[:5])
+				grant_time = float(r[5])
+			except ValueError:
+				continue
+			self.audio_channel_add(args, grant_time)
+
+
+class worker_supervisor:
+	"""
+	Start, feed and restart the voice worker processes.
+	"""
+
+	_POLL_INTERVAL = 1.0
+
+	def __init__(self, n, center_freq, bandwidth, save_dir, logger = None, ring = None, pretrigger = 0.0, iq_export = None, gated = False, hang_time = 1.0, post = None, post_threads = 2, db = None):
+		self._n = n
+		self._ring = ring
+		self._pretrigger = pretrigger
+		self._iq_export = iq_export
+		self._gated = gated
+		self._hang_time = hang_time
+		self._post = post
+		self._post_threads = post_threads
+		self._db = db
+		self._center_freq = center_freq
+		self._bandwidth = bandwidth
+		self._save_dir = save_dir
+		self._logger = logger
+
+		self._workers = [None,] * n
+		self._restarts = [0,] * n
+		self._lock = threading.Lock()
+		self._running = True
+
+		for i in range(n):
+			self._start(i)
+
+		self._monitor = threading.Thread(target = self.monitor)
+		self._monitor.daemon = True
+		self._monitor.start()
+
+
+	def _log(self, s):
+		if self._logger is not None:
+			self._logger.log_notice(s)
+
+
+	def _start(self, i):
+		cmd = [sys.executable, os.path.abspath(__file__),
+			"--index", "%d" % (i,),
+			"--center", "%f" % (self._center_freq,),
+			"--bandwidth", "%f" % (self._bandwidth,),
+			"--save-dir", self._save_dir,
+			"--ring", self._ring,
+			"--pretrigger", "%f" % (self._pretrigger,)]
+		if self._iq_export is not None:
+			cmd += ["--iq-export", self._iq_export]
+		if self._gated:
+			cmd += ["--gated", "--hang-time", "%f" % (self._hang_time,)]
+		if self._post is not None:
+			cmd += ["--post", self._post, "--post-threads", "%d" % (self._post_threads,)]
+		if self._db is not None:
+			cmd += ["--db", self._db]
+		self._workers[i] = subprocess.Popen(cmd, stdin = subprocess.PIPE, close_fds = True)
+
+
+	def worker_for(self, chan):
+		"""
+		A channel always maps to the same worker so that a worker sees every
+		grant for the sessions it is recording.
+		"""
+		return chan % self._n
+
+
+	def dispatch(self, args, grant_time):
+		(sys_id, chan, group_id, radio_id, is_group) = args
+		i = self.worker_for(chan)
+		self._lock.acquire()
+		try:
+			w = self._workers[i]
+			w.stdin.write("%d %d %d %d %d %f\n" % (sys_id, chan, group_id, radio_id, is_group, grant_time))
+			w.stdin.flush()
+		except (IOError, OSError):
+			# the monitor will restart it; this grant is lost
+			self._log("voice worker %d: grant for chan %d dropped" % (i, chan))
+		self._lock.release()
+
+
+	def monitor(self):
+		while self._running:
+			time.sleep(self._POLL_INTERVAL)
+			self._lock.acquire()
+			for i in range(self._n):
+				w = self._workers[i]
+				if w.poll() is None:
+					continue
+				self._restarts[i] += 1
+				self._log("voice worker %d exited (%d); restart %d" % (i, w.returncode, self._restarts[i]))
+				self._start(i)
+			self._lock.release()
+
+
+	def stop(self):
+		self._running = False
+		self._lock.acquire()
+		for w in self._workers:
+			if w is not None and w.poll() is None:
+				w.stdin.close()
+				w.terminate()
+		self._lock.release()
+
+
+def main():
+
+	parser = OptionParser(option_class = eng_option, usage = "%prog: [options]")
+	parser.add_option("-i", "--index", type = "int", default = 0, help = "Worker index.")
+	parser.add_option("-c", "--center", type = "float", default = 867e6, help = "Center frequency of the wideband stream in Hz.")
+	parser.add_option("-b", "--bandwidth", type = "float", default = 5e6, help = "Sample rate of the wideband stream in Hz.")
+	parser.add_option("-r", "--ring", type = "string", default = None, help = "Read the wideband samples from this shared iq ring (required).")
+	parser.add_option("-P", "--pretrigger", type = "float", default = 0.0, help = "Seconds before each grant to demodulate from the iq ring.")
+	parser.add_option("-I", "--iq-export", type = "choice", choices = ["int16", "int8"], default = None, help = "Also save each call's channelized iq quantized to int16 or int8.")
+	parser.add_option("-G", "--gated", action = "store_true", default = False, help = "Only write audio while someone is talking; one file per transmission.")
+	parser.add_option("", "--hang-time", type = "float", default = 1.0, help = "Seconds of silence that end a transmission when --gated.")
+	parser.add_option("", "--post", type = "choice", choices = ["pcm", "ulaw", "flac", "opus"], default = None, help = "Trim, normalize and encode finished recordings.")
+	parser.add_option("", "--post-threads", type = "int", default = 2, help = "Threads used for --post.")
+	parser.add_option("-d", "--db", type = "string", default = None, help = "Add recordings to this call database.")
+	parser.add_option("-s", "--save-dir", type = "string", default = "./zonelog", help = "Directory to record audio into.")
+	(options, args) = parser.parse_args()
+	if options.ring is None:
+		parser.error("--ring is required")
+
+	vw = voice_worker(options)
+	vw.start()
+
+	# grants arrive on stdin; when the supervisor goes away, so do we
+	vw.grant_receiver(sys.stdin)
+
+	vw.stop()
+	vw.wait()
+	vw.close()
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
+
+
+# vim:ts=8:nowrap